@@ -0,0 +1,113 @@
+import asyncio
+import secrets
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .database import get_redis
+
+# Delete the lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight task"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func once per key; concurrent callers wait for and share its result"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shielded so a disconnecting caller does not cancel the work for the others
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+class _Broadcast:
+    def __init__(self):
+        self.events: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+class StreamFlight:
+    """Coalesce concurrent streams for the same key into one producer whose events every caller receives"""
+
+    def __init__(self):
+        self._streams: Dict[str, _Broadcast] = {}
+
+    async def do(self, key: str, func: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Iterate func's events, joining the in-flight producer for key if there is one"""
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            # A task of its own, so a disconnecting caller does not stop the stream for the others
+            broadcast.task = asyncio.create_task(self._produce(key, broadcast, func))
+
+        # Late joiners replay what was already produced, then follow live
+        position = 0
+        while True:
+            async with broadcast.changed:
+                await broadcast.changed.wait_for(lambda: position < len(broadcast.events) or broadcast.done)
+            while position < len(broadcast.events):
+                yield broadcast.events[position]
+                position += 1
+            if broadcast.done and position == len(broadcast.events):
+                if broadcast.error is not None:
+                    raise broadcast.error
+                return
+
+    async def _produce(self, key: str, broadcast: _Broadcast, func: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for event in func():
+                async with broadcast.changed:
+                    broadcast.events.append(event)
+                    broadcast.changed.notify_all()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            self._streams.pop(key, None)
+            async with broadcast.changed:
+                broadcast.done = True
+                broadcast.changed.notify_all()
+
+    def in_flight(self) -> int:
+        return len(self._streams)
+
+class RedisLock:
+    """Best-effort cross-worker lock on a Redis key"""
+
+    def __init__(self, key: str, ttl_seconds: int):
+        self.key = key
+        self.ttl_seconds = ttl_seconds
+        self.token: Optional[str] = None
+
+    async def acquire(self) -> bool:
+        """Try once to take the lock; always succeeds when Redis is unavailable"""
+        redis_client = get_redis()
+        if not redis_client:
+            return True
+        token = secrets.token_hex(16)
+        if await redis_client.set(self.key, token, nx=True, ex=self.ttl_seconds):
+            self.token = token
+            return True
+        return False
+
+    async def release(self):
+        redis_client = get_redis()
+        if not redis_client or self.token is None:
+            return
+        try:
+            await redis_client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+        finally:
+            self.token = None
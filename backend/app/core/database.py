@@ -49,8 +49,56 @@ async def connect_to_redis():
         print(f"❌ Failed to connect to Redis: {e}")
         redis_cache.client = None
 
+async def close_redis_connection():
+    """Close Redis connection"""
+    if redis_cache.client:
+        await redis_cache.client.aclose()
+        redis_cache.client = None
+        print("✅ Disconnected from Redis")
+
 def get_database():
     return database.database
 
 def get_redis():
-    return redis_cache.client
\ No newline at end of file
+    return redis_cache.client
+
+def routine_cache_key(user_id: str, day: str) -> str:
+    """Redis key of a user's cached daily routine"""
+    return f"routine:{user_id}:{day}"
+
+def routine_version_key(user_id: str, day: str) -> str:
+    """Redis key counting invalidations of a user's cached daily routine"""
+    return f"routine_version:{user_id}:{day}"
+
+# Outlives any cached routine, so a write guarded by a version never sees it reset
+ROUTINE_VERSION_TTL_SECONDS = 2 * 24 * 3600
+
+_INVALIDATE_ROUTINE_SCRIPT = """
+redis.call("incr", KEYS[2])
+redis.call("expire", KEYS[2], ARGV[1])
+return redis.call("del", KEYS[1])
+"""
+
+_CACHE_ROUTINE_SCRIPT = """
+if (redis.call("get", KEYS[2]) or "0") ~= ARGV[1] then
+    return 0
+end
+redis.call("set", KEYS[1], ARGV[3], "EX", ARGV[2])
+return 1
+"""
+
+async def cache_routine_if_current(redis_client, user_id: str, day: str, version: str, payload: str, ttl: int) -> bool:
+    """Cache a routine read at version, unless it was invalidated since"""
+    return bool(await redis_client.eval(
+        _CACHE_ROUTINE_SCRIPT, 2,
+        routine_cache_key(user_id, day), routine_version_key(user_id, day),
+        version, ttl, payload
+    ))
+
+async def invalidate_routine_cache(redis_client, user_id: str, day: str):
+    """Drop a cached routine, and any copy of it read before now"""
+    await redis_client.eval(
+        _INVALIDATE_ROUTINE_SCRIPT, 2,
+        routine_cache_key(user_id, day), routine_version_key(user_id, day),
+        ROUTINE_VERSION_TTL_SECONDS
+    )
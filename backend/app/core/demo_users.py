@@ -0,0 +1,102 @@
+import hashlib
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from .database import get_database
+from .user_cache import user_cache
+from ..models.user import UserInDB, user_search_terms
+
+# Demo accounts used by the marketing site, keyed by email
+DEMO_ACCOUNTS = {
+    "demo@chizen.com": {"username": "demo_user", "is_admin": False},
+    "demo@gmail.com": {"username": "demo_google", "is_admin": False},
+    "admin@chizen.com": {"username": "demo_admin", "is_admin": True},
+}
+
+# email -> _id of the provisioned document
+_demo_user_ids: Dict[str, str] = {}
+
+def demo_email_for_token(token: str) -> str:
+    """Map a demo token to the demo account it signs in as"""
+    if token == 'demo-token' or token.startswith('demo-user-'):
+        return "demo@chizen.com"
+    elif token == 'demo-google-token':
+        return "demo@gmail.com"
+    elif 'admin' in token:
+        return "admin@chizen.com"
+    return "demo@chizen.com"
+
+def demo_user_id(email: str) -> str:
+    """Stable demo user id, identical across processes"""
+    return f"demo-{hashlib.sha256(email.encode()).hexdigest()[:16]}"
+
+def _demo_user_document(email: str) -> Dict:
+    account = DEMO_ACCOUNTS[email]
+    return {
+        "_id": demo_user_id(email),
+        "email": email,
+        "username": account["username"],
+        "hashed_password": "",  # Demo users don't need passwords
+        "fitness_level": "beginner",
+        "preferences": {
+            "duration": 15,
+            "focus_areas": ["flexibility", "mindfulness"],
+            "language": "en"
+        },
+        "streak_data": {
+            "current": 3,
+            "longest": 7,
+            "last_completed": None
+        },
+        "total_xp": 150,
+        "is_admin": account["is_admin"],
+        "search_terms": user_search_terms(account["username"], email),
+        "created_at": datetime.utcnow(),
+        "last_active": datetime.utcnow()
+    }
+
+async def _provision_demo_user(db, email: str) -> UserInDB:
+    """Idempotently create a demo user and cache it like any other user"""
+    try:
+        await db.users.update_one(
+            {"email": email},
+            {"$setOnInsert": _demo_user_document(email)},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another worker won the upsert race; its document is just as good
+        pass
+
+    # Earlier deployments may have created the document under another _id
+    user = UserInDB.model_validate(await db.users.find_one({"email": email}))
+    _demo_user_ids[email] = user.id
+    user_cache.set_user(user)
+    return user
+
+async def provision_demo_users():
+    """Create every demo user at startup so demo requests are served from the user cache"""
+    db = get_database()
+    try:
+        for email in DEMO_ACCOUNTS:
+            await _provision_demo_user(db, email)
+        print(f"✅ Provisioned {len(DEMO_ACCOUNTS)} demo users")
+    except Exception as e:
+        print(f"❌ Failed to provision demo users: {e}")
+
+async def get_demo_user(token: str) -> UserInDB:
+    """Return the cached demo user for a token, reloading it once the entry expires"""
+    email = demo_email_for_token(token)
+    user_id: Optional[str] = _demo_user_ids.get(email)
+    if user_id is not None:
+        user = user_cache.get_user(user_id)
+        if user is not None:
+            return user
+        # Expired or invalidated: another worker may have written XP or streaks since
+        user_data = await get_database().users.find_one({"_id": user_id})
+        if user_data is not None:
+            user = UserInDB.model_validate(user_data)
+            user_cache.set_user(user)
+            return user
+    return await _provision_demo_user(get_database(), email)
@@ -1,40 +1,62 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from .security import verify_token
+from .security import decode_access_token
 from .database import get_database
-from ..models.user import UserInDB
-from typing import Optional
-from datetime import datetime
+from .user_cache import user_cache, REVOKED_FLOOR
+from .demo_users import get_demo_user
+from ..models.user import UserInDB, Principal
+from typing import Optional, Tuple
 
 security = HTTPBearer(auto_error=False)
 
-async def get_current_user(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
-) -> UserInDB:
-    """Get current authenticated user with demo mode support"""
+def _credentials_token(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="No authentication provided",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return credentials.credentials
+
+async def _resolve_token(token: str) -> Tuple[str, Optional[Principal]]:
+    """Verify a JWT, skipping signature checks for recently verified ones"""
+    cached = user_cache.get_token(token)
+    if cached is not None:
+        return cached
     
-    token = credentials.credentials
-    
-    # Handle demo mode tokens
-    if token.startswith('demo-'):
-        return await _handle_demo_user(token)
-    
-    # Handle real JWT tokens
-    user_id = verify_token(token)
+    payload = decode_access_token(token)
     
-    if user_id is None:
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    user_id = payload["sub"]
+    # Later changes arrive over pub/sub; earlier ones are read once per verified token
+    await user_cache.refresh_claims_floor(user_id)
+    principal = Principal.from_claims(payload)
+    user_cache.set_token(token, user_id, payload.get("exp"), principal)
+    return user_id, principal
+
+def _claims_floor(user_id: str) -> int:
+    """Claims floor for the user, rejecting tokens of a revoked user"""
+    floor = user_cache.claims_floor(user_id)
+    if floor == REVOKED_FLOOR:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return floor
+
+async def _load_user(user_id: str, floor: int = 0) -> UserInDB:
+    cached_user = user_cache.get_user(user_id)
+    # A copy cached before another worker's update is older than the floor
+    if cached_user is not None and cached_user.preferences_version >= floor:
+        return cached_user
+    
     db = get_database()
     user_data = await db.users.find_one({"_id": user_id})
     
@@ -45,65 +67,45 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return UserInDB(**user_data)
+    user = UserInDB.model_validate(user_data)
+    user_cache.set_user(user)
+    return user
 
-async def _handle_demo_user(token: str) -> UserInDB:
-    """Handle demo mode authentication"""
-    db = get_database()
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> UserInDB:
+    """Get current authenticated user with demo mode support"""
+    token = _credentials_token(credentials)
     
-    # Extract demo user info from token
-    if token == 'demo-token' or token.startswith('demo-user-'):
-        demo_email = "demo@chizen.com"
-        demo_username = "demo_user"
-        is_admin = False
-    elif token == 'demo-google-token':
-        demo_email = "demo@gmail.com"
-        demo_username = "demo_google"
-        is_admin = False
-    elif 'admin' in token:
-        demo_email = "admin@chizen.com"
-        demo_username = "demo_admin"
-        is_admin = True
-    else:
-        demo_email = "demo@chizen.com"
-        demo_username = "demo_user"
-        is_admin = False
+    # Handle demo mode tokens
+    if token.startswith('demo-'):
+        return await get_demo_user(token)
     
-    # Create or get demo user
-    user_data = await db.users.find_one({"email": demo_email})
+    # Handle real JWT tokens
+    user_id, _ = await _resolve_token(token)
+    return await _load_user(user_id, _claims_floor(user_id))
+
+async def get_current_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+) -> Principal:
+    """Get current identity from token claims alone, without loading the profile"""
+    token = _credentials_token(credentials)
     
-    if not user_data:
-        # Create demo user
-        from ..models.user import UserCreate
-        demo_user_data = {
-            "_id": f"demo-{hash(demo_email)}",
-            "email": demo_email,
-            "username": demo_username,
-            "hashed_password": "",  # Demo users don't need passwords
-            "fitness_level": "beginner",
-            "preferences": {
-                "duration": 15,
-                "focus_areas": ["flexibility", "mindfulness"],
-                "language": "en"
-            },
-            "streak_data": {
-                "current": 3,
-                "longest": 7,
-                "last_completed": None
-            },
-            "total_xp": 150,
-            "is_admin": is_admin,
-            "created_at": datetime.utcnow(),
-            "last_active": datetime.utcnow()
-        }
-        await db.users.insert_one(demo_user_data)
-        user_data = demo_user_data
+    if token.startswith('demo-'):
+        return Principal.from_user(await get_demo_user(token))
     
-    return UserInDB(**user_data)
+    user_id, principal = await _resolve_token(token)
+    floor = _claims_floor(user_id)
+    
+    # Tokens without claims, or minted before a preferences bump, need a full reload
+    if principal is None or principal.preferences_version < floor:
+        return Principal.from_user(await _load_user(user_id, floor))
+    
+    return principal
 
 async def get_current_admin_user(
-    current_user: UserInDB = Depends(get_current_user)
-) -> UserInDB:
+    current_user: Principal = Depends(get_current_principal)
+) -> Principal:
     """Get current user and verify admin privileges"""
     if not current_user.is_admin:
         raise HTTPException(
@@ -1,15 +1,70 @@
 """
 Database initialization script for ChiZen Fitness
-Creates indexes and default data for optimal performance
+Creates indexes and default data for optimal performance, and runs the data
+migrations (routine days, search terms, activity rollups, achievements).
+
+Run as a module from backend/, since it imports the app package:
+    python -m app.core.init_db
 """
 import asyncio
 import motor.motor_asyncio
 import os
 from datetime import datetime
 from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from ..models.user import user_search_terms
+from ..services.activity import migrate_activity_rollups
+from ..services.achievements import migrate_achievements
+from ..services.leaderboard import LEADERBOARD_SORT
 
 load_dotenv()
 
+async def migrate_routine_days(db) -> int:
+    """Backfill the day field on routines stored before it existed"""
+    # One routine per user and UTC day keeps the day, preferring a completed one
+    pipeline = [
+        {"$match": {"day": {"$exists": False}, "user_id": {"$exists": True}}},
+        {"$sort": {"completed_at": -1, "created_at": 1}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+            },
+            "routine_id": {"$first": "$_id"}
+        }}
+    ]
+    
+    migrated = 0
+    async for group in db.routines.aggregate(pipeline):
+        user_id = group["_id"]["user_id"]
+        day = group["_id"]["day"]
+        if day is None or await db.routines.find_one({"user_id": user_id, "day": day}, {"_id": 1}):
+            continue
+        await db.routines.update_one({"_id": group["routine_id"]}, {"$set": {"day": day}})
+        migrated += 1
+    
+    return migrated
+
+async def migrate_user_search_terms(db) -> int:
+    """Backfill search_terms on users stored before admin search was indexed"""
+    migrated = 0
+    operations = []
+    async for user in db.users.find({"search_terms": {"$exists": False}}, {"username": 1, "email": 1}):
+        operations.append(UpdateOne(
+            {"_id": user["_id"]},
+            {"$set": {"search_terms": user_search_terms(user.get("username", ""), user.get("email", ""))}}
+        ))
+        if len(operations) == 1000:
+            await db.users.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+            operations = []
+    
+    if operations:
+        await db.users.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+    return migrated
+
 async def init_database():
     """Initialize database with indexes and sample data"""
     
@@ -32,19 +87,50 @@ async def init_database():
         # Users collection indexes
         await db.users.create_index("email", unique=True)
         await db.users.create_index("created_at")
+        # Keyset pagination order for the admin user list
+        await db.users.create_index([("created_at", -1), ("_id", -1)])
+        await db.users.create_index([("fitness_level", 1), ("created_at", -1), ("_id", -1)])
         await db.users.create_index("is_admin")
         await db.users.create_index("is_active")
-        await db.users.create_index([
-            ("streak_data.current", -1),
-            ("total_xp", -1)
-        ], name="leaderboard_index")
+        await db.users.create_index("last_active")
+        migrated = await migrate_user_search_terms(db)
+        print(f"✅ Backfilled search terms on {migrated} users")
+        await db.users.create_index("search_terms", name="search_terms_1")
+        # The leaderboard sorts by XP alone; the old index led with the streak and could not serve it
+        existing_index = (await db.users.index_information()).get("leaderboard_index")
+        if existing_index and existing_index["key"] != LEADERBOARD_SORT:
+            await db.users.drop_index("leaderboard_index")
+        await db.users.create_index(LEADERBOARD_SORT, name="leaderboard_index")
         
         # Routines collection indexes
-        await db.routines.create_index([("user_id", 1), ("created_at", -1)])
+        migrated = await migrate_routine_days(db)
+        print(f"✅ Backfilled day on {migrated} routines")
+        await db.routines.create_index(
+            [("user_id", 1), ("day", 1)],
+            unique=True,
+            partialFilterExpression={"day": {"$type": "string"}},
+            name="user_day_unique"
+        )
+        # Keyset pagination order for /history and the admin routine list
+        await db.routines.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+        await db.routines.create_index([("created_at", -1), ("_id", -1)])
         await db.routines.create_index("routine_id", unique=True)
         await db.routines.create_index("completed_at")
         await db.routines.create_index("created_at")
         
+        # Activity rollups are keyed by user id, so they need no extra index
+        migrated = await migrate_activity_rollups(db)
+        print(f"✅ Built activity rollups for {migrated} users")
+        
+        # Achievement unlocks are listed per user
+        await db.user_achievements.create_index("user_id")
+        migrated = await migrate_achievements(db)
+        print(f"✅ Recorded {migrated} achievements already earned")
+        
+        # Audio jobs: claimed oldest first, capped per user
+        await db.audio_jobs.create_index([("status", 1), ("created_at", 1)])
+        await db.audio_jobs.create_index([("user_id", 1), ("status", 1)])
+        
         # Newsletter collection indexes
         await db.newsletter_subscriptions.create_index("email", unique=True)
         await db.newsletter_subscriptions.create_index("subscribed_at")
@@ -75,6 +161,7 @@ async def init_database():
                 "total_xp": 0,
                 "is_admin": True,
                 "is_active": True,
+                "search_terms": user_search_terms("ChiZen Admin", admin_email),
                 "created_at": datetime.utcnow(),
                 "oauth_provider": None
             }
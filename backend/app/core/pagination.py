@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from .database import get_redis
+
+# Newest first, with _id breaking ties between equal created_at values
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+
+# Paged listings return {<items key>: [...], "pagination": {limit, next_cursor, has_more}}
+# (admin adds total). /history used to return a bare list and admin listings took page;
+# both are breaking changes for API clients, so src/lib/api.ts sends cursor instead
+
+COUNT_CACHE_TTL_SECONDS = 60
+
+def encode_cursor(document: Dict) -> str:
+    """Opaque token pointing just past a document in (created_at, _id) order"""
+    payload = json.dumps([document["created_at"].isoformat(), document["_id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, document_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), document_id
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_query(query: Dict, cursor: Optional[str]) -> Dict:
+    """Restrict a query to documents after the cursor"""
+    if not cursor:
+        return query
+    created_at, document_id = decode_cursor(cursor)
+    after_cursor = {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": document_id}}
+    ]}
+    return {"$and": [query, after_cursor]} if query else after_cursor
+
+async def fetch_page(collection, query: Dict, cursor: Optional[str], limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """Fetch one page in keyset order and the cursor for the next one"""
+    documents = await collection.find(keyset_query(query, cursor)).sort(KEYSET_SORT).limit(limit + 1).to_list(length=limit + 1)
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    return documents, encode_cursor(documents[-1])
+
+async def approximate_count(collection, query: Dict) -> int:
+    """Collection metadata count when unfiltered, otherwise an exact count cached briefly"""
+    if not query:
+        return await collection.estimated_document_count()
+
+    redis_client = get_redis()
+    cache_key = None
+    if redis_client:
+        query_hash = hashlib.sha256(json.dumps(query, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        cache_key = f"count:{collection.name}:{query_hash}"
+        cached_count = await redis_client.get(cache_key)
+        if cached_count is not None:
+            return int(cached_count)
+
+    total_count = await collection.count_documents(query)
+    if cache_key:
+        await redis_client.setex(cache_key, COUNT_CACHE_TTL_SECONDS, total_count)
+    return total_count
@@ -1,4 +1,7 @@
 import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Union, Any
 from passlib.context import CryptContext
@@ -8,32 +11,52 @@ from fastapi import HTTPException, status
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Bcrypt runs in its own bounded pool so it never blocks the event loop
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "32"))
+HASH_RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_in_flight = 0
+# Released from pool threads when a call finishes
+_hash_in_flight_lock = threading.Lock()
+
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
-def create_access_token(subject: Union[str, Any], expires_delta: Optional[timedelta] = None):
-    """Create JWT access token"""
+def create_access_token(
+    subject: Union[str, Any],
+    expires_delta: Optional[timedelta] = None,
+    claims: Optional[dict] = None
+):
+    """Create JWT access token, optionally carrying extra signed claims"""
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {**(claims or {}), "exp": expire, "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[str]:
-    """Verify JWT token and return subject"""
+def decode_access_token(token: str) -> Optional[dict]:
+    """Verify JWT token and return its payload"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-        return user_id
     except JWTError:
         return None
+    if payload.get("sub") is None:
+        return None
+    return payload
+
+def verify_token(token: str) -> Optional[str]:
+    """Verify JWT token and return subject"""
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    return payload["sub"]
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password against hash"""
@@ -43,6 +66,36 @@ def get_password_hash(password: str) -> str:
     """Hash password"""
     return pwd_context.hash(password)
 
+def _hash_call_done(future):
+    global _hash_in_flight
+    with _hash_in_flight_lock:
+        _hash_in_flight -= 1
+
+async def _run_in_hash_pool(func, *args):
+    """Run a bcrypt call in the hash pool, shedding load once the queue is full"""
+    global _hash_in_flight
+    with _hash_in_flight_lock:
+        if _hash_in_flight >= HASH_WORKERS + HASH_QUEUE_DEPTH:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry shortly",
+                headers={"Retry-After": str(HASH_RETRY_AFTER_SECONDS)},
+            )
+        _hash_in_flight += 1
+    # Counted until the pool is done with the call, even if the caller is cancelled
+    # while bcrypt is still running in its thread
+    future = _hash_executor.submit(func, *args)
+    future.add_done_callback(_hash_call_done)
+    return await asyncio.wrap_future(future)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify password against hash without blocking the event loop"""
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash password without blocking the event loop"""
+    return await _run_in_hash_pool(get_password_hash, password)
+
 def authenticate_user(email: str, password: str, user_data: dict) -> bool:
     """Authenticate user with email and password"""
     if not user_data:
@@ -51,4 +104,12 @@ def authenticate_user(email: str, password: str, user_data: dict) -> bool:
         return False
     if not verify_password(password, user_data["hashed_password"]):
         return False
-    return True
\ No newline at end of file
+    return True
+
+async def authenticate_user_async(email: str, password: str, user_data: dict) -> bool:
+    """Authenticate user with email and password off the event loop"""
+    if not user_data:
+        return False
+    if not user_data.get("hashed_password"):
+        return False
+    return await verify_password_async(password, user_data["hashed_password"])
\ No newline at end of file
@@ -0,0 +1,78 @@
+import hashlib
+import secrets
+from typing import Optional, Tuple
+
+from .database import get_redis
+from .security import REFRESH_TOKEN_EXPIRE_DAYS
+
+class SessionStore:
+    """Rotating refresh tokens kept in Redis with a sliding expiry"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+
+    async def issue(self, user_id: str) -> Optional[str]:
+        """Create a refresh token for the user, or None when Redis is unavailable"""
+        redis_client = get_redis()
+        if not redis_client:
+            return None
+
+        token = secrets.token_urlsafe(48)
+        key = self._session_key(token)
+        user_key = self._user_key(user_id)
+
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.setex(key, self.ttl_seconds, user_id)
+            pipe.sadd(user_key, key)
+            pipe.expire(user_key, self.ttl_seconds)
+            await pipe.execute()
+
+        return token
+
+    async def rotate(self, token: str) -> Optional[Tuple[str, str]]:
+        """Consume a refresh token and return (user_id, new refresh token)"""
+        redis_client = get_redis()
+        if not redis_client:
+            return None
+
+        key = self._session_key(token)
+        # GETDEL is atomic, so a token can only ever be redeemed once
+        user_id = await redis_client.getdel(key)
+        if user_id is None:
+            return None
+        await redis_client.srem(self._user_key(user_id), key)
+
+        new_token = await self.issue(user_id)
+        if new_token is None:
+            return None
+        return user_id, new_token
+
+    async def revoke(self, token: str):
+        """Revoke a single refresh token"""
+        redis_client = get_redis()
+        if not redis_client:
+            return
+
+        key = self._session_key(token)
+        user_id = await redis_client.getdel(key)
+        if user_id is not None:
+            await redis_client.srem(self._user_key(user_id), key)
+
+    async def revoke_user(self, user_id: str):
+        """Revoke every refresh token issued to the user"""
+        redis_client = get_redis()
+        if not redis_client:
+            return
+
+        user_key = self._user_key(user_id)
+        keys = await redis_client.smembers(user_key)
+        await redis_client.delete(user_key, *keys)
+
+    def _session_key(self, token: str) -> str:
+        # Only a digest of the token is stored server-side
+        return f"session:{hashlib.sha256(token.encode()).hexdigest()}"
+
+    def _user_key(self, user_id: str) -> str:
+        return f"user_sessions:{user_id}"
+
+session_store = SessionStore(ttl_seconds=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60)
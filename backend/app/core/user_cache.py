@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import redis.asyncio as redis
+
+from .database import get_redis
+from .security import ACCESS_TOKEN_EXPIRE_MINUTES
+from ..models.user import UserInDB, Principal
+
+# Floors and revocations live in Redis too, so a worker verifying a token sees earlier changes
+CLAIMS_FLOOR_TTL_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+REVOKED_FLOOR = sys.maxsize
+
+# Every worker applies the invalidations published here to its own cache
+INVALIDATION_CHANNEL = "user_cache:invalidate"
+
+# Only ever raises the floor, and restarts its expiry when it does
+_RAISE_FLOOR_SCRIPT = """
+local current = tonumber(redis.call("get", KEYS[1]) or "-1")
+if tonumber(ARGV[1]) > current then
+    redis.call("set", KEYS[1], ARGV[1], "EX", ARGV[2])
+end
+return 0
+"""
+
+class UserCache:
+    """Per-process LRU/TTL cache of verified tokens and hydrated users"""
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 30.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # token -> (user_id, claims principal, expires_at)
+        self._tokens: "OrderedDict[str, Tuple[str, Optional[Principal], float]]" = OrderedDict()
+        # user_id -> (user, expires_at)
+        self._users: "OrderedDict[str, Tuple[UserInDB, float]]" = OrderedDict()
+        # user_id -> (lowest preferences_version a token may carry, expires_at)
+        self._claims_floors: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_token(self, token: str) -> Optional[Tuple[str, Optional[Principal]]]:
+        """Return (user_id, claims principal) of a previously verified token"""
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        user_id, principal, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._tokens[token]
+            return None
+        self._tokens.move_to_end(token)
+        return user_id, principal
+
+    def set_token(
+        self,
+        token: str,
+        user_id: str,
+        token_expires_at: Optional[float] = None,
+        principal: Optional[Principal] = None
+    ):
+        """Remember a verified token, never beyond the token's own expiry"""
+        expires_at = time.monotonic() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, time.monotonic() + token_expires_at - time.time())
+        self._tokens[token] = (user_id, principal, expires_at)
+        self._tokens.move_to_end(token)
+        self._evict(self._tokens)
+
+    def get_user(self, user_id: str) -> Optional[UserInDB]:
+        """Return a cached user and count the hit or miss"""
+        entry = self._users.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._users[user_id]
+            self.misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+
+    def set_user(self, user: UserInDB):
+        """Cache a user loaded from the database"""
+        self._users[user.id] = (user, time.monotonic() + self.ttl_seconds)
+        self._users.move_to_end(user.id)
+        self._evict(self._users)
+        self.raise_claims_floor(user.id, user.preferences_version)
+
+    def raise_claims_floor(self, user_id: str, version: int):
+        """Reject token claims older than version until those tokens have expired"""
+        current = self._claims_floors.get(user_id)
+        if current is not None and current[0] >= version:
+            return
+        # Tokens minted before the bump cannot outlive the access token lifetime
+        expires_at = time.monotonic() + CLAIMS_FLOOR_TTL_SECONDS
+        self._claims_floors[user_id] = (version, expires_at)
+        self._claims_floors.move_to_end(user_id)
+        self._evict(self._claims_floors)
+
+    async def publish_claims_floor(self, user_id: str, version: int):
+        """Raise the floor here and in Redis, so every worker rejects older claims"""
+        self.raise_claims_floor(user_id, version)
+        redis_client = get_redis()
+        if not redis_client:
+            return
+        try:
+            await redis_client.eval(
+                _RAISE_FLOOR_SCRIPT, 1, self._floor_key(user_id), version, CLAIMS_FLOOR_TTL_SECONDS
+            )
+        except redis.RedisError as e:
+            print(f"❌ Failed to publish claims floor for {user_id}: {e}")
+        await self._broadcast(user_id, version)
+
+    async def refresh_claims_floor(self, user_id: str):
+        """Pick up floors and revocations set before this worker started listening"""
+        redis_client = get_redis()
+        if not redis_client:
+            return
+        try:
+            shared_floor, revoked = await redis_client.mget(self._floor_key(user_id), self._revoked_key(user_id))
+        except redis.RedisError as e:
+            print(f"❌ Failed to read claims floor for {user_id}: {e}")
+            return
+        floor = REVOKED_FLOOR if revoked is not None else int(shared_floor or 0)
+        if floor:
+            self.raise_claims_floor(user_id, floor)
+
+    def claims_floor(self, user_id: str) -> int:
+        """Lowest preferences version a token may carry, REVOKED_FLOOR once the user is revoked"""
+        entry = self._claims_floors.get(user_id)
+        if entry is None:
+            return 0
+        floor, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._claims_floors[user_id]
+            return 0
+        return floor
+
+    def invalidate_user(self, user_id: str):
+        """Drop a user from this worker's cache"""
+        self._users.pop(user_id, None)
+
+    async def publish_invalidation(self, user_id: str):
+        """Drop a user after any write to their document, in every worker"""
+        self.invalidate_user(user_id)
+        await self._broadcast(user_id)
+
+    def _revoke(self, user_id: str):
+        self.invalidate_user(user_id)
+        self.raise_claims_floor(user_id, REVOKED_FLOOR)
+        for token in [t for t, (uid, _, _) in self._tokens.items() if uid == user_id]:
+            del self._tokens[token]
+
+    async def revoke_user(self, user_id: str):
+        """Drop a user and every cached token that resolves to them, in every worker"""
+        self._revoke(user_id)
+        redis_client = get_redis()
+        if redis_client:
+            try:
+                # Tokens minted before the revocation cannot outlive the access token lifetime
+                await redis_client.setex(self._revoked_key(user_id), CLAIMS_FLOOR_TTL_SECONDS, "1")
+            except redis.RedisError as e:
+                print(f"❌ Failed to publish revocation for {user_id}: {e}")
+        await self._broadcast(user_id, REVOKED_FLOOR)
+
+    def apply_invalidation(self, message: Dict):
+        """Apply an invalidation broadcast by any worker, this one included"""
+        user_id = message["user_id"]
+        floor = message.get("floor")
+        if floor == REVOKED_FLOOR:
+            self._revoke(user_id)
+            return
+        self.invalidate_user(user_id)
+        if floor:
+            self.raise_claims_floor(user_id, floor)
+
+    async def _broadcast(self, user_id: str, floor: Optional[int] = None):
+        redis_client = get_redis()
+        if not redis_client:
+            return
+        try:
+            await redis_client.publish(INVALIDATION_CHANNEL, json.dumps({"user_id": user_id, "floor": floor}))
+        except redis.RedisError as e:
+            print(f"❌ Failed to broadcast invalidation for {user_id}: {e}")
+
+    def drop_verified(self):
+        """Forget cached users and tokens, keeping claims floors"""
+        self._tokens.clear()
+        self._users.clear()
+
+    def clear(self):
+        self._tokens.clear()
+        self._users.clear()
+        self._claims_floors.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0,
+            "cached_users": len(self._users),
+            "cached_tokens": len(self._tokens),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+    def _floor_key(self, user_id: str) -> str:
+        return f"claims_floor:{user_id}"
+
+    def _revoked_key(self, user_id: str) -> str:
+        return f"revoked_user:{user_id}"
+
+    def _evict(self, entries: OrderedDict):
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+user_cache = UserCache(
+    max_size=int(os.getenv("USER_CACHE_MAX_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+)
+
+_listener: Optional[asyncio.Task] = None
+
+async def _listen_for_invalidations():
+    while True:
+        redis_client = get_redis()
+        if not redis_client:
+            return
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything published while this worker was not subscribed was missed
+            user_cache.drop_verified()
+            async for message in pubsub.listen():
+                try:
+                    user_cache.apply_invalidation(json.loads(message["data"]))
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"❌ Ignoring malformed user cache invalidation: {e}")
+        except redis.RedisError as e:
+            print(f"❌ User cache invalidations interrupted: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+async def start_user_cache_sync():
+    """Subscribe this worker's user cache to invalidations from every worker"""
+    global _listener
+    if not get_redis():
+        print("❌ User cache sync disabled: Redis is not connected")
+        return
+    _listener = asyncio.create_task(_listen_for_invalidations())
+    print("✅ User cache sync ready")
+
+async def stop_user_cache_sync():
+    global _listener
+    if _listener:
+        _listener.cancel()
+        await asyncio.gather(_listener, return_exceptions=True)
+        _listener = None
@@ -1,10 +1,21 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
-from .core.database import connect_to_mongo, close_mongo_connection
+from .core.database import (
+    connect_to_mongo,
+    close_mongo_connection,
+    connect_to_redis,
+    close_redis_connection
+)
+from .core.user_cache import start_user_cache_sync, stop_user_cache_sync
+from .core.demo_users import provision_demo_users
+from .services.ai_service import start_routine_generator, stop_routine_generator
+from .services.voice_service import start_voice_service, stop_voice_service
+from .services.audio_jobs import start_audio_jobs, stop_audio_jobs
 from .routes import auth, routines, admin, newsletter, test, voice, progress, challenges
 
 load_dotenv()
@@ -13,15 +24,27 @@ load_dotenv()
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    await connect_to_redis()
+    await start_user_cache_sync()
+    await provision_demo_users()
+    await start_routine_generator()
+    await start_voice_service()
+    await start_audio_jobs()
     yield
     # Shutdown
+    await stop_audio_jobs()
+    await stop_voice_service()
+    await stop_routine_generator()
+    await stop_user_cache_sync()
+    await close_redis_connection()
     await close_mongo_connection()
 
 app = FastAPI(
     title="ChiZen Fitness API",
     description="AI-powered wellness application backend",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, AliasChoices, TypeAdapter
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -17,13 +17,18 @@ class ExerciseBlock(BaseModel):
     audio_cue: Optional[str] = None
     audio_url: Optional[str] = None
     image_url: Optional[str] = None
+    benefits: List[str] = []
 
 class RoutineBase(BaseModel):
     routine_id: str
+    title: Optional[str] = None
     blocks: List[ExerciseBlock]
     total_duration: int  # minutes
     focus_area: str
     difficulty_level: int = Field(ge=1, le=5)
+    completion_xp: int = 50
+    daily_wisdom: Optional[str] = None
+    generated_by: str = "ai"  # "local" when built by the routine composer
 
 class RoutineCreate(RoutineBase):
     user_id: str
@@ -31,24 +36,28 @@ class RoutineCreate(RoutineBase):
 class RoutineInDB(RoutineBase):
     id: str = Field(alias="_id")
     user_id: str
+    day: Optional[str] = None  # ISO date of a user's daily routine, unique per user
+    template_id: Optional[str] = None  # shared routine pool template it was copied from
     created_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
     feedback_rating: Optional[int] = Field(None, ge=1, le=5)
     feedback_comment: Optional[str] = None
     xp_earned: int = 0
     
-    class Config:
-        allow_population_by_field_name = True
+    model_config = ConfigDict(populate_by_name=True)
 
 class RoutineComplete(BaseModel):
     routine_id: str
-    completed_blocks: int
-    total_blocks: int
+    completed_blocks: int = Field(ge=0)
+    total_blocks: int = Field(gt=0)
     feedback_rating: Optional[int] = Field(None, ge=1, le=5)
     feedback_comment: Optional[str] = None
 
 class RoutineResponse(RoutineBase):
-    id: str
+    id: str = Field(validation_alias=AliasChoices("id", "_id"))
     created_at: datetime
-    completed_at: Optional[datetime]
-    xp_earned: int
\ No newline at end of file
+    completed_at: Optional[datetime] = None
+    xp_earned: int = 0
+
+# Built once; validating and dumping whole lists in one call skips per-item overhead
+routine_response_list = TypeAdapter(List[RoutineResponse])
@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, AliasChoices, TypeAdapter, model_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
+import re
 
 class FitnessLevel(str, Enum):
     beginner = "beginner"
@@ -17,12 +18,28 @@ class UserPreferences(BaseModel):
     duration: int = Field(default=15, ge=5, le=30)  # minutes
     focus_areas: List[str] = Field(default=["strength", "flexibility", "mindfulness"])
     language: Language = Language.english
+    ai_routines: bool = True  # False serves locally composed routines only
 
 class StreakData(BaseModel):
     current: int = 0
     longest: int = 0
     last_completed: Optional[datetime] = None
 
+def user_search_terms(username: str, email: str) -> List[str]:
+    """Lowercase terms the admin user search matches by prefix"""
+    username = username.strip().lower()
+    email = email.strip().lower()
+    local_part, _, domain = email.partition("@")
+    terms = {username, email, local_part, domain}
+    terms.update(re.split(r"[^\w]+", username))
+    terms.update(re.split(r"[^\w]+", local_part))
+    return sorted(term for term in terms if term)
+
+def user_search_query(search: str) -> Dict[str, Any]:
+    """Filter matching every search word as a prefix of some search term"""
+    # Anchored, case-sensitive prefixes on normalized terms use index bounds
+    return {"$and": [{"search_terms": re.compile(f"^{re.escape(word)}")} for word in search.lower().split()]}
+
 class UserBase(BaseModel):
     email: EmailStr
     username: str
@@ -44,17 +61,62 @@ class UserInDB(UserBase):
     total_xp: int = 0
     is_admin: bool = False
     is_active: bool = True
+    preferences_version: int = 0  # bumped whenever token claims go stale
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_active: Optional[datetime] = None
     oauth_provider: Optional[str] = None  # google, apple, etc.
+    search_terms: List[str] = []  # kept in sync with username and email
     
-    class Config:
-        allow_population_by_field_name = True
+    model_config = ConfigDict(populate_by_name=True)
+    
+    @model_validator(mode="after")
+    def _fill_search_terms(self) -> "UserInDB":
+        if not self.search_terms:
+            self.search_terms = user_search_terms(self.username, self.email)
+        return self
 
 class UserResponse(UserBase):
-    id: str
+    id: str = Field(validation_alias=AliasChoices("id", "_id"))
     streak_data: StreakData
     total_xp: int
     is_admin: bool
     created_at: datetime
-    last_active: Optional[datetime]
\ No newline at end of file
+    last_active: Optional[datetime] = None
+
+# Built once; validating and dumping whole lists in one call skips per-item overhead
+user_response_list = TypeAdapter(List[UserResponse])
+
+class Principal(BaseModel):
+    """Authenticated identity built from signed token claims"""
+    id: str
+    is_admin: bool = False
+    fitness_level: FitnessLevel = FitnessLevel.beginner
+    preferences_version: int = 0
+
+    @classmethod
+    def from_user(cls, user: UserInDB) -> "Principal":
+        return cls(
+            id=user.id,
+            is_admin=user.is_admin,
+            fitness_level=user.fitness_level,
+            preferences_version=user.preferences_version
+        )
+
+    @classmethod
+    def from_claims(cls, payload: Dict[str, Any]) -> Optional["Principal"]:
+        """Build a principal from a token payload, or None if it carries no claims"""
+        if "adm" not in payload:
+            return None
+        return cls(
+            id=payload["sub"],
+            is_admin=payload["adm"],
+            fitness_level=payload.get("lvl", FitnessLevel.beginner),
+            preferences_version=payload.get("pv", 0)
+        )
+
+    def to_claims(self) -> Dict[str, Any]:
+        return {
+            "adm": self.is_admin,
+            "lvl": self.fitness_level.value,
+            "pv": self.preferences_version
+        }
\ No newline at end of file
@@ -1,57 +1,56 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
 from typing import Optional, List
 from datetime import datetime, timedelta
 
 from ..core.deps import get_current_admin_user
 from ..core.database import get_database
-from ..models.user import UserInDB, UserResponse, UserUpdate
-from ..models.routine import RoutineResponse
+from ..core.user_cache import user_cache
+from ..core.sessions import session_store
+from ..core.pagination import fetch_page, approximate_count
+from ..services.routine_pool import routine_pool
+from ..services.leaderboard import remove_from_leaderboard
+from ..models.user import Principal, UserResponse, UserUpdate, user_response_list, user_search_terms, user_search_query
+from ..models.routine import routine_response_list
 
 router = APIRouter()
 
 @router.get("/users", response_model=dict)
 async def get_all_users(
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
     search: Optional[str] = None,
     fitness_level: Optional[str] = None,
-    current_admin: UserInDB = Depends(get_current_admin_user)
+    include_total: bool = False,
+    current_admin: Principal = Depends(get_current_admin_user)
 ):
-    """Get all users with pagination and filtering - admin only"""
+    """Get all users with cursor pagination and filtering - admin only"""
     db = get_database()
     
     # Build query filter
     query = {}
-    if search:
-        query["$or"] = [
-            {"username": {"$regex": search, "$options": "i"}},
-            {"email": {"$regex": search, "$options": "i"}}
-        ]
+    if search and search.split():
+        query.update(user_search_query(search))
     if fitness_level:
         query["fitness_level"] = fitness_level
     
-    # Get total count
-    total_count = await db.users.count_documents(query)
+    users, next_cursor = await fetch_page(db.users, query, cursor, limit)
     
-    # Get paginated users
-    skip = (page - 1) * limit
-    cursor = db.users.find(query).sort("created_at", -1).skip(skip).limit(limit)
-    users = await cursor.to_list(length=limit)
-    
-    return {
-        "users": [UserResponse(**user) for user in users],
+    return ORJSONResponse({
+        "users": user_response_list.dump_python(user_response_list.validate_python(users), mode="json"),
         "pagination": {
-            "page": page,
             "limit": limit,
-            "total": total_count,
-            "pages": (total_count + limit - 1) // limit
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            # Approximate, and only computed on request
+            "total": await approximate_count(db.users, query) if include_total else None
         }
-    }
+    })
 
 @router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user_details(
     user_id: str,
-    current_admin: UserInDB = Depends(get_current_admin_user)
+    current_admin: Principal = Depends(get_current_admin_user)
 ):
     """Get detailed user information - admin only"""
     db = get_database()
@@ -63,13 +62,13 @@ async def get_user_details(
             detail="User not found"
         )
     
-    return UserResponse(**user)
+    return UserResponse.model_validate(user)
 
 @router.put("/users/{user_id}", response_model=UserResponse)
 async def update_user(
     user_id: str,
     user_update: UserUpdate,
-    current_admin: UserInDB = Depends(get_current_admin_user)
+    current_admin: Principal = Depends(get_current_admin_user)
 ):
     """Update user information - admin only"""
     db = get_database()
@@ -83,21 +82,28 @@ async def update_user(
         )
     
     # Update user
-    update_data = user_update.dict(exclude_unset=True)
+    update_data = user_update.model_dump(exclude_unset=True)
+    if "username" in update_data:
+        update_data["search_terms"] = user_search_terms(update_data["username"], existing_user["email"])
     if update_data:
-        await db.users.update_one(
-            {"_id": user_id},
-            {"$set": update_data}
-        )
+        update_ops = {"$set": update_data}
+        # Token claims carry fitness level and preferences version, so bump it
+        claims_changed = "fitness_level" in update_data or "preferences" in update_data
+        if claims_changed:
+            update_ops["$inc"] = {"preferences_version": 1}
+        await db.users.update_one({"_id": user_id}, update_ops)
+        await user_cache.publish_invalidation(user_id)
+        if claims_changed:
+            await user_cache.publish_claims_floor(user_id, existing_user.get("preferences_version", 0) + 1)
     
     # Return updated user
     updated_user = await db.users.find_one({"_id": user_id})
-    return UserResponse(**updated_user)
+    return UserResponse.model_validate(updated_user)
 
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: str,
-    current_admin: UserInDB = Depends(get_current_admin_user)
+    current_admin: Principal = Depends(get_current_admin_user)
 ):
     """Delete user - admin only"""
     db = get_database()
@@ -120,11 +126,14 @@ async def delete_user(
     # Delete user and associated data
     await db.users.delete_one({"_id": user_id})
     await db.routines.delete_many({"user_id": user_id})
+    await remove_from_leaderboard(user_id)
+    await user_cache.revoke_user(user_id)
+    await session_store.revoke_user(user_id)
     
     return {"message": "User deleted successfully"}
 
 @router.get("/analytics", response_model=dict)
-async def get_analytics(current_admin: UserInDB = Depends(get_current_admin_user)):
+async def get_analytics(current_admin: Principal = Depends(get_current_admin_user)):
     """Get platform analytics - admin only"""
     db = get_database()
     
@@ -187,13 +196,14 @@ async def get_analytics(current_admin: UserInDB = Depends(get_current_admin_user
 
 @router.get("/routines", response_model=dict)
 async def get_all_routines(
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
     user_id: Optional[str] = None,
     completed_only: bool = False,
-    current_admin: UserInDB = Depends(get_current_admin_user)
+    include_total: bool = False,
+    current_admin: Principal = Depends(get_current_admin_user)
 ):
-    """Get all routines with filtering - admin only"""
+    """Get all routines with cursor pagination and filtering - admin only"""
     db = get_database()
     
     # Build query
@@ -203,28 +213,31 @@ async def get_all_routines(
     if completed_only:
         query["completed_at"] = {"$ne": None}
     
-    # Get total count
-    total_count = await db.routines.count_documents(query)
+    routines, next_cursor = await fetch_page(db.routines, query, cursor, limit)
     
-    # Get paginated routines
-    skip = (page - 1) * limit
-    cursor = db.routines.find(query).sort("created_at", -1).skip(skip).limit(limit)
-    routines = await cursor.to_list(length=limit)
-    
-    return {
-        "routines": [RoutineResponse(**routine) for routine in routines],
+    return ORJSONResponse({
+        "routines": routine_response_list.dump_python(routine_response_list.validate_python(routines), mode="json"),
         "pagination": {
-            "page": page,
             "limit": limit,
-            "total": total_count,
-            "pages": (total_count + limit - 1) // limit
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            # Approximate, and only computed on request
+            "total": await approximate_count(db.routines, query) if include_total else None
         }
+    })
+
+@router.get("/cache/stats", response_model=dict)
+async def get_cache_stats(current_admin: Principal = Depends(get_current_admin_user)):
+    """Get user cache and routine pool hit/miss counters - admin only"""
+    return {
+        "user_cache": user_cache.stats(),
+        "routine_pool": routine_pool.stats()
     }
 
 @router.post("/broadcast")
 async def broadcast_notification(
     message: dict,
-    current_admin: UserInDB = Depends(get_current_admin_user)
+    current_admin: Principal = Depends(get_current_admin_user)
 ):
     """Broadcast notification to all users - admin only"""
     # In a real implementation, this would integrate with push notification service
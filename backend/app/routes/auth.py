@@ -1,20 +1,47 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
+from pydantic import BaseModel
 from datetime import timedelta
 import uuid
 
 from ..core.database import get_database
 from ..core.security import (
-    authenticate_user, 
+    authenticate_user_async,
     create_access_token, 
-    get_password_hash,
+    get_password_hash_async,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from ..models.user import UserCreate, UserInDB, UserResponse
+from ..models.user import UserCreate, UserInDB, UserResponse, Principal
 from ..core.deps import get_current_user
+from ..core.sessions import session_store
 
 router = APIRouter()
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+def _create_user_access_token(user: UserInDB) -> str:
+    """Create an access token carrying the user's principal claims"""
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_access_token(
+        user.id,
+        expires_delta=access_token_expires,
+        claims=Principal.from_user(user).to_claims()
+    )
+
+async def _issue_tokens(user: UserInDB) -> dict:
+    """Create a short-lived access token plus a rotating refresh token"""
+    tokens = {
+        "access_token": _create_user_access_token(user),
+        "token_type": "bearer"
+    }
+    
+    refresh_token = await session_store.issue(user.id)
+    if refresh_token:
+        tokens["refresh_token"] = refresh_token
+    
+    return tokens
+
 @router.post("/register", response_model=dict)
 async def register(user: UserCreate):
     """Register a new user"""
@@ -30,25 +57,23 @@ async def register(user: UserCreate):
     
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user.password) if user.password else None
+    hashed_password = await get_password_hash_async(user.password) if user.password else None
     
     user_data = UserInDB(
-        **user.dict(),
+        **user.model_dump(),
         id=user_id,
         hashed_password=hashed_password
     )
     
     # Insert user into database
-    await db.users.insert_one(user_data.dict(by_alias=True))
+    await db.users.insert_one(user_data.model_dump(by_alias=True))
     
-    # Create access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(user_id, expires_delta=access_token_expires)
+    # Create access and refresh tokens
+    tokens = await _issue_tokens(user_data)
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": UserResponse(**user_data.dict())
+        **tokens,
+        "user": UserResponse(**user_data.model_dump())
     }
 
 @router.post("/login", response_model=dict)
@@ -59,27 +84,62 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     # Find user by email (username field contains email)
     user_data = await db.users.find_one({"email": form_data.username})
     
-    if not authenticate_user(form_data.username, form_data.password, user_data):
+    if not await authenticate_user_async(form_data.username, form_data.password, user_data):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(user_data["_id"], expires_delta=access_token_expires)
+    # Create access and refresh tokens
+    tokens = await _issue_tokens(UserInDB.model_validate(user_data))
+    
+    return {
+        **tokens,
+        "user": UserResponse.model_validate(user_data)
+    }
+
+@router.post("/refresh", response_model=dict)
+async def refresh_access_token(refresh_request: RefreshRequest):
+    """Exchange a refresh token for a new access token and a rotated refresh token"""
+    rotated = await session_store.rotate(refresh_request.refresh_token)
+    
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user_id, refresh_token = rotated
+    
+    # Reload the user so the new access token carries fresh claims
+    db = get_database()
+    user_data = await db.users.find_one({"_id": user_id})
+    if user_data is None:
+        await session_store.revoke(refresh_token)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     return {
-        "access_token": access_token,
+        "access_token": _create_user_access_token(UserInDB.model_validate(user_data)),
         "token_type": "bearer",
-        "user": UserResponse(**user_data)
+        "refresh_token": refresh_token
     }
 
+@router.post("/logout", response_model=dict)
+async def logout(refresh_request: RefreshRequest):
+    """Revoke a refresh token"""
+    await session_store.revoke(refresh_request.refresh_token)
+    return {"message": "Logged out successfully"}
+
 @router.get("/me", response_model=UserResponse)
 async def read_users_me(current_user: UserInDB = Depends(get_current_user)):
     """Get current user profile"""
-    return UserResponse(**current_user.dict())
+    return UserResponse(**current_user.model_dump())
 
 @router.post("/oauth/google", response_model=dict)
 async def google_oauth(google_data: dict):
@@ -101,7 +161,7 @@ async def google_oauth(google_data: dict):
     existing_user = await db.users.find_one({"email": email})
     
     if existing_user:
-        user_id = existing_user["_id"]
+        user = UserInDB.model_validate(existing_user)
     else:
         # Create new user from Google data
         user_id = str(uuid.uuid4())
@@ -111,15 +171,14 @@ async def google_oauth(google_data: dict):
             username=name or email.split("@")[0],
             oauth_provider="google"
         )
-        await db.users.insert_one(user_data.dict(by_alias=True))
-        existing_user = user_data.dict()
+        await db.users.insert_one(user_data.model_dump(by_alias=True))
+        existing_user = user_data.model_dump()
+        user = user_data
     
-    # Create access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(user_id, expires_delta=access_token_expires)
+    # Create access and refresh tokens
+    tokens = await _issue_tokens(user)
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": UserResponse(**existing_user)
+        **tokens,
+        "user": UserResponse.model_validate(existing_user)
     }
\ No newline at end of file
@@ -2,10 +2,14 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from datetime import datetime, timedelta
 from typing import List, Optional
 from pydantic import BaseModel
+from pymongo import ReturnDocument
 
-from ..core.deps import get_current_user
+from ..core.deps import get_current_principal
 from ..core.database import get_database
-from ..models.user import UserInDB
+from ..core.user_cache import user_cache
+from ..models.user import Principal
+from ..services.achievements import record_achievement_event
+from ..services.leaderboard import mirror_xp
 
 router = APIRouter()
 
@@ -102,7 +106,7 @@ PREDEFINED_CHALLENGES = [
 ]
 
 @router.get("/", response_model=dict)
-async def get_available_challenges(current_user: UserInDB = Depends(get_current_user)):
+async def get_available_challenges(current_user: Principal = Depends(get_current_principal)):
     """Get all available challenges"""
     
     db = get_database()
@@ -153,7 +157,7 @@ async def get_available_challenges(current_user: UserInDB = Depends(get_current_
 @router.post("/join", response_model=dict)
 async def join_challenge(
     join_request: ChallengeJoin,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Join a challenge"""
     
@@ -204,7 +208,7 @@ async def join_challenge(
 @router.post("/progress", response_model=dict)
 async def update_challenge_progress(
     progress: ChallengeProgress,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Update progress for a challenge"""
     
@@ -270,10 +274,16 @@ async def update_challenge_progress(
         
         # Award XP for completion
         xp_reward = challenge_info["xp_reward"] if challenge_info else 100
-        await db.users.update_one(
-            {"_id" if "_id" in str(user_id) else "id": user_id},
-            {"$inc": {"total_xp": xp_reward}}
+        user = await db.users.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"total_xp": xp_reward}},
+            projection={"total_xp": 1},
+            return_document=ReturnDocument.AFTER
         )
+        await user_cache.publish_invalidation(user_id)
+        if user:
+            await mirror_xp(user_id, user["total_xp"])
+            await record_achievement_event(db, user_id, {"total_xp": user["total_xp"]})
         
         message = f"🎉 Challenge completed! +{xp_reward} XP earned!"
     else:
@@ -296,7 +306,7 @@ async def update_challenge_progress(
     }
 
 @router.get("/my-challenges", response_model=dict)
-async def get_my_challenges(current_user: UserInDB = Depends(get_current_user)):
+async def get_my_challenges(current_user: Principal = Depends(get_current_principal)):
     """Get user's active challenges"""
     
     db = get_database()
@@ -339,7 +349,7 @@ async def get_my_challenges(current_user: UserInDB = Depends(get_current_user)):
 async def get_challenge_leaderboard(
     challenge_id: str,
     limit: int = 50,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get leaderboard for a specific challenge"""
     
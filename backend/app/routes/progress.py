@@ -1,204 +1,125 @@
-from fastapi import APIRouter, Depends
-from datetime import datetime, timedelta
-from typing import List, Dict
+from fastapi import APIRouter, Depends, Query
+from datetime import datetime
+from typing import Dict
 
-from ..core.deps import get_current_user
+from ..core.deps import get_current_user, get_current_principal
 from ..core.database import get_database
-from ..models.user import UserInDB
+from ..models.user import UserInDB, Principal
+from ..services.activity import summarize_activity
+from ..services.achievements import list_achievements
+from ..services.leaderboard import LEADERBOARD_SORT, read_leaderboard, schedule_rebuild
 
 router = APIRouter()
 
 @router.get("/", response_model=dict)
 async def get_user_progress(current_user: UserInDB = Depends(get_current_user)):
     """Get user's progress including streaks, XP, and recent activity"""
-    try:
-        # Handle both dict and object access for user data
-        if hasattr(current_user, 'streak_data') and isinstance(current_user.streak_data, dict):
-            current_streak = current_user.streak_data.get("current", 0)
-            longest_streak = current_user.streak_data.get("longest", 0)
-        else:
-            current_streak = getattr(current_user.streak_data, 'current', 0) if current_user.streak_data else 0
-            longest_streak = getattr(current_user.streak_data, 'longest', 0) if current_user.streak_data else 0
-        
-        total_xp = getattr(current_user, 'total_xp', 150)
-        
-        # Generate demo data for last 7 days (mix of true/false for realistic look)
-        last_7_days = [True, False, True, True, False, True, True]  # Last 7 days activity
-        
-        monthly_stats = {
-            "total_sessions": 12,
-            "avg_duration": 15,
-            "favorite_focus": "mindfulness",
-            "total_xp_earned": 240
-        }
-        
-        return {
-            "success": True,
-            "data": {
-                "current_streak": current_streak,
-                "longest_streak": longest_streak,
-                "total_xp": total_xp,
-                "total_sessions": 15,  # Demo data
-                "completion_rate": 85.7,
-                "last_7_days": last_7_days,
-                "monthly_stats": monthly_stats,
-                "level": _calculate_level(total_xp),
-                "next_level_xp": _calculate_next_level_xp(total_xp)
-            }
-        }
-    except Exception as e:
-        # Fallback response
-        return {
-            "success": True,
-            "data": {
-                "current_streak": 3,
-                "longest_streak": 7,
-                "total_xp": 150,
-                "total_sessions": 10,
-                "completion_rate": 80.0,
-                "last_7_days": [True, False, True, True, False, True, True],
-                "monthly_stats": {
-                    "total_sessions": 8,
-                    "avg_duration": 15,
-                    "favorite_focus": "mindfulness",
-                    "total_xp_earned": 180
-                },
-                "level": 2,
-                "next_level_xp": 50
-            }
+    db = get_database()
+    
+    # One document read, however long the user's history
+    rollup = await db.activity_rollups.find_one({"_id": current_user.id})
+    activity = summarize_activity(rollup, datetime.utcnow().date())
+    
+    total_xp = current_user.total_xp
+    return {
+        "success": True,
+        "data": {
+            "current_streak": current_user.streak_data.current,
+            "longest_streak": current_user.streak_data.longest,
+            "total_xp": total_xp,
+            **activity,
+            "level": _calculate_level(total_xp),
+            "next_level_xp": _calculate_next_level_xp(total_xp)
         }
+    }
 
 @router.get("/achievements", response_model=dict)
 async def get_user_achievements(current_user: UserInDB = Depends(get_current_user)):
     """Get user's achievements and badges"""
     db = get_database()
     
-    # Get user's routine history for achievement calculation
-    routines_cursor = db.routines.find({"user_id": current_user.id})
-    routines = await routines_cursor.to_list(length=1000)
-    
-    completed_routines = [r for r in routines if r.get("completed_at")]
-    
-    achievements = []
-    
-    # Streak achievements
-    current_streak = current_user.streak_data.get("current", 0)
-    if current_streak >= 7:
-        achievements.append({
-            "id": "week_warrior",
-            "title": "Week Warrior",
-            "description": "Complete 7 days in a row",
-            "icon": "🔥",
-            "unlocked": True,
-            "date_unlocked": current_user.streak_data.get("last_completed")
-        })
-    
-    if current_streak >= 30:
-        achievements.append({
-            "id": "month_master", 
-            "title": "Month Master",
-            "description": "Complete 30 days in a row",
-            "icon": "👑",
-            "unlocked": True,
-            "date_unlocked": current_user.streak_data.get("last_completed")
-        })
-    
-    # Session count achievements
-    total_sessions = len(completed_routines)
-    if total_sessions >= 10:
-        achievements.append({
-            "id": "getting_started",
-            "title": "Getting Started",
-            "description": "Complete 10 practice sessions",
-            "icon": "🌱",
-            "unlocked": True,
-            "date_unlocked": completed_routines[9]["completed_at"] if len(completed_routines) > 9 else None
-        })
-    
-    if total_sessions >= 50:
-        achievements.append({
-            "id": "dedicated_practitioner",
-            "title": "Dedicated Practitioner", 
-            "description": "Complete 50 practice sessions",
-            "icon": "🥋",
-            "unlocked": True,
-            "date_unlocked": completed_routines[49]["completed_at"] if len(completed_routines) > 49 else None
-        })
-    
-    # XP achievements
-    total_xp = current_user.total_xp
-    if total_xp >= 1000:
-        achievements.append({
-            "id": "xp_collector",
-            "title": "XP Collector",
-            "description": "Earn 1000 XP total",
-            "icon": "💎",
-            "unlocked": True,
-            "date_unlocked": None  # Would need to track when this was achieved
-        })
+    # Unlocks are recorded as they happen, so this is one indexed read
+    achievements = await list_achievements(db, current_user.id)
     
     return {
         "success": True,
         "data": {
             "achievements": achievements,
-            "total_unlocked": len(achievements),
+            "total_unlocked": sum(1 for achievement in achievements if achievement["unlocked"]),
             "progress": {
-                "current_streak": current_streak,
-                "total_sessions": total_sessions,
-                "total_xp": total_xp
+                "current_streak": current_user.streak_data.current,
+                "total_xp": current_user.total_xp
             }
         }
     }
 
 @router.get("/leaderboard", response_model=dict)
-async def get_leaderboard(limit: int = 50, current_user: UserInDB = Depends(get_current_user)):
-    """Get leaderboard based on XP and streaks"""
+async def get_leaderboard(
+    limit: int = Query(50, ge=1, le=100),
+    around: int = Query(0, ge=0, le=25),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Get leaderboard based on XP, with the user's exact rank and optionally the users around them"""
     db = get_database()
     
-    # Get top users by XP
-    users_cursor = db.users.find({}).sort("total_xp", -1).limit(limit)
-    users = await users_cursor.to_list(length=limit)
-    
-    leaderboard = []
-    current_user_rank = None
+    board = await read_leaderboard(current_user.id, limit, around)
+    if board is None:
+        # Cold start: answer from Mongo while the sorted set is rebuilt
+        schedule_rebuild(db)
+        board = await _read_leaderboard_from_mongo(db, current_user.id, limit)
+    
+    # Names and streaks for every listed user in one query
+    user_ids = {user_id for user_id, _, _ in board["top"] + board["around"]}
+    profiles = {
+        user["_id"]: user
+        async for user in db.users.find({"_id": {"$in": list(user_ids)}}, {"username": 1, "streak_data.current": 1})
+    }
     
-    for idx, user_data in enumerate(users):
-        rank = idx + 1
-        user_entry = {
-            "rank": rank,
-            "username": user_data.get("username", "Anonymous"),
-            "total_xp": user_data.get("total_xp", 0),
-            "current_streak": user_data.get("streak_data", {}).get("current", 0),
-            "level": _calculate_level(user_data.get("total_xp", 0)),
-            "is_current_user": user_data.get("_id") == current_user.id
-        }
-        
-        if user_data.get("_id") == current_user.id:
-            current_user_rank = rank
-            
-        leaderboard.append(user_entry)
+    def entries(ranked):
+        return [
+            {
+                "rank": rank,
+                "username": profiles.get(user_id, {}).get("username", "Anonymous"),
+                "total_xp": total_xp,
+                "current_streak": profiles.get(user_id, {}).get("streak_data", {}).get("current", 0),
+                "level": _calculate_level(total_xp),
+                "is_current_user": user_id == current_user.id
+            }
+            for user_id, total_xp, rank in ranked
+        ]
     
     return {
         "success": True,
         "data": {
-            "users": leaderboard,
-            "current_user_rank": current_user_rank,
-            "total_users": len(leaderboard)
+            "users": entries(board["top"]),
+            "current_user_rank": board["rank"],
+            "current_user_xp": board["total_xp"],
+            "around_me": entries(board["around"]),
+            # Users who never earned XP are not on the sorted set, so count from Mongo metadata
+            "total_users": await db.users.estimated_document_count()
         }
     }
 
-def _get_favorite_focus(routines: List[Dict]) -> str:
-    """Calculate user's favorite focus area"""
-    focus_counts = {}
-    
-    for routine in routines:
-        focus = routine.get("focus_area", "mindfulness")
-        focus_counts[focus] = focus_counts.get(focus, 0) + 1
+async def _read_leaderboard_from_mongo(db, user_id: str, limit: int) -> Dict:
+    """The same figures from the users collection's XP index, without the window"""
+    users = await db.users.find({}, {"total_xp": 1}).sort(LEADERBOARD_SORT).limit(limit).to_list(length=limit)
+    top = []
+    for position, user in enumerate(users):
+        total_xp = user.get("total_xp", 0)
+        if position and total_xp == top[-1][1]:
+            rank = top[-1][2]
+        else:
+            rank = position + 1
+        top.append((user["_id"], total_xp, rank))
     
-    if not focus_counts:
-        return "mindfulness"
-        
-    return max(focus_counts, key=focus_counts.get)
+    user = await db.users.find_one({"_id": user_id}, {"total_xp": 1}) or {}
+    total_xp = user.get("total_xp", 0)
+    return {
+        "top": top,
+        "rank": await db.users.count_documents({"total_xp": {"$gt": total_xp}}) + 1,
+        "total_xp": total_xp,
+        "around": []
+    }
 
 def _calculate_level(xp: int) -> int:
     """Calculate user level based on XP"""
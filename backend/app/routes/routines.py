@@ -1,116 +1,250 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
 import redis.asyncio as redis
+import asyncio
 import json
+import uuid
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
 
-from ..core.deps import get_current_user
-from ..core.database import get_database, get_redis
-from ..models.user import UserInDB
-from ..models.routine import RoutineInDB, RoutineComplete, RoutineResponse
-from ..services.ai_service import RoutineGenerator
+from ..core.deps import get_current_user, get_current_principal
+from ..core.database import (
+    get_database, get_redis, routine_cache_key, routine_version_key,
+    cache_routine_if_current, invalidate_routine_cache
+)
+from ..core.user_cache import user_cache
+from ..core.coalesce import SingleFlight, StreamFlight, RedisLock
+from ..core.pagination import fetch_page
+from ..models.user import UserInDB, Principal
+from ..models.routine import RoutineInDB, RoutineComplete, RoutineResponse, ExerciseBlock, routine_response_list
+from ..services.ai_service import get_routine_generator, build_user_profile, wants_ai_routines
+from ..services.routine_pool import routine_pool, recent_template_ids
+from ..services.routine_composer import compose_routine
+from ..services.audio_jobs import enqueue_routine_audio, UNFINISHED_STATUSES
+from ..services.activity import record_completion
+from ..services.achievements import record_achievement_event
+from ..services.leaderboard import mirror_xp
 
 router = APIRouter()
 
+ROUTINE_LOCK_TTL_SECONDS = 60
+ROUTINE_LOCK_POLL_SECONDS = 0.25
+
+# Coalesces concurrent /today generations for the same user-day in this worker
+routine_flights = SingleFlight()
+# The same for /today/stream, whose followers receive the leader's blocks as they arrive
+routine_streams = StreamFlight()
+
+ROUTINE_CACHE_TTL_SECONDS = 3600
+
+ROUTINE_AUDIO_POLL_SECONDS = 1
+ROUTINE_AUDIO_STREAM_TIMEOUT_SECONDS = 600
+
+# Fields an AI routine replaces when it upgrades a locally composed one in place
+UPGRADED_FIELDS = ("title", "blocks", "total_duration", "focus_area", "difficulty_level",
+                   "completion_xp", "daily_wisdom", "template_id", "generated_by")
+
+# Keeps background upgrade tasks referenced until they finish
+_upgrade_tasks: Set[asyncio.Task] = set()
+
 @router.get("/today", response_model=dict)
-async def get_daily_routine(current_user: UserInDB = Depends(get_current_user)):
-    """Get today's personalized routine"""
+async def get_daily_routine(
+    instant: bool = False,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Get today's personalized routine
+
+    With instant=true a locally composed routine is returned right away and
+    upgraded in place to an AI routine in the background.
+    """
     db = get_database()
     today = datetime.utcnow().date().isoformat()
     
-    # Check if user already has a routine for today
-    existing_routine = await db.routines.find_one({
-        "user_id": current_user.id,
-        "created_at": {
-            "$gte": datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
-            "$lt": datetime.utcnow().replace(hour=23, minute=59, second=59, microsecond=999999)
+    routine, source = await _lookup_todays_routine(db, current_user.id, today)
+    
+    if routine:
+        return {
+            "routine": routine if source == "cached" else RoutineResponse.model_validate(routine),
+            "is_completed": routine.get("completed_at") is not None,
+            "source": source
         }
-    })
     
-    if existing_routine:
+    if instant and wants_ai_routines(current_user):
+        routine_doc, source = await _compose_todays_routine(db, current_user, today)
+        if routine_doc.get("generated_by") == "local":
+            _schedule_upgrade(db, current_user, today, routine_doc["_id"])
         return {
-            "routine": RoutineResponse(**existing_routine),
-            "is_completed": existing_routine.get("completed_at") is not None,
-            "source": "existing"
+            "routine": RoutineResponse.model_validate(routine_doc),
+            "is_completed": routine_doc.get("completed_at") is not None,
+            "source": source
         }
     
-    # Check Redis cache first
+    # Generate once per user-day, however many requests arrive at the same time
+    routine_doc, source = await routine_flights.do(
+        f"{current_user.id}:{today}",
+        lambda: _generate_todays_routine(db, current_user, today)
+    )
+    
+    return {
+        "routine": RoutineResponse.model_validate(routine_doc),
+        "is_completed": routine_doc.get("completed_at") is not None,
+        "source": source
+    }
+
+async def _lookup_todays_routine(db, user_id: str, today: str) -> Tuple[Optional[dict], Optional[str]]:
+    """Find an already generated routine for the day, checking Redis before Mongo"""
     redis_client = get_redis()
+    version = "0"
     if redis_client:
-        cached_routine = await redis_client.get(f"routine:{current_user.id}:{today}")
+        cached_routine, version = await redis_client.mget(
+            routine_cache_key(user_id, today), routine_version_key(user_id, today)
+        )
         if cached_routine:
-            routine_data = json.loads(cached_routine)
-            return {
-                "routine": routine_data,
-                "is_completed": False,
-                "source": "cached"
-            }
+            return json.loads(cached_routine), "cached"
     
-    # Generate new routine
-    generator = RoutineGenerator()
-    
-    # Handle preferences as dict (demo mode) or model (real user)
-    prefs = current_user.preferences
-    if isinstance(prefs, dict):
-        user_profile = {
-            "fitness_level": current_user.fitness_level,
-            "duration": prefs.get("duration", 15),
-            "focus_areas": prefs.get("focus_areas", ["flexibility", "mindfulness"]),
-            "language": prefs.get("language", "en")
-        }
-    else:
-        user_profile = {
-            "fitness_level": current_user.fitness_level,
-            "duration": prefs.duration,
-            "focus_areas": prefs.focus_areas,
-            "language": prefs.language
-        }
+    # Point read on the unique (user_id, day) index
+    existing_routine = await db.routines.find_one({"user_id": user_id, "day": today})
+    if existing_routine:
+        await _cache_routine(user_id, today, existing_routine, version)
+        return existing_routine, "existing"
+    
+    return None, None
+
+async def _cache_routine(user_id: str, day: str, routine_doc: dict, version: Optional[str]):
+    """Cache a routine read at version; a copy read before a /complete or audio update is dropped"""
+    redis_client = get_redis()
+    if redis_client:
+        await cache_routine_if_current(
+            redis_client, user_id, day, version or "0",
+            RoutineResponse.model_validate(routine_doc).model_dump_json(),
+            ROUTINE_CACHE_TTL_SECONDS
+        )
+
+async def _generate_todays_routine(db, current_user: UserInDB, today: str):
+    """Generate and store today's routine while holding the cross-worker lock"""
+    lock = RedisLock(f"lock:routine:{current_user.id}:{today}", ROUTINE_LOCK_TTL_SECONDS)
+    deadline = asyncio.get_running_loop().time() + ROUTINE_LOCK_TTL_SECONDS
     
-    routine_data = await generator.generate_daily_routine(user_profile)
+    # Another worker is generating: wait for its routine instead of calling the LLM again
+    while not await lock.acquire():
+        await asyncio.sleep(ROUTINE_LOCK_POLL_SECONDS)
+        existing_routine = await db.routines.find_one({"user_id": current_user.id, "day": today})
+        if existing_routine:
+            return existing_routine, "existing"
+        if asyncio.get_running_loop().time() > deadline:
+            break
     
-    # Save to database
-    routine_doc = RoutineInDB(
+    try:
+        # The previous holder may have finished just before we took the lock
+        existing_routine = await db.routines.find_one({"user_id": current_user.id, "day": today})
+        if existing_routine:
+            return existing_routine, "existing"
+        
+        user_profile = build_user_profile(current_user)
+        
+        if wants_ai_routines(current_user):
+            # Users with identical profiles share pooled routines, avoiding recent repeats
+            recent = await recent_template_ids(db, current_user.id, routine_pool.recent_window)
+            routine_data = await routine_pool.get_routine(user_profile, recent)
+        else:
+            routine_data = compose_routine(user_profile, seed=f"{current_user.id}:{today}")
+        
+        return await _insert_todays_routine(db, current_user, today, routine_data)
+    finally:
+        await lock.release()
+
+async def _insert_todays_routine(db, current_user: UserInDB, today: str, routine_data: dict):
+    """Store a routine as the user's routine for the day, unless one already exists"""
+    routine_doc = RoutineInDB(**{
         **routine_data,
-        user_id=current_user.id
-    )
+        "_id": routine_data["routine_id"],
+        "user_id": current_user.id,
+        "day": today
+    }).model_dump(by_alias=True)
     
-    await db.routines.insert_one(routine_doc.dict(by_alias=True))
+    redis_client = get_redis()
+    version = await redis_client.get(routine_version_key(current_user.id, today)) if redis_client else None
+    
+    try:
+        await db.routines.insert_one(routine_doc)
+    except DuplicateKeyError:
+        # The unique (user_id, day) index caught a concurrent generation
+        existing_routine = await db.routines.find_one({"user_id": current_user.id, "day": today})
+        return existing_routine, "existing"
     
     # Cache for 1 hour
-    if redis_client:
-        await redis_client.setex(
-            f"routine:{current_user.id}:{today}",
-            3600,
-            json.dumps(routine_data, default=str)
-        )
+    await _cache_routine(current_user.id, today, routine_doc, version)
     
-    return {
-        "routine": RoutineResponse(**routine_data),
-        "is_completed": False,
-        "source": "generated"
-    }
+    # Audio is synthesized in the background; clients poll /{routine_id}/audio for it
+    await enqueue_routine_audio(db, routine_doc, build_user_profile(current_user)["language"])
+    
+    return routine_doc, "generated"
+
+async def _compose_todays_routine(db, current_user: UserInDB, today: str):
+    """Store a locally composed routine for the day without waiting for the LLM"""
+    routine_data = compose_routine(build_user_profile(current_user), seed=f"{current_user.id}:{today}")
+    return await _insert_todays_routine(db, current_user, today, routine_data)
+
+def _schedule_upgrade(db, current_user: UserInDB, today: str, routine_id: str):
+    task = asyncio.create_task(routine_flights.do(
+        f"upgrade:{current_user.id}:{today}",
+        lambda: _upgrade_local_routine(db, current_user, today, routine_id)
+    ))
+    _upgrade_tasks.add(task)
+    task.add_done_callback(_upgrade_tasks.discard)
+
+async def _upgrade_local_routine(db, current_user: UserInDB, today: str, routine_id: str):
+    """Replace a locally composed routine's content with an AI routine, keeping its id"""
+    try:
+        recent = await recent_template_ids(db, current_user.id, routine_pool.recent_window)
+        routine_data = await routine_pool.get_routine(build_user_profile(current_user), recent)
+        if routine_data.get("is_fallback"):
+            return
+        
+        upgrade = RoutineInDB(**{
+            **routine_data,
+            "_id": routine_id,
+            "routine_id": routine_id,
+            "user_id": current_user.id,
+            "day": today
+        }).model_dump(include=set(UPGRADED_FIELDS))
+        
+        # Routines already started from the local version are left as they are
+        result = await db.routines.update_one(
+            {"_id": routine_id, "generated_by": "local", "completed_at": None},
+            {"$set": upgrade}
+        )
+        if result.modified_count:
+            redis_client = get_redis()
+            if redis_client:
+                await invalidate_routine_cache(redis_client, current_user.id, today)
+            # The new blocks have new cues, so the audio job starts over
+            await enqueue_routine_audio(
+                db,
+                {**upgrade, "_id": routine_id, "user_id": current_user.id, "day": today},
+                build_user_profile(current_user)["language"],
+                replace=True
+            )
+    except Exception as e:
+        print(f"Error upgrading local routine: {e}")
 
 @router.post("/generate", response_model=dict)
 async def generate_new_routine(current_user: UserInDB = Depends(get_current_user)):
     """Force generate a new routine using AI"""
+    user_profile = build_user_profile(current_user)
+    
+    if not wants_ai_routines(current_user):
+        return {
+            "success": True,
+            "routine": compose_routine(user_profile, seed=str(uuid.uuid4())),
+            "message": "New routine composed locally"
+        }
+    
     try:
-        generator = RoutineGenerator()
-        
-        # Handle preferences as dict (demo mode) or model (real user)
-        prefs = current_user.preferences
-        if isinstance(prefs, dict):
-            user_profile = {
-                "fitness_level": current_user.fitness_level,
-                "duration": prefs.get("duration", 15),
-                "focus_areas": prefs.get("focus_areas", ["flexibility", "mindfulness"]),
-                "language": prefs.get("language", "en")
-            }
-        else:
-            user_profile = {
-                "fitness_level": current_user.fitness_level,
-                "duration": prefs.duration,
-                "focus_areas": prefs.focus_areas,
-                "language": prefs.language
-            }
+        generator = get_routine_generator()
         
         # Generate routine using OpenAI
         routine_data = await generator.generate_daily_routine(user_profile)
@@ -125,37 +259,229 @@ async def generate_new_routine(current_user: UserInDB = Depends(get_current_user
         # Return fallback on any error
         return {
             "success": False,
-            "routine": {
-                "title": "Demo Wellness Flow",
-                "total_duration": 15,
-                "focus_area": "Balance & Mindfulness",
-                "difficulty_level": 2,
-                "blocks": [
-                    {
-                        "type": "mind",
-                        "name": "Centering Breath",
-                        "duration_seconds": 300,
-                        "instructions": ["Sit comfortably", "Breathe deeply", "Focus on your breath"],
-                        "difficulty": 1,
-                        "audio_cue": "Welcome to your practice. Let's begin by finding your center.",
-                        "benefits": ["Reduces stress", "Improves focus"]
-                    },
-                    {
-                        "type": "move",
-                        "name": "Gentle Flow",
-                        "duration_seconds": 600,
-                        "instructions": ["Move slowly", "Focus on balance", "Breathe with movement"],
-                        "difficulty": 2,
-                        "audio_cue": "Move like water, smooth and continuous.",
-                        "benefits": ["Improves flexibility", "Enhances coordination"]
-                    }
-                ],
-                "completion_xp": 75,
-                "daily_wisdom": "Every step forward is progress, no matter how small."
-            },
-            "message": f"Using demo routine (OpenAI error: {str(e)})"
+            "routine": {**compose_routine(user_profile, seed=str(uuid.uuid4())), "is_fallback": True},
+            "message": f"Using local routine (OpenAI error: {str(e)})"
         }
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@router.get("/today/stream")
+async def stream_daily_routine(current_user: UserInDB = Depends(get_current_user)):
+    """Stream today's routine as Server-Sent Events, one block at a time"""
+    db = get_database()
+    today = datetime.utcnow().date().isoformat()
+    return StreamingResponse(
+        _todays_routine_events(db, current_user, today),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.post("/generate/stream")
+async def stream_new_routine(current_user: UserInDB = Depends(get_current_user)):
+    """Force generate a new routine, streaming each block as soon as it is ready"""
+    db = get_database()
+    return StreamingResponse(
+        _generated_routine_events(db, current_user),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+def _routine_event(routine: dict, source: str) -> str:
+    response = RoutineResponse.model_validate(routine)
+    return _sse("routine", json.dumps({
+        "routine": response.model_dump(mode="json"),
+        "is_completed": response.completed_at is not None,
+        "source": source
+    }))
+
+def _block_event(block: dict) -> Optional[str]:
+    try:
+        return _sse("block", ExerciseBlock(**block).model_dump_json())
+    except ValidationError:
+        return None
+
+async def _todays_routine_events(db, current_user: UserInDB, today: str):
+    routine, source = await _lookup_todays_routine(db, current_user.id, today)
+    
+    if routine is not None:
+        for block in RoutineResponse.model_validate(routine).blocks:
+            yield _sse("block", block.model_dump_json())
+        yield _routine_event(routine, source)
+        return
+    
+    # One stream per user-day in this worker; concurrent requests follow it block by block
+    try:
+        async for kind, payload in routine_streams.do(
+            f"{current_user.id}:{today}",
+            lambda: _stream_todays_routine(db, current_user, today)
+        ):
+            if kind == "block":
+                event = _block_event(payload)
+                if event:
+                    yield event
+            else:
+                yield _routine_event(*payload)
+    except Exception as e:
+        yield _sse("error", json.dumps({"detail": f"Routine generation failed: {str(e)}"}))
+
+async def _stream_todays_routine(db, current_user: UserInDB, today: str):
+    """Yield today's blocks as they are generated, then ("routine", (routine_doc, source)) once stored"""
+    lock = RedisLock(f"lock:routine:{current_user.id}:{today}", ROUTINE_LOCK_TTL_SECONDS)
+    if not await lock.acquire():
+        # Another worker is generating: wait for its routine and replay it
+        routine_doc, source = await routine_flights.do(
+            f"{current_user.id}:{today}",
+            lambda: _generate_todays_routine(db, current_user, today)
+        )
+        for block in routine_doc["blocks"]:
+            yield "block", block
+        yield "routine", (routine_doc, source)
+        return
+    
+    try:
+        existing_routine = await db.routines.find_one({"user_id": current_user.id, "day": today})
+        if existing_routine:
+            for block in existing_routine["blocks"]:
+                yield "block", block
+            yield "routine", (existing_routine, "existing")
+            return
+        
+        user_profile = build_user_profile(current_user)
+        if wants_ai_routines(current_user):
+            # Pooled routines come back at once; a pool miss streams from the model and is pooled
+            recent = await recent_template_ids(db, current_user.id, routine_pool.recent_window)
+            events = routine_pool.stream_routine(user_profile, recent)
+        else:
+            events = _composed_routine_stream(user_profile, f"{current_user.id}:{today}")
+        
+        async for kind, payload in events:
+            if kind == "block":
+                yield kind, payload
+            else:
+                yield "routine", await _insert_todays_routine(db, current_user, today, payload)
+    finally:
+        await lock.release()
+
+async def _composed_routine_stream(user_profile: dict, seed: str):
+    routine_data = compose_routine(user_profile, seed=seed)
+    for block in routine_data["blocks"]:
+        yield "block", block
+    yield "routine", routine_data
+
+async def _generated_routine_events(db, current_user: UserInDB):
+    """Relay streamed blocks, then persist the assembled routine outside any day"""
+    try:
+        user_profile = build_user_profile(current_user)
+        if wants_ai_routines(current_user):
+            events = get_routine_generator().stream_daily_routine(user_profile)
+        else:
+            events = _composed_routine_stream(user_profile, str(uuid.uuid4()))
+        
+        async for kind, payload in events:
+            if kind == "block":
+                event = _block_event(payload)
+                if event:
+                    yield event
+                continue
+            
+            routine_doc = RoutineInDB(**{
+                **payload,
+                "_id": payload["routine_id"],
+                "user_id": current_user.id
+            }).model_dump(by_alias=True)
+            source = "generated"
+            
+            try:
+                await db.routines.insert_one(routine_doc)
+                await enqueue_routine_audio(db, routine_doc, build_user_profile(current_user)["language"])
+            except DuplicateKeyError:
+                # Routines without a day only collide on their own id
+                routine_doc = await db.routines.find_one({"_id": routine_doc["_id"], "user_id": current_user.id})
+                if routine_doc is None:
+                    raise
+                source = "existing"
+            
+            yield _routine_event(routine_doc, source)
+    except Exception as e:
+        yield _sse("error", json.dumps({"detail": f"Routine generation failed: {str(e)}"}))
+
+@router.get("/{routine_id}/audio", response_model=dict)
+async def get_routine_audio(
+    routine_id: str,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Poll the background audio of a routine, block by block"""
+    db = get_database()
+    job = await _find_audio_job(db, routine_id, current_user.id)
+    return _audio_job_status(routine_id, job)
+
+@router.get("/{routine_id}/audio/stream")
+async def stream_routine_audio(
+    routine_id: str,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Subscribe to a routine's block audio as Server-Sent Events"""
+    db = get_database()
+    job = await _find_audio_job(db, routine_id, current_user.id)
+    return StreamingResponse(
+        _audio_job_events(db, routine_id, job),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+async def _find_audio_job(db, routine_id: str, user_id: str) -> Optional[dict]:
+    job = await db.audio_jobs.find_one({"_id": routine_id, "user_id": user_id})
+    if job is None and not await db.routines.find_one({"_id": routine_id, "user_id": user_id}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Routine not found"
+        )
+    return job
+
+def _audio_job_status(routine_id: str, job: Optional[dict]) -> dict:
+    # No job: no voice configured or nothing to synthesize
+    if job is None:
+        return {"routine_id": routine_id, "status": "none", "blocks": []}
+    return {
+        "routine_id": routine_id,
+        "status": job["status"],
+        "blocks": [
+            {"index": block["index"], "audio_url": block["audio_url"], "error": block["error"]}
+            for block in job["blocks"]
+        ]
+    }
+
+async def _audio_job_events(db, routine_id: str, job: Optional[dict]):
+    """Emit each block's audio once it is ready, then the final job status"""
+    sent = set()
+    deadline = asyncio.get_running_loop().time() + ROUTINE_AUDIO_STREAM_TIMEOUT_SECONDS
+    while True:
+        job_status = _audio_job_status(routine_id, job)
+        for block in job_status["blocks"]:
+            if block["index"] not in sent and (block["audio_url"] or block["error"]):
+                sent.add(block["index"])
+                yield _sse("block", json.dumps(block))
+        
+        if job_status["status"] not in UNFINISHED_STATUSES or asyncio.get_running_loop().time() > deadline:
+            yield _sse("status", json.dumps({"routine_id": routine_id, "status": job_status["status"]}))
+            return
+        
+        await asyncio.sleep(ROUTINE_AUDIO_POLL_SECONDS)
+        job = await db.audio_jobs.find_one({"_id": routine_id})
+
+COMPLETION_PROJECTION = {
+    "user_id": 1, "day": 1, "xp_earned": 1, "completion_rate": 1, "completed_at": 1,
+    "total_duration": 1, "focus_area": 1
+}
+
+PROGRESS_UPDATE_ATTEMPTS = 3
+
+# A repeated /complete within this window finishes a progress update that failed
+PROGRESS_RECOVERY_WINDOW = timedelta(hours=1)
+
 @router.post("/complete", response_model=dict)
 async def complete_routine(
     completion_data: RoutineComplete,
@@ -164,102 +490,182 @@ async def complete_routine(
     """Mark routine as completed and update user progress"""
     db = get_database()
     
-    # Find the routine
-    routine = await db.routines.find_one({"routine_id": completion_data.routine_id})
-    if not routine:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Routine not found"
-        )
-    
-    # Calculate XP based on completion
     completion_rate = completion_data.completed_blocks / completion_data.total_blocks
-    base_xp = routine.get("completion_xp", 50)
-    earned_xp = int(base_xp * completion_rate)
     
-    # Update routine completion
-    await db.routines.update_one(
-        {"routine_id": completion_data.routine_id},
-        {
+    # Only the first completion matches, so retries and double taps award XP once
+    routine = await db.routines.find_one_and_update(
+        {"routine_id": completion_data.routine_id, "user_id": current_user.id, "completed_at": None},
+        [{
             "$set": {
                 "completed_at": datetime.utcnow(),
-                "feedback_rating": completion_data.feedback_rating,
-                "feedback_comment": completion_data.feedback_comment,
-                "xp_earned": earned_xp
+                # User input is never read as an expression, even when it starts with $
+                "feedback_rating": {"$literal": completion_data.feedback_rating},
+                "feedback_comment": {"$literal": completion_data.feedback_comment},
+                "completion_rate": completion_rate,
+                "xp_earned": {"$toInt": {"$trunc": {
+                    "$multiply": [{"$ifNull": ["$completion_xp", 50]}, completion_rate]
+                }}}
             }
-        }
+        }],
+        projection=COMPLETION_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
     
-    # Update user progress
-    await update_user_progress(db, current_user.id, earned_xp, completion_rate >= 0.8)
+    if not routine:
+        existing_routine = await db.routines.find_one(
+            {"routine_id": completion_data.routine_id, "user_id": current_user.id},
+            COMPLETION_PROJECTION
+        )
+        if not existing_routine:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Routine not found"
+            )
+        if await progress_pending(db, existing_routine):
+            # An earlier attempt completed the routine but not the progress update
+            await apply_completion_progress(db, existing_routine)
+        return {
+            "message": "Routine already completed",
+            "xp_earned": existing_routine.get("xp_earned", 0),
+            "completion_rate": existing_routine.get("completion_rate", completion_rate)
+        }
+    
+    # The cached copy of today's routine no longer reflects its completion
+    redis_client = get_redis()
+    if redis_client and routine.get("day"):
+        await invalidate_routine_cache(redis_client, routine["user_id"], routine["day"])
+    
+    await apply_completion_progress(db, routine)
     
     return {
         "message": "Routine completed successfully",
-        "xp_earned": earned_xp,
+        "xp_earned": routine["xp_earned"],
         "completion_rate": completion_rate
     }
 
-async def update_user_progress(db, user_id: str, xp_earned: int, is_complete: bool):
-    """Update user's progress, streaks, and XP"""
+async def progress_pending(db, routine: Dict) -> bool:
+    """Whether a recently completed routine is missing from the user's progress"""
+    completed_at = routine.get("completed_at")
+    # Older routines may have aged out of applied_routines, so they are never applied again
+    if completed_at is None or datetime.utcnow() - completed_at > PROGRESS_RECOVERY_WINDOW:
+        return False
+    applied = await db.users.find_one({"_id": routine["user_id"], "applied_routines": routine["_id"]}, {"_id": 1})
+    return applied is None
+
+async def apply_completion_progress(db, routine: Dict):
+    """Apply a completed routine to the user's XP, streak, rollup and achievements exactly once"""
+    user_id = routine["user_id"]
+    completion_rate = routine.get("completion_rate", 1.0)
+    
+    # Every step is idempotent per routine, so a failed attempt is simply retried
+    for attempt in range(PROGRESS_UPDATE_ATTEMPTS):
+        try:
+            progress = await update_user_progress(
+                db, user_id, routine["xp_earned"], completion_rate >= 0.8, routine_id=routine["_id"]
+            )
+            # A user deleted meanwhile gets no rollup, leaderboard entry or achievements
+            if progress:
+                total_sessions = await record_completion(db, user_id, routine, completion_rate)
+            break
+        except PyMongoError:
+            if attempt == PROGRESS_UPDATE_ATTEMPTS - 1:
+                # The next /complete call for this routine finishes it, see progress_pending
+                raise
+            await asyncio.sleep(0.1 * 2 ** attempt)
     
-    # Get current user data
-    user = await db.users.find_one({"_id": user_id})
-    if not user:
+    if not progress:
         return
     
-    # Update total XP
-    new_total_xp = user.get("total_xp", 0) + xp_earned
+    await mirror_xp(user_id, progress.get("total_xp", 0))
+    await record_achievement_event(db, user_id, {
+        "total_sessions": total_sessions,
+        "total_xp": progress.get("total_xp"),
+        "current_streak": progress.get("streak_data", {}).get("current")
+    }, at=routine["completed_at"])
+
+# Routines recently applied to a user's progress, long enough to outlast any retry
+APPLIED_ROUTINES_KEPT = 50
+
+async def update_user_progress(
+    db,
+    user_id: str,
+    xp_earned: int,
+    is_complete: bool,
+    routine_id: Optional[str] = None
+) -> Dict:
+    """Update user's progress, streaks, and XP in a single atomic write, returning the new values
     
-    # Update streak data
-    streak_data = user.get("streak_data", {"current": 0, "longest": 0, "last_completed": None})
-    today = datetime.utcnow().date()
+    With a routine_id the update applies at most once per routine.
+    """
+    now = datetime.utcnow()
+    today_start = datetime(now.year, now.month, now.day)
+    yesterday_start = today_start - timedelta(days=1)
+    
+    pipeline = [{"$set": {"total_xp": {"$add": [{"$ifNull": ["$total_xp", 0]}, xp_earned]}, "last_active": now}}]
+    query = {"_id": user_id}
+    if routine_id:
+        query["applied_routines"] = {"$ne": routine_id}
+        pipeline.append({"$set": {"applied_routines": {"$slice": [
+            {"$concatArrays": [{"$ifNull": ["$applied_routines", []]}, {"$literal": [routine_id]}]},
+            -APPLIED_ROUTINES_KEPT
+        ]}}})
     
     if is_complete:
-        last_completed = streak_data.get("last_completed")
-        if last_completed:
-            last_date = last_completed.date() if isinstance(last_completed, datetime) else datetime.fromisoformat(last_completed).date()
-            
-            if today == last_date:
-                # Already completed today, no streak change
-                pass
-            elif today == last_date + timedelta(days=1):
-                # Consecutive day, increment streak
-                streak_data["current"] += 1
-                streak_data["last_completed"] = datetime.utcnow()
-            else:
-                # Streak broken, reset
-                streak_data["current"] = 1
-                streak_data["last_completed"] = datetime.utcnow()
-        else:
-            # First completion
-            streak_data["current"] = 1
-            streak_data["last_completed"] = datetime.utcnow()
-        
-        # Update longest streak
-        if streak_data["current"] > streak_data.get("longest", 0):
-            streak_data["longest"] = streak_data["current"]
-    
-    # Update user document
-    await db.users.update_one(
-        {"_id": user_id},
-        {
-            "$set": {
-                "total_xp": new_total_xp,
-                "streak_data": streak_data,
-                "last_active": datetime.utcnow()
-            }
-        }
+        # Older documents may hold last_completed as an ISO string
+        last_completed = {"$convert": {"input": "$streak_data.last_completed", "to": "date", "onError": None, "onNull": None}}
+        current = {"$ifNull": ["$streak_data.current", 0]}
+        pipeline += [
+            {"$set": {"_last_completed": last_completed}},
+            {"$set": {
+                "streak_data.current": {"$switch": {
+                    "branches": [
+                        # Already completed today, no streak change
+                        {"case": {"$gte": ["$_last_completed", today_start]}, "then": current},
+                        # Consecutive day, increment streak
+                        {"case": {"$gte": ["$_last_completed", yesterday_start]}, "then": {"$add": [current, 1]}}
+                    ],
+                    # First completion, or streak broken
+                    "default": 1
+                }},
+                "streak_data.last_completed": {"$cond": [
+                    {"$gte": ["$_last_completed", today_start]}, "$_last_completed", now
+                ]}
+            }},
+            {"$set": {"streak_data.longest": {"$max": [
+                {"$ifNull": ["$streak_data.longest", 0]}, "$streak_data.current"
+            ]}}},
+            {"$project": {"_last_completed": 0}}
+        ]
+    
+    user = await db.users.find_one_and_update(
+        query,
+        pipeline,
+        projection={"total_xp": 1, "streak_data": 1},
+        return_document=ReturnDocument.AFTER
     )
+    if user is None and routine_id:
+        # Already applied by an earlier attempt; report the current values
+        user = await db.users.find_one({"_id": user_id}, {"total_xp": 1, "streak_data": 1})
+    await user_cache.publish_invalidation(user_id)
+    return user or {}
 
-@router.get("/history", response_model=list)
+@router.get("/history", response_model=dict)
 async def get_routine_history(
-    limit: int = 10,
-    current_user: UserInDB = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Get user's routine history"""
+    """Get user's routine history, newest first, one cursor page at a time"""
     db = get_database()
     
-    cursor = db.routines.find({"user_id": current_user.id}).sort("created_at", -1).limit(limit)
-    routines = await cursor.to_list(length=limit)
+    routines, next_cursor = await fetch_page(db.routines, {"user_id": current_user.id}, cursor, limit)
     
-    return [RoutineResponse(**routine) for routine in routines]
\ No newline at end of file
+    # Validated and serialized in one pass, bypassing FastAPI's response encoding
+    return ORJSONResponse({
+        "routines": routine_response_list.dump_python(routine_response_list.validate_python(routines), mode="json"),
+        "pagination": {
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        }
+    })
\ No newline at end of file
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from ..services.ai_service import RoutineGenerator
+from ..services.ai_service import get_routine_generator
 from ..models.routine import RoutineResponse
 
 router = APIRouter()
@@ -8,7 +8,7 @@ router = APIRouter()
 async def test_generate_routine():
     """Test routine generation with OpenAI - No auth required"""
     try:
-        generator = RoutineGenerator()
+        generator = get_routine_generator()
         
         # Use default user profile for testing
         user_profile = {
@@ -37,9 +37,9 @@ async def test_voice_generation():
     """Test ElevenLabs voice generation - No auth required"""
     try:
         # Import voice service
-        from ..services.voice_service import VoiceService
+        from ..services.voice_service import get_voice_service
         
-        voice_service = VoiceService()
+        voice_service = get_voice_service()
         test_text = "Welcome to ChiZen Fitness. Let's begin your mindful practice."
         
         audio_url = await voice_service.generate_audio_cues([test_text])
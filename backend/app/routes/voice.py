@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import AsyncIterator, Dict, Optional, List, Tuple
+import asyncio
+import orjson
+import os
+import re
 
-from ..core.deps import get_current_user
-from ..models.user import UserInDB
-from ..services.voice_service import VoiceService
+from ..core.deps import get_current_principal
+from ..models.user import Language, Principal
+from ..services.voice_service import get_voice_service
+from ..services.audio_store import KEY_PATTERN, BlobStore, get_audio_store
+from ..services.phrase_library import PHRASE_LIBRARY_VERSION
 
 router = APIRouter()
 
@@ -22,11 +29,11 @@ class VoiceGenerationResponse(BaseModel):
 @router.post("/generate", response_model=dict)
 async def generate_voice(
     request: VoiceGenerationRequest,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Generate voice audio using ElevenLabs"""
     try:
-        voice_service = VoiceService()
+        voice_service = get_voice_service()
         
         # Generate audio for the provided text
         audio_urls = await voice_service.generate_audio_cues([request.text])
@@ -51,33 +58,240 @@ async def generate_voice(
             detail=f"Voice generation failed: {str(e)}"
         )
 
-@router.post("/batch-generate", response_model=dict)
+MAX_BATCH_TEXTS = int(os.getenv("VOICE_BATCH_MAX_TEXTS", "200"))
+# Texts as sent, duplicates included, checked before any normalizing work
+MAX_BATCH_POSITIONS = int(os.getenv("VOICE_BATCH_MAX_POSITIONS", "1000"))
+
+@router.post("/batch-generate")
 async def generate_batch_voice(
     texts: List[str],
-    current_user: UserInDB = Depends(get_current_user)
+    language: Language = Language.english,
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Generate multiple voice audio files"""
+    """Generate multiple voice audio files, streaming one NDJSON line per distinct text"""
+    if len(texts) > MAX_BATCH_POSITIONS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BATCH_POSITIONS} texts per batch"
+        )
+    
+    # Whitespace variants of a text share one line and one synthesis
+    unique_texts = {}
+    for position, text in enumerate(texts):
+        normalized = " ".join(text.split())
+        if normalized:
+            unique_texts.setdefault(normalized, []).append(position)
+    
+    if len(unique_texts) > MAX_BATCH_TEXTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_TEXTS} distinct texts per batch"
+        )
+    if any(len(text) > MAX_STREAM_TEXT_LENGTH for text in unique_texts):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Texts are limited to {MAX_STREAM_TEXT_LENGTH} characters"
+        )
+    
+    return StreamingResponse(
+        _batch_results(unique_texts, language.value),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
+
+async def _batch_results(unique_texts: Dict[str, List[int]], language: str) -> AsyncIterator[bytes]:
+    voice_service = get_voice_service()
+    store = voice_service.store
+    counts = {"count": len(unique_texts), "cached": 0, "failed": 0}
+    
+    def line(text: str, audio_url: Optional[str], error: Optional[str], cached: bool) -> bytes:
+        return orjson.dumps({
+            "text": text,
+            "positions": unique_texts[text],
+            "audio_url": audio_url,
+            "error": error,
+            "cached": cached
+        }) + b"\n"
+    
+    # Cached audio goes out before anything is synthesized
+    pending = []
+    for text in unique_texts:
+        key = voice_service.audio_key(text)
+        if await store.exists(key):
+            counts["cached"] += 1
+            yield line(text, store.url(key), None, True)
+        else:
+            pending.append(text)
+    
+    if pending and not voice_service.api_key:
+        for text in pending:
+            counts["failed"] += 1
+            yield line(text, None, "ELEVEN_LABS_KEY not configured", False)
+        pending = []
+    
+    # At most the provider's concurrency is started at once, so a client that
+    # disconnects stops the rest of its batch from being synthesized
+    slots = asyncio.Semaphore(voice_service.max_concurrency)
+    
+    async def generate(text: str) -> Dict:
+        async with slots:
+            return await voice_service.generate_audio_result(text, language)
+    
+    tasks = [asyncio.create_task(generate(text)) for text in pending]
     try:
-        voice_service = VoiceService()
-        
-        # Generate audio for all texts
-        audio_urls = await voice_service.generate_audio_cues(texts)
-        
-        return {
-            "success": True,
-            "audio_urls": audio_urls,
-            "count": len(audio_urls),
-            "message": f"Generated {len(audio_urls)} voice files successfully"
-        }
-        
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            if result["error"]:
+                counts["failed"] += 1
+            yield line(result["text"], result["audio_url"], result["error"], False)
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    yield orjson.dumps({"done": True, **counts}) + b"\n"
+
+MAX_STREAM_TEXT_LENGTH = 1000
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+@router.get("/audio/{key}.mp3")
+async def get_audio(key: str, request: Request):
+    """Serve stored audio by its content key"""
+    store = get_audio_store()
+    if not KEY_PATTERN.fullmatch(key) or not await store.exists(key):
+        raise _audio_not_found()
+    
+    return await _serve_audio(request, store, key)
+
+@router.get("/stream")
+async def stream_voice(
+    request: Request,
+    text: str = Query(..., min_length=1, max_length=MAX_STREAM_TEXT_LENGTH),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Stream speech for text as it is synthesized, or from the audio cache once stored"""
+    voice_service = get_voice_service()
+    store = voice_service.store
+    key = voice_service.audio_key(text)
+    
+    if await store.exists(key):
+        return await _serve_audio(request, store, key)
+    
+    chunks = voice_service.stream_audio(text)
+    try:
+        # Wait for the first chunk so provider errors still get a proper status code
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
     except Exception as e:
         raise HTTPException(
-            status_code=500,
-            detail=f"Batch voice generation failed: {str(e)}"
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Voice streaming failed: {str(e)}"
         )
+    
+    async def relay():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+    
+    return StreamingResponse(
+        relay(),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-store", "Content-Location": store.url(key)}
+    )
+
+def _audio_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Audio not found"
+    )
+
+def _audio_headers(key: str) -> dict:
+    # Content-addressed audio never changes, so clients may cache it forever
+    return {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{key}"',
+        "Accept-Ranges": "bytes"
+    }
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive byte range for a single-range header; raises ValueError if unsatisfiable"""
+    match = RANGE_PATTERN.fullmatch(range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # Malformed and multi-range requests get the whole file
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(range_header)
+    return start, end
+
+async def _serve_audio(request: Request, store: BlobStore, key: str) -> Response:
+    """Send stored audio, or 404 if it was evicted after the caller saw it exist"""
+    headers = _audio_headers(key)
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and any(tag.strip() in (headers["ETag"], f"W/{headers['ETag']}", "*") for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == headers["ETag"]):
+        size = await store.size(key)
+        if size is None:
+            raise _audio_not_found()
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+        if byte_range:
+            start, end = byte_range
+            data = await store.read_range(key, start, end)
+            if data is None:
+                raise _audio_not_found()
+            return Response(
+                data,
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type="audio/mpeg",
+                headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"}
+            )
+    
+    # Servers supporting the ASGI pathsend extension send the file without copying it
+    local_path = store.local_path(key)
+    if local_path:
+        try:
+            # Checked here, as FileResponse would fail with a 500 once the response has started
+            stat_result = await asyncio.to_thread(os.stat, local_path)
+        except FileNotFoundError:
+            raise _audio_not_found()
+        return FileResponse(local_path, stat_result=stat_result, media_type="audio/mpeg", headers=headers)
+    
+    data = await store.read(key)
+    if data is None:
+        raise _audio_not_found()
+    return Response(data, media_type="audio/mpeg", headers=headers)
+
+@router.get("/phrases", response_model=dict)
+async def get_phrase_library(
+    language: Language = Language.english,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Get the pre-generated audio for common Master Lee phrases"""
+    return {
+        "success": True,
+        "language": language.value,
+        "version": PHRASE_LIBRARY_VERSION,
+        "phrases": get_voice_service().get_phrase_library(language.value)
+    }
 
 @router.get("/voices", response_model=dict)
-async def get_available_voices(current_user: UserInDB = Depends(get_current_user)):
+async def get_available_voices(current_user: Principal = Depends(get_current_principal)):
     """Get list of available voices"""
     return {
         "success": True,
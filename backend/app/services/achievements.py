@@ -0,0 +1,151 @@
+"""
+Achievements for ChiZen Fitness
+Achievements are declared as data: each unlocks once a metric reaches a
+threshold. Domain events (a routine completion, an XP award, a streak change)
+report the metrics they changed, only the rules on those metrics are checked,
+and each unlock is stored once with the time it happened.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+# Add an entry here to add an achievement; metrics are reported by record_achievement_event callers
+ACHIEVEMENTS = [
+    {
+        "id": "first_steps",
+        "title": "First Steps",
+        "description": "Complete your very first routine",
+        "icon": "🌱",
+        "category": "sessions",
+        "metric": "total_sessions",
+        "threshold": 1
+    },
+    {
+        "id": "getting_started",
+        "title": "Getting Started",
+        "description": "Complete 10 practice sessions",
+        "icon": "🌿",
+        "category": "sessions",
+        "metric": "total_sessions",
+        "threshold": 10
+    },
+    {
+        "id": "dedicated_practitioner",
+        "title": "Dedicated Practitioner",
+        "description": "Complete 50 practice sessions",
+        "icon": "🥋",
+        "category": "sessions",
+        "metric": "total_sessions",
+        "threshold": 50
+    },
+    {
+        "id": "week_warrior",
+        "title": "Week Warrior",
+        "description": "Complete 7 days in a row",
+        "icon": "🔥",
+        "category": "streak",
+        "metric": "current_streak",
+        "threshold": 7
+    },
+    {
+        "id": "month_master",
+        "title": "Month Master",
+        "description": "Complete 30 days in a row",
+        "icon": "👑",
+        "category": "streak",
+        "metric": "current_streak",
+        "threshold": 30
+    },
+    {
+        "id": "xp_collector",
+        "title": "XP Collector",
+        "description": "Earn 1000 XP total",
+        "icon": "💎",
+        "category": "xp",
+        "metric": "total_xp",
+        "threshold": 1000
+    }
+]
+
+ACHIEVEMENTS_BY_METRIC: Dict[str, List[Dict]] = defaultdict(list)
+for _achievement in ACHIEVEMENTS:
+    ACHIEVEMENTS_BY_METRIC[_achievement["metric"]].append(_achievement)
+
+def unlock_id(user_id: str, achievement_id: str) -> str:
+    return f"{user_id}:{achievement_id}"
+
+async def record_achievement_event(
+    db,
+    user_id: str,
+    metrics: Dict[str, int],
+    at: Optional[datetime] = None
+) -> List[Dict]:
+    """Unlock the achievements the event's metrics reached; returns those unlocked just now"""
+    reached = [
+        achievement
+        for metric, value in metrics.items()
+        for achievement in ACHIEVEMENTS_BY_METRIC.get(metric, [])
+        if value is not None and value >= achievement["threshold"]
+    ]
+    if not reached:
+        return []
+
+    unlocked_at = at or datetime.utcnow()
+    # Upserts that only insert, so replayed events keep the original unlock time
+    result = await db.user_achievements.bulk_write([
+        UpdateOne(
+            {"_id": unlock_id(user_id, achievement["id"])},
+            {"$setOnInsert": {
+                "user_id": user_id,
+                "achievement_id": achievement["id"],
+                "unlocked_at": unlocked_at
+            }},
+            upsert=True
+        )
+        for achievement in reached
+    ], ordered=False)
+    return [reached[index] for index in result.upserted_ids]
+
+async def list_achievements(db, user_id: str) -> List[Dict]:
+    """Every achievement with the user's unlock state, from one indexed query"""
+    unlocks = await db.user_achievements.find(
+        {"user_id": user_id},
+        {"achievement_id": 1, "unlocked_at": 1}
+    ).to_list(length=None)
+    unlocked_at = {unlock["achievement_id"]: unlock["unlocked_at"] for unlock in unlocks}
+
+    return [
+        {
+            "id": achievement["id"],
+            "title": achievement["title"],
+            "description": achievement["description"],
+            "icon": achievement["icon"],
+            "category": achievement["category"],
+            "threshold": achievement["threshold"],
+            "unlocked": achievement["id"] in unlocked_at,
+            "date_unlocked": unlocked_at.get(achievement["id"])
+        }
+        for achievement in ACHIEVEMENTS
+    ]
+
+async def migrate_achievements(db) -> int:
+    """Unlock what existing users have already earned, dated at their last activity"""
+    total_sessions = {}
+    async for rollup in db.activity_rollups.find({}, {"total_sessions": 1}):
+        total_sessions[rollup["_id"]] = rollup.get("total_sessions", 0)
+
+    unlocked = 0
+    async for user in db.users.find({}, {"total_xp": 1, "streak_data": 1, "last_active": 1, "created_at": 1}):
+        unlocked += len(await record_achievement_event(
+            db,
+            user["_id"],
+            {
+                "total_sessions": total_sessions.get(user["_id"], 0),
+                "total_xp": user.get("total_xp", 0),
+                "current_streak": (user.get("streak_data") or {}).get("current", 0)
+            },
+            at=user.get("last_active") or user.get("created_at")
+        ))
+    return unlocked
@@ -0,0 +1,149 @@
+"""
+Per-user activity rollups for ChiZen Fitness
+Each routine completion is folded into one small document per user: lifetime
+totals plus, for every month, a bitmap of the days practiced and that month's
+counters. The progress dashboard reads that single document instead of
+scanning the user's routine history.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+DEFAULT_FOCUS = "mindfulness"
+
+def month_key(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+def _focus_key(focus_area: Optional[str]) -> str:
+    # Field names may not contain dots or start with $
+    return (focus_area or DEFAULT_FOCUS).replace(".", " ").lstrip("$") or DEFAULT_FOCUS
+
+def completion_update(
+    completed_at: datetime,
+    xp_earned: int,
+    minutes: int,
+    focus_area: Optional[str],
+    completion_rate: float
+) -> Dict:
+    """$inc and $bit operands that fold one completion into a rollup"""
+    month = f"months.{month_key(completed_at)}"
+    return {
+        "$bit": {f"{month}.days": {"or": 1 << (completed_at.day - 1)}},
+        "$inc": {
+            "total_sessions": 1,
+            "total_minutes": minutes,
+            "total_xp_earned": xp_earned,
+            # Summed so the average completion rate needs no history
+            "completion_rate_sum": completion_rate,
+            f"{month}.sessions": 1,
+            f"{month}.minutes": minutes,
+            f"{month}.xp_earned": xp_earned,
+            f"{month}.focus.{_focus_key(focus_area)}": 1
+        }
+    }
+
+# Routines recently folded into a rollup, so a retried completion is not counted twice
+APPLIED_ROUTINES_KEPT = 50
+
+async def record_completion(db, user_id: str, routine: Dict, completion_rate: float) -> int:
+    """Fold a completed routine into the user's rollup once, returning their session total"""
+    update = completion_update(
+        routine["completed_at"],
+        routine.get("xp_earned", 0),
+        routine.get("total_duration", 0),
+        routine.get("focus_area"),
+        completion_rate
+    )
+    update["$set"] = {"updated_at": datetime.utcnow()}
+    update["$push"] = {"applied_routines": {"$each": [routine["_id"]], "$slice": -APPLIED_ROUTINES_KEPT}}
+    query = {"_id": user_id, "applied_routines": {"$ne": routine["_id"]}}
+    try:
+        rollup = await db.activity_rollups.find_one_and_update(
+            query, update, projection={"total_sessions": 1}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Either the rollup already counts this routine or a concurrent completion created it first
+        rollup = await db.activity_rollups.find_one_and_update(
+            query, update, projection={"total_sessions": 1}, return_document=ReturnDocument.AFTER
+        )
+    if rollup is None:
+        rollup = await db.activity_rollups.find_one({"_id": user_id}, {"total_sessions": 1})
+    return rollup["total_sessions"]
+
+def _practiced_on(rollup: Dict, day: date) -> bool:
+    days = rollup.get("months", {}).get(month_key(day), {}).get("days", 0)
+    return bool(days >> (day.day - 1) & 1)
+
+def summarize_activity(rollup: Optional[Dict], today: date) -> Dict:
+    """Dashboard numbers from a rollup, zeros for a user with no completions"""
+    rollup = rollup or {}
+    total_sessions = rollup.get("total_sessions", 0)
+    month = rollup.get("months", {}).get(month_key(today), {})
+    month_sessions = month.get("sessions", 0)
+    focus_counts = month.get("focus", {})
+
+    return {
+        "total_sessions": total_sessions,
+        "total_minutes": rollup.get("total_minutes", 0),
+        "completion_rate": round(100 * rollup.get("completion_rate_sum", 0) / total_sessions, 1) if total_sessions else 0.0,
+        # Oldest first, ending today
+        "last_7_days": [_practiced_on(rollup, today - timedelta(days=offset)) for offset in range(6, -1, -1)],
+        "monthly_stats": {
+            "total_sessions": month_sessions,
+            "active_days": bin(month.get("days", 0)).count("1"),
+            "avg_duration": round(month.get("minutes", 0) / month_sessions) if month_sessions else 0,
+            "favorite_focus": max(focus_counts, key=focus_counts.get) if focus_counts else DEFAULT_FOCUS,
+            "total_xp_earned": month.get("xp_earned", 0)
+        }
+    }
+
+async def migrate_activity_rollups(db) -> int:
+    """Build rollups from routine history for users who completed routines before rollups existed"""
+    has_rollup = set(await db.activity_rollups.distinct("_id"))
+    rollups: Dict[str, Dict] = {}
+
+    cursor = db.routines.find(
+        {"completed_at": {"$ne": None}},
+        {"user_id": 1, "completed_at": 1, "xp_earned": 1, "completion_xp": 1, "total_duration": 1, "focus_area": 1}
+    )
+    async for routine in cursor:
+        if routine.get("user_id") is None or routine["user_id"] in has_rollup:
+            continue
+        # Block counts were not stored; XP is awarded in proportion to them
+        completion_rate = min(routine.get("xp_earned", 0) / (routine.get("completion_xp") or 50), 1.0)
+        update = completion_update(
+            routine["completed_at"],
+            routine.get("xp_earned", 0),
+            routine.get("total_duration", 0),
+            routine.get("focus_area"),
+            completion_rate
+        )
+        rollup = rollups.setdefault(routine["user_id"], {"_id": routine["user_id"]})
+        for path, mask in update["$bit"].items():
+            _set_path(rollup, path, _get_path(rollup, path) | mask["or"])
+        for path, amount in update["$inc"].items():
+            _set_path(rollup, path, _get_path(rollup, path) + amount)
+
+    migrated = 0
+    for rollup in rollups.values():
+        rollup["updated_at"] = datetime.utcnow()
+        try:
+            await db.activity_rollups.insert_one(rollup)
+            migrated += 1
+        except DuplicateKeyError:
+            # A completion created the rollup meanwhile; it already counts from here on
+            pass
+    return migrated
+
+def _get_path(document: Dict, path: str):
+    for part in path.split("."):
+        document = document.get(part, {})
+    return document or 0
+
+def _set_path(document: Dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[leaf] = value
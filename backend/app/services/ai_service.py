@@ -1,17 +1,132 @@
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, APIConnectionError, RateLimitError, InternalServerError
+import httpx
 import os
 import json
 import asyncio
-from typing import Dict, List, Optional
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
 import uuid
 
+from .routine_composer import compose_routine
+
+# Errors worth retrying: network failures, timeouts, 429s and 5xx responses
+TRANSIENT_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, asyncio.TimeoutError)
+
+SYSTEM_PROMPT = "You are Master Lee, a wise Tai Chi instructor and wellness coach. Generate personalized wellness routines combining Tai Chi, breathwork, and bodyweight exercises. Always respond with valid JSON only."
+
+class RoutineBlockParser:
+    """Incrementally pulls complete elements of the top-level "blocks" array out of streamed JSON"""
+    
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._blocks_depth = None
+        self._block_start = None
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """Add streamed text and return any blocks completed by it"""
+        self.text += chunk
+        blocks = []
+        text = self.text
+        
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+            
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                if c == "[" and self._depth == 1 and self._last_string == "blocks":
+                    self._blocks_depth = self._depth + 1
+                elif c == "{" and self._depth == self._blocks_depth:
+                    self._block_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._blocks_depth is None:
+                    continue
+                if c == "}" and self._depth == self._blocks_depth and self._block_start is not None:
+                    try:
+                        blocks.append(json.loads(text[self._block_start:i + 1]))
+                    except ValueError:
+                        pass
+                    self._block_start = None
+                elif c == "]" and self._depth < self._blocks_depth:
+                    self._blocks_depth = None
+        
+        self._pos = len(text)
+        return blocks
+
+def build_user_profile(user) -> Dict:
+    """Build the generator profile from a user's fitness level and preferences"""
+    # Handle preferences as dict (demo mode) or model (real user)
+    prefs = user.preferences
+    if isinstance(prefs, dict):
+        return {
+            "fitness_level": user.fitness_level,
+            "duration": prefs.get("duration", 15),
+            "focus_areas": prefs.get("focus_areas", ["flexibility", "mindfulness"]),
+            "language": prefs.get("language", "en")
+        }
+    return {
+        "fitness_level": user.fitness_level,
+        "duration": prefs.duration,
+        "focus_areas": prefs.focus_areas,
+        "language": prefs.language
+    }
+
+def wants_ai_routines(user) -> bool:
+    """Whether the user wants AI routines rather than locally composed ones"""
+    prefs = user.preferences
+    if isinstance(prefs, dict):
+        return prefs.get("ai_routines", True)
+    return prefs.ai_routines
+
 class RoutineGenerator:
     def __init__(self):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
-        self.client = AsyncOpenAI(api_key=api_key)
+        
+        max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+        self.call_timeout = float(os.getenv("OPENAI_CALL_TIMEOUT", "30"))
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        self.backoff_base = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+        # 0 disables hedging; e.g. 95 fires a backup request once p95 latency is exceeded
+        self.hedge_percentile = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "0"))
+        self._latencies = deque(maxlen=200)
+        
+        # One keep-alive pool per worker; retries are handled here, not by the SDK
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=120
+            ),
+            timeout=httpx.Timeout(self.call_timeout, connect=5.0)
+        )
+        self.client = AsyncOpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+    
+    async def aclose(self):
+        await self.client.close()
         
     async def generate_daily_routine(self, user_profile: Dict) -> Dict:
         """Generate a personalized daily routine using GPT-4o"""
@@ -20,21 +135,16 @@ class RoutineGenerator:
         prompt = self._build_routine_prompt(user_profile)
         
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are Master Lee, a wise Tai Chi instructor and wellness coach. Generate personalized wellness routines combining Tai Chi, breathwork, and bodyweight exercises. Always respond with valid JSON only."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
+            response = await self._complete_with_retries([
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ])
             
             routine_data = json.loads(response.choices[0].message.content)
             
@@ -49,6 +159,127 @@ class RoutineGenerator:
             print(f"Error generating routine: {e}")
             return self._get_fallback_routine(user_profile)
     
+    async def stream_daily_routine(self, user_profile: Dict) -> AsyncIterator[Tuple[str, Dict]]:
+        """Stream a routine, yielding ("block", block) as each block completes, then ("routine", routine)"""
+        prompt = self._build_routine_prompt(user_profile)
+        parser = RoutineBlockParser()
+        emitted = 0
+        
+        try:
+            stream = await self._open_stream([
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ])
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    for block in parser.feed(delta):
+                        emitted += 1
+                        yield "block", block
+            
+            routine_data = json.loads(parser.text)
+        except Exception as e:
+            print(f"Error streaming routine: {e}")
+            # Only fall back if the client has not already started rendering blocks
+            if emitted:
+                raise
+            routine_data = self._get_fallback_routine(user_profile)
+            for block in routine_data["blocks"]:
+                yield "block", block
+            yield "routine", routine_data
+            return
+        
+        routine_data["routine_id"] = str(uuid.uuid4())
+        routine_data["generated_at"] = datetime.utcnow().isoformat()
+        routine_data["user_preferences"] = user_profile
+        yield "routine", routine_data
+    
+    async def _open_stream(self, messages: List[Dict]):
+        """Open a streaming completion, retrying transient errors before the first token"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model="gpt-4o",
+                        messages=messages,
+                        temperature=0.7,
+                        response_format={"type": "json_object"},
+                        stream=True
+                    ),
+                    timeout=self.call_timeout
+                )
+            except TRANSIENT_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+    
+    async def _complete_with_retries(self, messages: List[Dict]):
+        """Call the model under a per-attempt deadline, retrying transient errors"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await asyncio.wait_for(self._hedged_completion(messages), timeout=self.call_timeout)
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                # Full jitter keeps retrying workers from synchronising
+                delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+                print(f"Transient OpenAI error ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+    
+    async def _hedged_completion(self, messages: List[Dict]):
+        """Fire a second request if the first is slower than the hedge percentile"""
+        first = asyncio.create_task(self._create_completion(messages))
+        tasks = [first]
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is None:
+                return await first
+            
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                tasks.append(asyncio.create_task(self._create_completion(messages)))
+            
+            # Return the first successful response, or the last error
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def _create_completion(self, messages: List[Dict]):
+        started = time.monotonic()
+        response = await self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.7,
+            response_format={"type": "json_object"}
+        )
+        self._latencies.append(time.monotonic() - started)
+        return response
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Latency at the configured percentile, once enough calls were observed"""
+        if not self.hedge_percentile or len(self._latencies) < 20:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return ordered[index]
+    
     def _build_routine_prompt(self, user_profile: Dict) -> str:
         """Build the AI prompt based on user preferences"""
         
@@ -99,58 +330,29 @@ class RoutineGenerator:
     
     def _get_fallback_routine(self, user_profile: Dict) -> Dict:
         """Fallback routine if AI generation fails"""
-        
-        duration = user_profile.get("duration", 15)
-        
-        return {
-            "routine_id": str(uuid.uuid4()),
-            "title": "Essential Wellness Flow",
-            "total_duration": duration,
-            "focus_area": "Balance and Mindfulness",
-            "difficulty_level": 2,
-            "blocks": [
-                {
-                    "type": "mind",
-                    "name": "Centering Breath",
-                    "duration_seconds": 180,
-                    "instructions": [
-                        "Sit comfortably with spine straight",
-                        "Close your eyes and breathe naturally",
-                        "Focus on your breath for 3 minutes"
-                    ],
-                    "difficulty": 1,
-                    "audio_cue": "Welcome to your practice. Let's begin by finding your center through mindful breathing.",
-                    "benefits": ["Reduces stress", "Improves focus"]
-                },
-                {
-                    "type": "move",
-                    "name": "Flowing Water",
-                    "duration_seconds": 420,
-                    "instructions": [
-                        "Stand with feet shoulder-width apart",
-                        "Raise arms slowly like flowing water",
-                        "Move with smooth, continuous motion",
-                        "Focus on breath and movement harmony"
-                    ],
-                    "difficulty": 2,
-                    "audio_cue": "Move like water, smooth and continuous. Let your body flow with natural grace.",
-                    "benefits": ["Improves flexibility", "Enhances coordination"]
-                },
-                {
-                    "type": "core",
-                    "name": "Gentle Strength",
-                    "duration_seconds": 300,
-                    "instructions": [
-                        "Modified plank against wall",
-                        "Hold for 30 seconds, rest 30 seconds",
-                        "Repeat 5 times with mindful breathing"
-                    ],
-                    "difficulty": 2,
-                    "audio_cue": "Build strength from your center. Breathe deeply and hold with intention.",
-                    "benefits": ["Strengthens core", "Improves posture"]
-                }
-            ],
-            "completion_xp": 75,
-            "daily_wisdom": "The journey of a thousand miles begins with a single step. Today, you take that step.",
-            "generated_at": datetime.utcnow().isoformat()
-        }
\ No newline at end of file
+        return {**compose_routine(user_profile), "is_fallback": True}
+
+_routine_generator: Optional[RoutineGenerator] = None
+
+async def start_routine_generator():
+    """Create the worker's shared routine generator"""
+    global _routine_generator
+    try:
+        _routine_generator = RoutineGenerator()
+        print("✅ Routine generator ready")
+    except ValueError as e:
+        print(f"❌ Routine generator unavailable: {e}")
+
+async def stop_routine_generator():
+    """Close the shared generator's connection pool"""
+    global _routine_generator
+    if _routine_generator:
+        await _routine_generator.aclose()
+        _routine_generator = None
+
+def get_routine_generator() -> RoutineGenerator:
+    """Return the shared routine generator, creating it if startup skipped it"""
+    global _routine_generator
+    if _routine_generator is None:
+        _routine_generator = RoutineGenerator()
+    return _routine_generator
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+Background routine audio for ChiZen Fitness
+Creating a routine queues a job in Mongo and returns right away. Workers
+synthesize the block cues and write each audio_url back as soon as it is
+ready. Jobs are claimed under a lease, so a job held by a worker that died
+is picked up again once the lease runs out. A user's jobs beyond the per-user
+cap wait as "throttled" until one of their running jobs finishes.
+"""
+import asyncio
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ..core.database import get_database, get_redis, invalidate_routine_cache
+from .voice_service import get_voice_service
+
+ACTIVE_STATUSES = ["pending", "running"]
+UNFINISHED_STATUSES = ["throttled", *ACTIVE_STATUSES]
+
+AUDIO_JOB_LEASE_SECONDS = 120
+AUDIO_JOB_MAX_ATTEMPTS = 3
+# A failed attempt is retried after this, doubling with every attempt
+AUDIO_JOB_RETRY_SECONDS = int(os.getenv("AUDIO_JOB_RETRY_SECONDS", "30"))
+AUDIO_JOBS_MAX_PER_USER = int(os.getenv("AUDIO_JOBS_MAX_PER_USER", "3"))
+
+async def enqueue_routine_audio(db, routine: Dict, language: str = "en", replace: bool = False) -> Optional[Dict]:
+    """Queue audio for a routine's cues in the user's language; None when there is nothing to do"""
+    if not get_voice_service().api_key:
+        return None
+
+    blocks = [
+        {"index": index, "text": block["audio_cue"], "audio_url": None, "error": None}
+        for index, block in enumerate(routine.get("blocks", []))
+        if block.get("audio_cue") and not block.get("audio_url")
+    ]
+    if not blocks:
+        return None
+
+    active_jobs = await db.audio_jobs.count_documents({
+        "user_id": routine["user_id"],
+        "status": {"$in": ACTIVE_STATUSES},
+        "_id": {"$ne": routine["_id"]}
+    })
+
+    now = datetime.utcnow()
+    job = {
+        "_id": routine["_id"],
+        "user_id": routine["user_id"],
+        "day": routine.get("day"),
+        # Over the cap the job waits its turn instead of being dropped
+        "status": "throttled" if active_jobs >= AUDIO_JOBS_MAX_PER_USER else "pending",
+        "language": getattr(language, "value", language),
+        "blocks": blocks,
+        "attempts": 0,
+        "lease_until": None,
+        "not_before": None,
+        # Writes from a worker still holding a replaced job are ignored
+        "revision": uuid.uuid4().hex,
+        "created_at": now,
+        "updated_at": now
+    }
+
+    if replace:
+        await db.audio_jobs.replace_one({"_id": job["_id"]}, job, upsert=True)
+    else:
+        try:
+            await db.audio_jobs.insert_one(job)
+        except DuplicateKeyError:
+            return await db.audio_jobs.find_one({"_id": job["_id"]})
+
+    audio_job_worker.notify()
+    return job
+
+class AudioJobWorker:
+    """Claims queued audio jobs and synthesizes them with the shared voice service"""
+
+    def __init__(self, concurrency: int = 2, poll_seconds: float = 5):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            db = get_database()
+            job = None
+            try:
+                job = await self._claim(db)
+                if job:
+                    await self._process(db, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Audio job failed: {e}")
+
+            if job is None:
+                # Idle: wake on the next enqueue, or poll for jobs queued by other processes
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim(self, db) -> Optional[Dict]:
+        now = datetime.utcnow()
+        return await db.audio_jobs.find_one_and_update(
+            {"$or": [
+                # Jobs backing off after a failure wait until not_before
+                {"status": "pending", "not_before": {"$not": {"$gt": now}}},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_until": now + timedelta(seconds=AUDIO_JOB_LEASE_SECONDS),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _process(self, db, job: Dict):
+        # Identical cues within a routine are synthesized once
+        positions: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for position, block in enumerate(job["blocks"]):
+            if block["audio_url"] is None:
+                positions[block["text"]].append((position, block["index"]))
+
+        voice_service = get_voice_service()
+        failed = False
+        for next_result in asyncio.as_completed([
+            voice_service.generate_audio_result(text, job.get("language", "en")) for text in positions
+        ]):
+            result = await next_result
+            failed = failed or result["error"] is not None
+            await self._record(db, job, positions[result["text"]], result)
+
+        now = datetime.utcnow()
+        job_update = {"status": "done", "lease_until": None, "updated_at": now}
+        if failed and job["attempts"] < AUDIO_JOB_MAX_ATTEMPTS:
+            job_update["status"] = "pending"
+            job_update["not_before"] = now + timedelta(seconds=AUDIO_JOB_RETRY_SECONDS * 2 ** (job["attempts"] - 1))
+        elif failed:
+            job_update["status"] = "failed"
+
+        await db.audio_jobs.update_one(
+            {"_id": job["_id"], "revision": job["revision"]},
+            {"$set": job_update}
+        )
+        if job_update["status"] != "pending":
+            await self._promote_throttled(db, job["user_id"])
+
+        # The cached copy of today's routine predates its audio
+        redis_client = get_redis()
+        if redis_client and job.get("day"):
+            await invalidate_routine_cache(redis_client, job["user_id"], job["day"])
+
+    async def _promote_throttled(self, db, user_id: str):
+        """Queue the user's oldest throttled job once they are back under the cap"""
+        active_jobs = await db.audio_jobs.count_documents({"user_id": user_id, "status": {"$in": ACTIVE_STATUSES}})
+        if active_jobs >= AUDIO_JOBS_MAX_PER_USER:
+            return
+        promoted = await db.audio_jobs.find_one_and_update(
+            {"user_id": user_id, "status": "throttled"},
+            {"$set": {"status": "pending", "updated_at": datetime.utcnow()}},
+            sort=[("created_at", 1)]
+        )
+        if promoted:
+            self.notify()
+
+    async def _record(self, db, job: Dict, positions: List[Tuple[int, int]], result: Dict):
+        """Publish one cue's result to the job and to the routine's blocks"""
+        now = datetime.utcnow()
+        # Each finished cue extends the lease, so a long job is not reclaimed while it progresses
+        job_update = {"lease_until": now + timedelta(seconds=AUDIO_JOB_LEASE_SECONDS), "updated_at": now}
+        for position, _ in positions:
+            job_update[f"blocks.{position}.audio_url"] = result["audio_url"]
+            job_update[f"blocks.{position}.error"] = result["error"]
+        await db.audio_jobs.update_one(
+            {"_id": job["_id"], "revision": job["revision"]},
+            {"$set": job_update}
+        )
+
+        if result["audio_url"]:
+            # Only while the routine still has this cue at those blocks
+            await db.routines.update_one(
+                {"_id": job["_id"], **{f"blocks.{index}.audio_cue": result["text"] for _, index in positions}},
+                {"$set": {f"blocks.{index}.audio_url": result["audio_url"] for _, index in positions}}
+            )
+
+audio_job_worker = AudioJobWorker(
+    concurrency=int(os.getenv("AUDIO_JOB_WORKERS", "2")),
+    poll_seconds=float(os.getenv("AUDIO_JOB_POLL_SECONDS", "5"))
+)
+
+async def start_audio_jobs():
+    """Start this worker's audio job consumers"""
+    audio_job_worker.start()
+    print(f"✅ Audio job worker ready ({audio_job_worker.concurrency} consumers)")
+
+async def stop_audio_jobs():
+    await audio_job_worker.stop()
@@ -0,0 +1,207 @@
+"""
+Content-addressed audio storage for ChiZen Fitness
+Synthesized speech is stored under a hash of everything that determines the
+audio, so an identical cue is only ever paid for once.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+
+KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+def audio_cache_key(text: str, voice_id: str, model_id: str, voice_settings: Dict) -> str:
+    """Hash of the text and every synthesis parameter that changes the audio"""
+    payload = json.dumps(
+        {"text": text, "voice_id": voice_id, "model_id": model_id, "voice_settings": voice_settings},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class BlobStore(ABC):
+    """Storage backend for audio blobs addressed by cache key"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}.mp3"
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path servers can send without copying, if the backend has one"""
+        return None
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def read(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def write(self, key: str, data: bytes):
+        ...
+
+    async def size(self, key: str) -> Optional[int]:
+        data = await self.read(key)
+        return None if data is None else len(data)
+
+    async def read_range(self, key: str, start: int, end: int) -> Optional[bytes]:
+        """Bytes start..end inclusive"""
+        data = await self.read(key)
+        return None if data is None else data[start:end + 1]
+
+class LocalBlobStore(BlobStore):
+    """Blobs on the local filesystem, evicting least recently used past max_bytes
+
+    Each worker tracks usage of the shared directory on its own, so the bound
+    is approximate when several workers write to it.
+    """
+
+    def __init__(self, root: str, max_bytes: int, base_url: str):
+        super().__init__(base_url)
+        self.root = root
+        self.max_bytes = max_bytes
+        self._sizes: Optional["OrderedDict[str, int]"] = None
+        self._total_bytes = 0
+
+    def path(self, key: str) -> str:
+        if not KEY_PATTERN.fullmatch(key):
+            raise ValueError(f"Invalid audio key: {key}")
+        return os.path.join(self.root, key[:2], f"{key}.mp3")
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path(key)
+
+    async def exists(self, key: str) -> bool:
+        await self._load_index()
+        if key in self._sizes:
+            self._sizes.move_to_end(key)
+            return True
+        # Another worker may have written it since the index was loaded
+        size = await asyncio.to_thread(self._file_size, key)
+        if size is None:
+            return False
+        self._track(key, size)
+        return True
+
+    async def read(self, key: str) -> Optional[bytes]:
+        if not await self.exists(key):
+            return None
+        try:
+            return await asyncio.to_thread(self._read_file, key)
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+
+    async def write(self, key: str, data: bytes):
+        await self._load_index()
+        await asyncio.to_thread(self._write_file, key, data)
+        self._track(key, len(data))
+        await self._evict()
+
+    async def size(self, key: str) -> Optional[int]:
+        if not await self.exists(key):
+            return None
+        return self._sizes.get(key)
+
+    async def read_range(self, key: str, start: int, end: int) -> Optional[bytes]:
+        if not await self.exists(key):
+            return None
+        try:
+            return await asyncio.to_thread(self._read_file_range, key, start, end)
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+
+    def _file_size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def _read_file(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def _read_file_range(self, key: str, start: int, end: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def _write_file(self, key: str, data: bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a partial file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    async def _load_index(self):
+        if self._sizes is None:
+            self._sizes = await asyncio.to_thread(self._scan)
+            self._total_bytes = sum(self._sizes.values())
+
+    def _scan(self) -> "OrderedDict[str, int]":
+        """Existing blobs, oldest modified first"""
+        entries = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    key, ext = os.path.splitext(filename)
+                    if ext != ".mp3" or not KEY_PATTERN.fullmatch(key):
+                        continue
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    entries.append((stat.st_mtime, key, stat.st_size))
+        entries.sort()
+        return OrderedDict((key, size) for _, key, size in entries)
+
+    def _track(self, key: str, size: int):
+        self._forget(key)
+        self._sizes[key] = size
+        self._total_bytes += size
+
+    def _forget(self, key: str):
+        size = self._sizes.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    async def _evict(self):
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._sizes) > 1:
+            key, size = self._sizes.popitem(last=False)
+            self._total_bytes -= size
+            evicted.append(key)
+        if evicted:
+            await asyncio.to_thread(self._delete_files, evicted)
+
+    def _delete_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+_audio_store: Optional[BlobStore] = None
+
+def get_audio_store() -> BlobStore:
+    """Return the configured audio store, creating it on first use"""
+    global _audio_store
+    if _audio_store is None:
+        backend = os.getenv("AUDIO_STORE_BACKEND", "local")
+        if backend != "local":
+            raise ValueError(f"Unsupported AUDIO_STORE_BACKEND: {backend}")
+        _audio_store = LocalBlobStore(
+            root=os.getenv("AUDIO_STORE_DIR", "audio_cache"),
+            max_bytes=int(os.getenv("AUDIO_STORE_MAX_BYTES", str(1024 ** 3))),
+            base_url=os.getenv("AUDIO_BASE_URL", "/api/voice/audio")
+        )
+    return _audio_store
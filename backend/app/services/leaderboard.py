@@ -0,0 +1,202 @@
+"""
+XP leaderboard for ChiZen Fitness
+Every XP change is mirrored into a Redis sorted set, so the top of the board,
+any user's exact rank and the users around them are O(log n) lookups.
+
+The set only exists once it has been built from Mongo. Until then XP writes
+skip it and reads fall back to Mongo, and the first read starts a rebuild.
+To rebuild by hand, e.g. after restoring Mongo:
+    python -m app.services.leaderboard
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import motor.motor_asyncio
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+from ..core.database import get_redis
+
+load_dotenv()
+
+LEADERBOARD_KEY = "leaderboard:xp"
+# Mongo order for the same board, served by leaderboard_index
+LEADERBOARD_SORT = [("total_xp", -1), ("_id", 1)]
+# Set while a rebuild runs, so only one runs and live writes reach the new set too
+LEADERBOARD_REBUILD_FLAG = "leaderboard:xp:rebuilding"
+LEADERBOARD_REBUILD_KEY = "leaderboard:xp:next"
+LEADERBOARD_REBUILD_TTL_SECONDS = 600
+REBUILD_BATCH_SIZE = 1000
+
+# Never creates the live set, so a flushed Redis cannot serve a partial board
+_MIRROR_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 1 then
+    redis.call("zadd", KEYS[1], ARGV[1], ARGV[2])
+end
+if redis.call("exists", KEYS[2]) == 1 then
+    redis.call("zadd", KEYS[3], ARGV[1], ARGV[2])
+end
+return 0
+"""
+
+_rebuild_tasks: Set[asyncio.Task] = set()
+
+async def mirror_xp(user_id: str, total_xp: int):
+    """Record a user's new XP total on the leaderboard"""
+    redis_client = get_redis()
+    if not redis_client:
+        return
+    try:
+        await redis_client.eval(
+            _MIRROR_SCRIPT, 3,
+            LEADERBOARD_KEY, LEADERBOARD_REBUILD_FLAG, LEADERBOARD_REBUILD_KEY,
+            total_xp, user_id
+        )
+    except Exception as e:
+        print(f"❌ Failed to update leaderboard for {user_id}: {e}")
+
+async def remove_from_leaderboard(user_id: str):
+    redis_client = get_redis()
+    if redis_client:
+        await redis_client.zrem(LEADERBOARD_KEY, user_id)
+        await redis_client.zrem(LEADERBOARD_REBUILD_KEY, user_id)
+
+async def rebuild_leaderboard(db, redis_client) -> Optional[int]:
+    """Rebuild the sorted set from Mongo and swap it in; None if a rebuild is already running"""
+    if not await redis_client.set(LEADERBOARD_REBUILD_FLAG, "1", nx=True, ex=LEADERBOARD_REBUILD_TTL_SECONDS):
+        return None
+
+    try:
+        await redis_client.delete(LEADERBOARD_REBUILD_KEY)
+        count = 0
+        batch: Dict[str, int] = {}
+        async for user in db.users.find({}, {"total_xp": 1}):
+            batch[user["_id"]] = user.get("total_xp", 0)
+            if len(batch) == REBUILD_BATCH_SIZE:
+                count += await _add_batch(redis_client, batch)
+                batch = {}
+        if batch:
+            count += await _add_batch(redis_client, batch)
+
+        if count:
+            await redis_client.rename(LEADERBOARD_REBUILD_KEY, LEADERBOARD_KEY)
+        return count
+    finally:
+        await redis_client.delete(LEADERBOARD_REBUILD_FLAG)
+
+async def _add_batch(redis_client, batch: Dict[str, int]) -> int:
+    # GT keeps a newer total mirrored while the scan was running
+    await redis_client.zadd(LEADERBOARD_REBUILD_KEY, batch, gt=True)
+    return len(batch)
+
+def schedule_rebuild(db):
+    """Rebuild in the background after a cold start"""
+    redis_client = get_redis()
+    if redis_client and not _rebuild_tasks:
+        task = asyncio.create_task(_rebuild_in_background(db, redis_client))
+        _rebuild_tasks.add(task)
+        task.add_done_callback(_rebuild_tasks.discard)
+
+async def _rebuild_in_background(db, redis_client):
+    try:
+        count = await rebuild_leaderboard(db, redis_client)
+        if count is not None:
+            print(f"✅ Rebuilt leaderboard with {count} users")
+    except Exception as e:
+        print(f"❌ Leaderboard rebuild failed: {e}")
+
+def _ranked(entries: List[Tuple[str, float]], first_position: int, first_rank: int) -> List[Tuple[str, int, int]]:
+    """(user_id, xp, rank) with tied scores sharing a rank"""
+    ranked = []
+    for offset, (user_id, score) in enumerate(entries):
+        if offset == 0:
+            rank = first_rank
+        elif score == entries[offset - 1][1]:
+            rank = ranked[-1][2]
+        else:
+            # Everyone before this entry scored strictly higher
+            rank = first_position + offset + 1
+        ranked.append((user_id, int(score), rank))
+    return ranked
+
+async def read_leaderboard(user_id: str, limit: int, around: int = 0) -> Optional[Dict]:
+    """Top entries, the user's rank and XP, and the entries around them; None until the set is built"""
+    redis_client = get_redis()
+    if not redis_client:
+        return None
+
+    try:
+        return await _read_sorted_set(redis_client, user_id, limit, around)
+    except redis.RedisError as e:
+        print(f"❌ Failed to read leaderboard: {e}")
+        return None
+
+async def _read_sorted_set(redis_client, user_id: str, limit: int, around: int) -> Optional[Dict]:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.exists(LEADERBOARD_KEY)
+        pipe.zrevrange(LEADERBOARD_KEY, 0, limit - 1, withscores=True)
+        pipe.zscore(LEADERBOARD_KEY, user_id)
+        pipe.zrevrank(LEADERBOARD_KEY, user_id)
+        exists, top, score, position = await pipe.execute()
+    if not exists:
+        return None
+
+    # Users who never earned XP may not be in the set yet
+    score = score or 0
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zcount(LEADERBOARD_KEY, f"({score}", "+inf")
+        if around and position is not None:
+            start = max(position - around, 0)
+            pipe.zrevrange(LEADERBOARD_KEY, start, position + around, withscores=True)
+        results = await pipe.execute()
+
+    nearby = []
+    if len(results) == 2:
+        # The window's first entry ranks after everyone scoring strictly more than it
+        window = results[1]
+        first_rank = await redis_client.zcount(LEADERBOARD_KEY, f"({window[0][1]}", "+inf") + 1
+        nearby = _ranked(window, start, first_rank)
+
+    return {
+        "top": _ranked(top, 0, 1),
+        "rank": results[0] + 1,
+        "total_xp": int(score),
+        "around": nearby
+    }
+
+async def main(args) -> bool:
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    )
+    db = client.chizen_fitness
+    redis_client = redis.from_url(
+        os.getenv("REDIS_URL", "redis://localhost:6379"),
+        encoding="utf-8",
+        decode_responses=True
+    )
+
+    try:
+        if args.force:
+            await redis_client.delete(LEADERBOARD_REBUILD_FLAG)
+        started = time.monotonic()
+        count = await rebuild_leaderboard(db, redis_client)
+        if count is None:
+            print("❌ A leaderboard rebuild is already running (use --force if it died)")
+            return False
+        print(f"✅ Rebuilt leaderboard with {count} users in {time.monotonic() - started:.1f}s")
+        return True
+    except Exception as e:
+        print(f"❌ Leaderboard rebuild failed: {e}")
+        return False
+    finally:
+        await redis_client.aclose()
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the Redis XP leaderboard from Mongo")
+    parser.add_argument("--force", action="store_true", help="Clear a stale rebuild flag first")
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
@@ -0,0 +1,236 @@
+"""
+Phrase audio library for ChiZen Fitness
+Master Lee's cues keep reusing the same short phrases. An offline build
+synthesizes a versioned set of them into the audio store once; at runtime a
+cue is split into library phrases and residual text, only the residue is sent
+to TTS, and the MP3 frames are joined without re-encoding.
+
+Run after changing PHRASES or the voice, against the audio store the API
+serves from:
+    python -m app.services.phrase_library --language en
+"""
+import argparse
+import asyncio
+import os
+import re
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Bump whenever PHRASES changes so runtimes stop using the previous build
+PHRASE_LIBRARY_VERSION = 1
+
+PHRASES: Dict[str, List[str]] = {
+    "en": [
+        "Welcome to your practice.",
+        "Let's begin.",
+        "Breathe in.",
+        "Breathe out.",
+        "Breathe in slowly.",
+        "Breathe out slowly.",
+        "Breathe deeply.",
+        "Breathe in, hold, breathe out, hold.",
+        "Take a deep breath.",
+        "Inhale.",
+        "Exhale.",
+        "Hold.",
+        "Hold position.",
+        "Hold this position.",
+        "Relax.",
+        "Relax your shoulders.",
+        "Rest.",
+        "Close your eyes.",
+        "Keep breathing.",
+        "Keep your breath smooth.",
+        "Keep your spine straight.",
+        "Move slowly and stay centered.",
+        "Move like water.",
+        "Smooth and continuous.",
+        "Flowing and continuous.",
+        "Feel your body awaken.",
+        "Switch sides.",
+        "Now the other side.",
+        "One more time.",
+        "Return to center.",
+        "Well done.",
+        "Excellent work.",
+        "Routine complete."
+    ],
+    # No Khmer or Thai recordings yet; cues in those languages are synthesized whole
+    "km": [],
+    "th": []
+}
+
+# A clause and its trailing punctuation; phrases only match on clause boundaries
+CLAUSE_PATTERN = re.compile(r"[^.,;:!?]+[.,;:!?]*")
+
+def normalize_phrase(text: str) -> str:
+    """Lowercase words without punctuation, so "breathe in," matches "Breathe in." """
+    text = text.lower().replace("’", "'")
+    return " ".join(re.sub(r"[^\w\s']", " ", text).split())
+
+class PhraseLibrary:
+    """Built phrases per language, looked up by their normalized text"""
+
+    def __init__(self, phrases: Optional[Dict[str, List[str]]] = None):
+        self._phrases = {
+            language: {normalize_phrase(text): text for text in texts}
+            for language, texts in (phrases or {}).items()
+        }
+
+    def phrases(self, language: str) -> List[str]:
+        return list(self._phrases.get(language, {}).values())
+
+    def split(self, text: str, language: str) -> List[Tuple[str, Optional[str]]]:
+        """Segments of text in order, each with its library phrase or None for residue"""
+        library = self._phrases.get(language)
+        if not library:
+            return [(text, None)]
+
+        clauses = [clause.strip() for clause in CLAUSE_PATTERN.findall(text)]
+        clauses = [clause for clause in clauses if normalize_phrase(clause)]
+        segments: List[Tuple[str, Optional[str]]] = []
+        residue: List[str] = []
+        start = 0
+        while start < len(clauses):
+            # Longest run of clauses that is a phrase wins
+            for end in range(len(clauses), start, -1):
+                phrase = library.get(normalize_phrase(" ".join(clauses[start:end])))
+                if phrase:
+                    break
+            else:
+                residue.append(clauses[start])
+                start += 1
+                continue
+
+            if residue:
+                segments.append((" ".join(residue), None))
+                residue = []
+            segments.append((" ".join(clauses[start:end]), phrase))
+            start = end
+
+        if residue:
+            segments.append((" ".join(residue), None))
+        return segments
+
+async def load_phrase_library(db, audio_key: Callable[[str], str]) -> PhraseLibrary:
+    """The current version's built phrases that match the voice producing audio_key"""
+    phrases = {}
+    async for manifest in db.phrase_libraries.find({"version": PHRASE_LIBRARY_VERSION}):
+        # Phrases built with other voice settings have other keys and are left out
+        phrases[manifest["language"]] = [
+            entry["text"] for entry in manifest["phrases"] if entry["key"] == audio_key(entry["text"])
+        ]
+    return PhraseLibrary(phrases)
+
+async def build_phrase_library(db, voice_service, language: str) -> Dict:
+    """Synthesize a language's phrases into the audio store and record the build"""
+    results = await voice_service.generate_audio_results(PHRASES[language])
+    built = [
+        {"text": result["text"], "key": voice_service.audio_key(result["text"])}
+        for result in results
+        if result["audio_url"]
+    ]
+    await db.phrase_libraries.replace_one(
+        {"_id": f"{language}:v{PHRASE_LIBRARY_VERSION}"},
+        {
+            "language": language,
+            "version": PHRASE_LIBRARY_VERSION,
+            "voice_id": voice_service.voice_id,
+            "model_id": voice_service.model_id,
+            "phrases": built,
+            "built_at": datetime.utcnow()
+        },
+        upsert=True
+    )
+    return {"built": len(built), "failed": len(results) - len(built)}
+
+# MPEG version bits: 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+# Layer III bitrates in kbit/s
+MP3_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    0: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+
+def _frame_length(header: bytes) -> Optional[int]:
+    """Length of the Layer III frame with this 4-byte header, None if it is not one"""
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    samples = 1152 if version == 3 else 576
+    padding = (header[2] >> 1) & 0x01
+    return samples // 8 * MP3_BITRATES[version][bitrate_index] * 1000 // MP3_SAMPLE_RATES[version][rate_index] + padding
+
+def mp3_frames(data: bytes) -> bytes:
+    """The audio frames of an MP3, without ID3 tags or a Xing/Info header frame"""
+    offset = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        tag_size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | data[9] & 0x7F
+        offset = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+
+    frames = []
+    first = True
+    while offset + 4 <= len(data):
+        length = _frame_length(data[offset:offset + 4])
+        if length is None or offset + length > len(data):
+            break
+        frame = data[offset:offset + length]
+        # A Xing/Info frame states this part's duration and would cut the joined audio short
+        if not (first and (b"Xing" in frame[:64] or b"Info" in frame[:64])):
+            frames.append(frame)
+        first = False
+        offset += length
+
+    if not frames:
+        raise ValueError("No MP3 frames found")
+    return b"".join(frames)
+
+def concat_mp3(parts: List[bytes]) -> bytes:
+    """Join MP3s frame by frame; every part must share the MPEG version and sample rate"""
+    joined = [mp3_frames(part) for part in parts]
+    if len({(frames[1] & 0x18, frames[2] & 0x0C) for frames in joined}) > 1:
+        raise ValueError("MP3 parts differ in sample rate")
+    return b"".join(joined)
+
+async def main(args) -> bool:
+    from .voice_service import VoiceService
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    )
+    db = client.chizen_fitness
+    voice_service = VoiceService()
+
+    try:
+        if not voice_service.api_key:
+            raise Exception("ELEVEN_LABS_KEY not configured")
+        languages = [args.language] if args.language else [language for language in PHRASES if PHRASES[language]]
+        success = True
+        for language in languages:
+            stats = await build_phrase_library(db, voice_service, language)
+            print(f"✅ Built {language} phrase library v{PHRASE_LIBRARY_VERSION}: {stats}")
+            success = success and stats["failed"] == 0
+        return success
+    except Exception as e:
+        print(f"❌ Phrase library build failed: {e}")
+        return False
+    finally:
+        await voice_service.aclose()
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthesize the phrase audio library")
+    parser.add_argument("--language", choices=list(PHRASES), help="Language to build (default: all with phrases)")
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
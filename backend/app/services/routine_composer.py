@@ -0,0 +1,272 @@
+"""
+Local routine composer for ChiZen Fitness
+Builds routines from a tagged exercise library without calling the LLM.
+Used as the AI fallback, for users who opt out of AI routines, and as the
+instant answer while an AI routine is generated in the background.
+"""
+import hashlib
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Share of the session given to each module, in the order they are practised
+MODULE_SPLIT = [("mind", 0.3), ("move", 0.4), ("core", 0.3)]
+
+DIFFICULTY_BY_LEVEL = {
+    "beginner": 1,
+    "intermediate": 3,
+    "advanced": 4
+}
+
+EXERCISE_LIBRARY = [
+    # ChiZen Mind - breathwork
+    {
+        "type": "mind", "name": "Centering Breath", "difficulty": 1, "language": "en",
+        "focus_areas": ["mindfulness", "relaxation"],
+        "instructions": ["Sit comfortably with spine straight", "Close your eyes and breathe naturally", "Follow each breath in and out"],
+        "audio_cue": "Welcome to your practice. Let's begin by finding your center through mindful breathing.",
+        "benefits": ["Reduces stress", "Improves focus"]
+    },
+    {
+        "type": "mind", "name": "Box Breathing", "difficulty": 2, "language": "en",
+        "focus_areas": ["mindfulness", "focus"],
+        "instructions": ["Breathe in for 4 counts", "Hold for 4 counts", "Exhale for 4 counts", "Hold empty for 4 counts"],
+        "audio_cue": "Breathe in, hold, breathe out, hold. Let each side of the box be even and calm.",
+        "benefits": ["Calms the nervous system", "Sharpens concentration"]
+    },
+    {
+        "type": "mind", "name": "Sunset Breathing", "difficulty": 1, "language": "en",
+        "focus_areas": ["relaxation", "sleep"],
+        "instructions": ["Sit or lie down comfortably", "Breathe in for 4 counts", "Hold for 4 counts", "Exhale slowly for 6 counts"],
+        "audio_cue": "Let go of the day's tensions with each exhale.",
+        "benefits": ["Reduces stress", "Prepares for sleep"]
+    },
+    {
+        "type": "mind", "name": "Awakening Breath", "difficulty": 2, "language": "en",
+        "focus_areas": ["energy", "focus"],
+        "instructions": ["Stand tall with relaxed shoulders", "Inhale sharply through the nose", "Exhale fully through the mouth", "Build a steady rhythm"],
+        "audio_cue": "Breathe in energy, breathe out sleepiness. Feel your body awaken.",
+        "benefits": ["Increases alertness", "Energizes the body"]
+    },
+    {
+        "type": "mind", "name": "Dantian Breathing", "difficulty": 3, "language": "en",
+        "focus_areas": ["mindfulness", "strength", "balance"],
+        "instructions": ["Place hands below your navel", "Breathe deep into the lower belly", "Feel the belly rise and fall", "Keep the chest still"],
+        "audio_cue": "Breathe into your center. Your strength begins in the dantian.",
+        "benefits": ["Builds internal energy", "Deepens breathing"]
+    },
+    {
+        "type": "mind", "name": "Breath of Stillness", "difficulty": 4, "language": "en",
+        "focus_areas": ["mindfulness", "focus"],
+        "instructions": ["Sit in a steady posture", "Slow the breath to four cycles per minute", "Rest attention at the tip of the nose", "Return gently when the mind wanders"],
+        "audio_cue": "Slow the breath until it is almost still. In stillness, the mind becomes clear.",
+        "benefits": ["Deep mental clarity", "Lowers heart rate"]
+    },
+    # ChiZen Move - Tai Chi
+    {
+        "type": "move", "name": "Flowing Water", "difficulty": 1, "language": "en",
+        "focus_areas": ["flexibility", "mindfulness"],
+        "instructions": ["Stand with feet shoulder-width apart", "Raise arms slowly like flowing water", "Move with smooth, continuous motion", "Focus on breath and movement harmony"],
+        "audio_cue": "Move like water, smooth and continuous. Let your body flow with natural grace.",
+        "benefits": ["Improves flexibility", "Enhances coordination"]
+    },
+    {
+        "type": "move", "name": "Sunrise Salutation", "difficulty": 2, "language": "en",
+        "focus_areas": ["energy", "flexibility"],
+        "instructions": ["Stand with feet hip-width apart", "Slowly raise arms overhead like the rising sun", "Flow through gentle Tai Chi movements", "Coordinate breath with movement"],
+        "audio_cue": "Move like the gentle morning breeze, flowing and continuous.",
+        "benefits": ["Improves flexibility", "Enhances coordination"]
+    },
+    {
+        "type": "move", "name": "Cloud Hands", "difficulty": 2, "language": "en",
+        "focus_areas": ["balance", "flexibility", "mindfulness"],
+        "instructions": ["Sink into a gentle horse stance", "Circle one hand up as the other circles down", "Shift your weight with each pass", "Let the waist lead the arms"],
+        "audio_cue": "Let your hands drift like clouds across the sky, unhurried and light.",
+        "benefits": ["Improves balance", "Loosens the spine"]
+    },
+    {
+        "type": "move", "name": "Parting the Wild Horse's Mane", "difficulty": 3, "language": "en",
+        "focus_areas": ["balance", "strength"],
+        "instructions": ["Step forward into a bow stance", "Separate the hands, one high and one low", "Turn the waist with each step", "Alternate sides slowly"],
+        "audio_cue": "Step with purpose, part the mane with calm strength.",
+        "benefits": ["Strengthens legs", "Improves balance"]
+    },
+    {
+        "type": "move", "name": "Golden Rooster Stands on One Leg", "difficulty": 4, "language": "en",
+        "focus_areas": ["balance", "strength", "focus"],
+        "instructions": ["Shift weight onto one leg", "Raise the opposite knee and hand together", "Hold, rooted and tall", "Lower slowly and switch sides"],
+        "audio_cue": "Root down through the standing leg. Rise like the golden rooster, steady and proud.",
+        "benefits": ["Builds single-leg stability", "Strengthens ankles"]
+    },
+    {
+        "type": "move", "name": "Gentle Flow", "difficulty": 1, "language": "en",
+        "focus_areas": ["relaxation", "sleep", "flexibility"],
+        "instructions": ["Slow, flowing movements", "Focus on releasing tension", "Move at half your normal speed"],
+        "audio_cue": "Move with the calmness of still water.",
+        "benefits": ["Releases tension", "Improves sleep quality"]
+    },
+    {
+        "type": "move", "name": "Snake Creeps Down", "difficulty": 5, "language": "en",
+        "focus_areas": ["flexibility", "strength"],
+        "instructions": ["Open into a wide stance", "Sink low over one bent leg", "Extend the other leg long", "Rise forward into a single-leg stand"],
+        "audio_cue": "Sink low like the snake, then rise with control and grace.",
+        "benefits": ["Deep hip flexibility", "Leg strength"]
+    },
+    # ChiZen Core - bodyweight strength and mobility
+    {
+        "type": "core", "name": "Gentle Strength", "difficulty": 1, "language": "en",
+        "focus_areas": ["strength"],
+        "instructions": ["Modified plank against wall", "Hold for 30 seconds, rest 30 seconds", "Repeat with mindful breathing"],
+        "audio_cue": "Build strength from your center. Breathe deeply and hold with intention.",
+        "benefits": ["Strengthens core", "Improves posture"]
+    },
+    {
+        "type": "core", "name": "Gentle Stretching", "difficulty": 1, "language": "en",
+        "focus_areas": ["flexibility", "relaxation", "sleep"],
+        "instructions": ["Gentle spinal twists", "Shoulder rolls", "Neck stretches"],
+        "audio_cue": "Release the day's tensions and prepare for restful sleep.",
+        "benefits": ["Relieves muscle tension", "Promotes relaxation"]
+    },
+    {
+        "type": "core", "name": "Bird Dog Balance", "difficulty": 2, "language": "en",
+        "focus_areas": ["balance", "strength"],
+        "instructions": ["Start on hands and knees", "Extend opposite arm and leg", "Hold for two breaths", "Alternate sides with control"],
+        "audio_cue": "Reach long in both directions. Stability grows from stillness.",
+        "benefits": ["Stabilizes the spine", "Improves coordination"]
+    },
+    {
+        "type": "core", "name": "Horse Stance Hold", "difficulty": 3, "language": "en",
+        "focus_areas": ["strength", "balance", "mindfulness"],
+        "instructions": ["Stand with feet wide and toes forward", "Sink the hips as if sitting", "Keep the spine upright", "Breathe steadily and hold"],
+        "audio_cue": "Sink into horse stance. Be patient, the roots grow deep.",
+        "benefits": ["Builds leg endurance", "Strengthens the lower back"]
+    },
+    {
+        "type": "core", "name": "Plank Flow", "difficulty": 3, "language": "en",
+        "focus_areas": ["strength", "energy"],
+        "instructions": ["Hold a forearm plank", "Rotate into a side plank", "Return to center", "Alternate sides with steady breath"],
+        "audio_cue": "Flow between planks with strength and control. Keep your breath smooth.",
+        "benefits": ["Strengthens core", "Builds shoulder stability"]
+    },
+    {
+        "type": "core", "name": "Hip Mobility Circles", "difficulty": 2, "language": "en",
+        "focus_areas": ["flexibility", "balance"],
+        "instructions": ["Stand on one leg near a wall", "Draw slow circles with the raised knee", "Reverse direction", "Switch legs"],
+        "audio_cue": "Open the hips with slow circles. Mobility is freedom.",
+        "benefits": ["Improves hip mobility", "Reduces stiffness"]
+    },
+    {
+        "type": "core", "name": "Warrior Push-ups", "difficulty": 4, "language": "en",
+        "focus_areas": ["strength", "energy"],
+        "instructions": ["Start in a high plank", "Lower slowly over four counts", "Press up with an exhale", "Keep the body in one line"],
+        "audio_cue": "Lower with control, rise with power. This is the warrior's way.",
+        "benefits": ["Builds upper body strength", "Strengthens core"]
+    },
+    {
+        "type": "core", "name": "Crane Balance Squats", "difficulty": 5, "language": "en",
+        "focus_areas": ["strength", "balance", "focus"],
+        "instructions": ["Balance on one leg", "Slowly lower into a single-leg squat", "Rise without touching down", "Switch legs after each set"],
+        "audio_cue": "Be the crane, poised on one leg. Move slowly and stay centered.",
+        "benefits": ["Single-leg strength", "Deep balance"]
+    },
+]
+
+DAILY_WISDOM = [
+    "The journey of a thousand miles begins with a single step. Today, you take that step.",
+    "Each morning we are born again. What we do today is what matters most.",
+    "Peace comes from within. Do not seek it without.",
+    "Be like water: soft enough to flow, strong enough to shape stone.",
+    "A tree that bends with the wind does not break.",
+    "Stillness in movement, movement in stillness.",
+]
+
+TITLES = {
+    "mindfulness": "Mindful Harmony Flow",
+    "flexibility": "Flowing Flexibility",
+    "strength": "Rooted Strength Practice",
+    "balance": "Balance of Heaven and Earth",
+    "energy": "Morning Energy Flow",
+    "relaxation": "Evening Serenity",
+    "sleep": "Restful Evening Flow",
+    "focus": "Clear Mind Practice",
+}
+
+# (language, type) -> exercises, built once at import
+_INDEX: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+for _exercise in EXERCISE_LIBRARY:
+    _INDEX[(_exercise["language"], _exercise["type"])].append(_exercise)
+
+def _enum_value(value, default: str) -> str:
+    return getattr(value, "value", value) or default
+
+def _pick(candidates: List[Dict], target_difficulty: int, focus_areas: set, taken: set, rng: random.Random) -> Dict:
+    """Pick among the best matches for focus and difficulty, varied by the seed"""
+    def score(exercise: Dict) -> float:
+        return (
+            2 * len(focus_areas.intersection(exercise["focus_areas"]))
+            - abs(exercise["difficulty"] - target_difficulty)
+            - (10 if exercise["name"] in taken else 0)
+        )
+    ranked = sorted(candidates, key=score, reverse=True)
+    return rng.choice(ranked[:3])
+
+def _split_seconds(total: int, parts: int) -> List[int]:
+    """Split seconds into parts rounded to 30s, the last part absorbing the remainder"""
+    share = (total // parts) // 30 * 30
+    return [share] * (parts - 1) + [total - share * (parts - 1)]
+
+def compose_routine(user_profile: Dict, seed: Optional[str] = None) -> Dict:
+    """Compose a routine locally with the 40/30/30 move/mind/core split"""
+    fitness_level = _enum_value(user_profile.get("fitness_level"), "beginner")
+    language = _enum_value(user_profile.get("language"), "en")
+    duration = int(user_profile.get("duration") or 15)
+    focus_areas = [area.lower() for area in user_profile.get("focus_areas") or ["flexibility", "mindfulness"]]
+    focus_set = set(focus_areas)
+    target_difficulty = DIFFICULTY_BY_LEVEL.get(fitness_level, 1)
+
+    # Same seed, same routine; by default a user gets one routine per day
+    seed = seed or f"{fitness_level}|{duration}|{','.join(sorted(focus_set))}|{language}|{datetime.utcnow().date()}"
+    rng = random.Random(hashlib.sha256(seed.encode()).digest())
+
+    total_seconds = duration * 60
+    module_seconds = [int(total_seconds * share) // 30 * 30 for _, share in MODULE_SPLIT]
+    # Rounding leftovers go to move, the largest module
+    module_seconds[1] += total_seconds - sum(module_seconds)
+
+    blocks = []
+    taken = set()
+    for (module_type, _), seconds in zip(MODULE_SPLIT, module_seconds):
+        # Untranslated exercises fall back to English
+        candidates = _INDEX.get((language, module_type)) or _INDEX[("en", module_type)]
+        parts = 1 if seconds <= 300 else 2 if seconds <= 600 else 3
+        for block_seconds in _split_seconds(seconds, parts):
+            exercise = _pick(candidates, target_difficulty, focus_set, taken, rng)
+            taken.add(exercise["name"])
+            blocks.append({
+                "type": exercise["type"],
+                "name": exercise["name"],
+                "duration_seconds": block_seconds,
+                "instructions": list(exercise["instructions"]),
+                "difficulty": exercise["difficulty"],
+                "audio_cue": exercise["audio_cue"],
+                "benefits": list(exercise["benefits"])
+            })
+
+    primary_focus = next((area for area in focus_areas if area in TITLES), "mindfulness")
+    difficulty_level = max(1, min(5, round(sum(b["difficulty"] for b in blocks) / len(blocks))))
+
+    return {
+        "routine_id": str(uuid.uuid4()),
+        "title": TITLES[primary_focus],
+        "total_duration": duration,
+        "focus_area": " & ".join(area.title() for area in focus_areas[:2]),
+        "difficulty_level": difficulty_level,
+        "blocks": blocks,
+        "completion_xp": min(100, 40 + duration * 3),
+        "daily_wisdom": rng.choice(DAILY_WISDOM),
+        "generated_at": datetime.utcnow().isoformat(),
+        "generated_by": "local",
+        "user_preferences": user_profile
+    }
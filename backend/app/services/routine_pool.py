@@ -0,0 +1,180 @@
+import asyncio
+import copy
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from ..core.coalesce import SingleFlight, StreamFlight
+from .ai_service import get_routine_generator
+
+def profile_key(user_profile: Dict) -> str:
+    """Normalize the profile fields the routine prompt depends on into a pool key"""
+    fitness_level = getattr(user_profile.get("fitness_level"), "value", user_profile.get("fitness_level")) or "beginner"
+    language = getattr(user_profile.get("language"), "value", user_profile.get("language")) or "en"
+    focus_areas = sorted({area.strip().lower() for area in user_profile.get("focus_areas") or []})
+    duration = int(user_profile.get("duration") or 15)
+    return f"{fitness_level}|{duration}|{','.join(focus_areas)}|{language}"
+
+async def recent_template_ids(db, user_id: str, limit: int) -> Set[str]:
+    """Pool templates the user received in their most recent routines"""
+    cursor = db.routines.find(
+        {"user_id": user_id, "template_id": {"$ne": None}},
+        {"template_id": 1}
+    ).sort("created_at", -1).limit(limit)
+    return {routine["template_id"] for routine in await cursor.to_list(length=limit)}
+
+class _PoolEntry:
+    def __init__(self):
+        self.templates: List[Dict] = []
+        self.refill_task: Optional[asyncio.Task] = None
+
+class RoutinePool:
+    """Per-process pool of generated routines shared by users with identical profiles"""
+
+    def __init__(
+        self,
+        generator_getter: Callable,
+        size: int = 8,
+        recent_window: int = 3,
+        ttl_seconds: float = 24 * 3600,
+        max_profiles: int = 512,
+        background_refill: bool = True
+    ):
+        self.generator_getter = generator_getter
+        self.size = size
+        self.recent_window = recent_window
+        self.ttl_seconds = ttl_seconds
+        self.max_profiles = max_profiles
+        self.background_refill = background_refill
+        self._entries: "OrderedDict[str, _PoolEntry]" = OrderedDict()
+        self._flights = SingleFlight()
+        self._streams = StreamFlight()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_routine(self, user_profile: Dict, exclude_template_ids: Set[str] = frozenset()) -> Dict:
+        """Assign a pooled routine the user has not had recently, generating one if needed"""
+        key = profile_key(user_profile)
+        entry = self._entry(key)
+
+        # Batch callers fill the pool inline, under their own rate budget
+        if not self.background_refill and len(entry.templates) < self.size:
+            self.misses += 1
+            return self._instantiate(await self._generate_into(key, user_profile), user_profile)
+
+        candidates = [t for t in entry.templates if t["template_id"] not in exclude_template_ids]
+        if candidates:
+            self.hits += 1
+            # Demand for this profile grows its pool one template at a time
+            if len(entry.templates) < self.size:
+                self._schedule_refill(key, entry, user_profile)
+            return self._instantiate(random.choice(candidates), user_profile)
+
+        # Cold key, or every template is a recent repeat: concurrent callers share one generation
+        self.misses += 1
+        template = await self._flights.do(key, lambda: self._generate_into(key, user_profile))
+        return self._instantiate(template, user_profile)
+
+    async def stream_routine(
+        self,
+        user_profile: Dict,
+        exclude_template_ids: Set[str] = frozenset()
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """Like get_routine, yielding ("block", block) events then ("routine", routine)
+
+        A routine that has to be generated is streamed from the model block by
+        block, shared with every concurrent caller for the profile, and pooled.
+        """
+        key = profile_key(user_profile)
+        entry = self._entry(key)
+
+        candidates = [t for t in entry.templates if t["template_id"] not in exclude_template_ids]
+        if candidates:
+            self.hits += 1
+            if len(entry.templates) < self.size:
+                self._schedule_refill(key, entry, user_profile)
+            routine_data = self._instantiate(random.choice(candidates), user_profile)
+            for block in routine_data["blocks"]:
+                yield "block", block
+            yield "routine", routine_data
+            return
+
+        self.misses += 1
+        async for kind, payload in self._streams.do(key, lambda: self._stream_into(key, user_profile)):
+            yield kind, self._instantiate(payload, user_profile) if kind == "routine" else payload
+
+    def stats(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "profiles": len(self._entries),
+            "templates": sum(len(entry.templates) for entry in self._entries.values())
+        }
+
+    def _entry(self, key: str) -> _PoolEntry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _PoolEntry()
+            self._entries[key] = entry
+            while len(self._entries) > self.max_profiles:
+                _, evicted = self._entries.popitem(last=False)
+                if evicted.refill_task:
+                    evicted.refill_task.cancel()
+        self._entries.move_to_end(key)
+
+        expires_before = time.monotonic() - self.ttl_seconds
+        entry.templates = [t for t in entry.templates if t["_pooled_at"] > expires_before]
+        return entry
+
+    async def _generate_into(self, key: str, user_profile: Dict) -> Dict:
+        routine_data = await self.generator_getter().generate_daily_routine(user_profile)
+        return self._pool(key, routine_data)
+
+    async def _stream_into(self, key: str, user_profile: Dict) -> AsyncIterator[Tuple[str, Dict]]:
+        async for kind, payload in self.generator_getter().stream_daily_routine(user_profile):
+            yield kind, self._pool(key, payload) if kind == "routine" else payload
+
+    def _pool(self, key: str, routine_data: Dict) -> Dict:
+        """Turn a generated routine into a template, keeping it unless it is a fallback"""
+        template = {**routine_data, "template_id": str(uuid.uuid4()), "_pooled_at": time.monotonic()}
+
+        # Fallbacks are served but never pooled, so the pool holds only AI routines
+        if not routine_data.get("is_fallback"):
+            entry = self._entry(key)
+            entry.templates.append(template)
+            del entry.templates[:-self.size]
+        return template
+
+    def _schedule_refill(self, key: str, entry: _PoolEntry, user_profile: Dict):
+        if entry.refill_task and not entry.refill_task.done():
+            return
+        entry.refill_task = asyncio.create_task(self._refill(key, user_profile))
+
+    async def _refill(self, key: str, user_profile: Dict):
+        try:
+            await self._generate_into(key, user_profile)
+        except Exception as e:
+            print(f"Error refilling routine pool: {e}")
+
+    def _instantiate(self, template: Dict, user_profile: Dict) -> Dict:
+        """Copy a template into a routine with its own routine_id"""
+        routine_data = copy.deepcopy(template)
+        routine_data.pop("_pooled_at", None)
+        routine_data["routine_id"] = str(uuid.uuid4())
+        routine_data["generated_at"] = datetime.utcnow().isoformat()
+        routine_data["user_preferences"] = user_profile
+        if routine_data.get("is_fallback"):
+            routine_data.pop("template_id", None)
+        return routine_data
+
+routine_pool = RoutinePool(
+    get_routine_generator,
+    size=int(os.getenv("ROUTINE_POOL_SIZE", "8")),
+    recent_window=int(os.getenv("ROUTINE_POOL_RECENT_WINDOW", "3")),
+    ttl_seconds=float(os.getenv("ROUTINE_POOL_TTL_SECONDS", str(24 * 3600))),
+    max_profiles=int(os.getenv("ROUTINE_POOL_MAX_PROFILES", "512"))
+)
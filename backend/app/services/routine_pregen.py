@@ -0,0 +1,174 @@
+"""
+Nightly routine pre-generation for ChiZen Fitness
+Generates tomorrow's routines for recently active users so that the first
+/api/routine/today call of the day is a point read instead of an LLM call.
+
+Run from cron or Cloud Scheduler shortly before midnight UTC:
+    python -m app.services.routine_pregen --active-days 7 --concurrency 4 --rate-per-minute 60
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError
+
+from ..models.user import UserInDB
+from ..models.routine import RoutineInDB
+from .ai_service import RoutineGenerator, build_user_profile, wants_ai_routines
+from .routine_pool import RoutinePool, recent_template_ids
+from .routine_composer import compose_routine
+from .audio_jobs import enqueue_routine_audio
+
+load_dotenv()
+
+class RateBudget:
+    """Token bucket shared by every generation task in the job"""
+
+    def __init__(self, rate_per_minute: float):
+        self.interval = 60.0 / rate_per_minute
+        self._next_slot = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class _BudgetedGenerator:
+    """Routes every LLM call of the job through the shared rate budget"""
+
+    def __init__(self, generator: RoutineGenerator, budget: RateBudget):
+        self.generator = generator
+        self.budget = budget
+
+    async def generate_daily_routine(self, user_profile: Dict) -> Dict:
+        await self.budget.acquire()
+        return await self.generator.generate_daily_routine(user_profile)
+
+async def pregenerate_routines(
+    db,
+    generator: RoutineGenerator,
+    day: Optional[str] = None,
+    active_days: int = 7,
+    concurrency: int = 4,
+    rate_per_minute: float = 60
+) -> Dict:
+    """Generate and store routines for `day` for users active in the last `active_days`"""
+    day = day or (datetime.utcnow().date() + timedelta(days=1)).isoformat()
+    active_since = datetime.utcnow() - timedelta(days=active_days)
+
+    # Users who already have a routine for that day are skipped up front
+    already_generated = set(await db.routines.distinct("user_id", {"day": day}))
+
+    budgeted = _BudgetedGenerator(generator, RateBudget(rate_per_minute))
+    # Users sharing a profile share routines; only the pool's fill costs LLM calls
+    pool = RoutinePool(
+        lambda: budgeted,
+        size=int(os.getenv("ROUTINE_POOL_SIZE", "8")),
+        recent_window=int(os.getenv("ROUTINE_POOL_RECENT_WINDOW", "3")),
+        background_refill=False
+    )
+    stats = {"generated": 0, "skipped": 0, "failed": 0}
+    # Bounded so the users cursor is never read far ahead of the workers
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def pregenerate_for(user: UserInDB):
+        if wants_ai_routines(user):
+            recent = await recent_template_ids(db, user.id, pool.recent_window)
+            routine_data = await pool.get_routine(build_user_profile(user), recent)
+        else:
+            # Same seed as the live path, so the stored routine is the one /today would compose
+            routine_data = compose_routine(build_user_profile(user), seed=f"{user.id}:{day}")
+
+        # Leave fallbacks to the live path so the user can still get an AI routine
+        if routine_data.get("is_fallback"):
+            stats["failed"] += 1
+            return
+
+        routine_doc = RoutineInDB(**{
+            **routine_data,
+            "_id": routine_data["routine_id"],
+            "user_id": user.id,
+            "day": day,
+            "created_at": datetime.utcnow()
+        }).model_dump(by_alias=True)
+        try:
+            await db.routines.insert_one(routine_doc)
+            stats["generated"] += 1
+            # Picked up by the API workers, so the audio is ready by morning too
+            await enqueue_routine_audio(db, routine_doc, build_user_profile(user)["language"])
+        except DuplicateKeyError:
+            stats["skipped"] += 1
+
+    async def worker():
+        while True:
+            user = await queue.get()
+            if user is None:
+                return
+            try:
+                await pregenerate_for(user)
+            except Exception as e:
+                print(f"❌ Pre-generation failed for {user.id}: {e}")
+                stats["failed"] += 1
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+    cursor = db.users.find({
+        "last_active": {"$gte": active_since},
+        "is_active": {"$ne": False}
+    })
+    async for user_data in cursor:
+        if user_data["_id"] in already_generated:
+            stats["skipped"] += 1
+            continue
+        await queue.put(UserInDB.model_validate(user_data))
+
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+
+    stats["pool"] = pool.stats()
+    return stats
+
+async def main(args) -> bool:
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    )
+    db = client.chizen_fitness
+    generator = RoutineGenerator()
+
+    try:
+        started = time.monotonic()
+        stats = await pregenerate_routines(
+            db,
+            generator,
+            day=args.day,
+            active_days=args.active_days,
+            concurrency=args.concurrency,
+            rate_per_minute=args.rate_per_minute
+        )
+        print(f"✅ Pre-generated routines in {time.monotonic() - started:.1f}s: {stats}")
+        return True
+    except Exception as e:
+        print(f"❌ Routine pre-generation failed: {e}")
+        return False
+    finally:
+        await generator.aclose()
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate daily routines for active users")
+    parser.add_argument("--day", help="ISO date to generate for (default: tomorrow, UTC)")
+    parser.add_argument("--active-days", type=int, default=7)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate-per-minute", type=float, default=60)
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
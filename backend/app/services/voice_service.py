@@ -1,67 +1,202 @@
 import aiohttp
 import asyncio
 import os
-from typing import List, Dict
-import uuid
-import tempfile
+import random
+from typing import AsyncIterator, List, Dict, Optional
+
+from ..core.coalesce import SingleFlight
+from ..core.database import get_database
+from .audio_store import audio_cache_key, get_audio_store
+from .phrase_library import PhraseLibrary, concat_mp3, load_phrase_library
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
 
 class VoiceService:
     def __init__(self):
         self.api_key = os.getenv("ELEVEN_LABS_KEY")
         self.voice_id = os.getenv("MASTER_LEE_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")  # Default voice
         self.base_url = "https://api.elevenlabs.io/v1"
+        self.model_id = "eleven_monolingual_v1"
+        self.voice_settings = {
+            "stability": 0.75,
+            "similarity_boost": 0.75,
+            "style": 0.0,
+            "use_speaker_boost": True
+        }
+        self.store = get_audio_store()
+        self.phrases = PhraseLibrary()
         
+        # Concurrent requests allowed by the ElevenLabs plan, shared by the whole worker
+        self.max_concurrency = int(os.getenv("ELEVEN_LABS_MAX_CONCURRENCY", "4"))
+        self.max_connections = int(os.getenv("ELEVEN_LABS_MAX_CONNECTIONS", str(self.max_concurrency * 2)))
+        self.request_timeout = float(os.getenv("ELEVEN_LABS_TIMEOUT", "30"))
+        self.max_retries = int(os.getenv("ELEVEN_LABS_MAX_RETRIES", "2"))
+        # Longest wait between attempts, however far off the provider's Retry-After is
+        self.max_backoff = float(os.getenv("ELEVEN_LABS_MAX_BACKOFF", "10"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._flights = SingleFlight()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """One keep-alive connection pool per worker, created inside the running loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    limit_per_host=self.max_connections,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout, connect=5)
+            )
+        return self._session
+    
+    async def aclose(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+    
     async def generate_audio_cues(self, instructions: List[str]) -> List[str]:
         """Generate audio files for exercise instructions"""
+        results = await self.generate_audio_results(instructions)
+        return [result["audio_url"] or "" for result in results]
+    
+    async def generate_audio_results(self, texts: List[str]) -> List[Dict]:
+        """Synthesize texts concurrently, returning results in input order with per-item errors"""
         if not self.api_key:
             # Return empty URLs if no API key (for development)
-            return [""] * len(instructions)
-            
-        audio_urls = []
+            return [{"text": text, "audio_url": None, "error": "ELEVEN_LABS_KEY not configured"} for text in texts]
+        
+        return await asyncio.gather(*(self.generate_audio_result(text) for text in texts))
+    
+    async def generate_audio_result(self, text: str, language: str = "en") -> Dict:
+        try:
+            return {"text": text, "audio_url": await self.generate_audio(text, language), "error": None}
+        except Exception as e:
+            print(f"Error generating audio for instruction '{text}': {e}")
+            return {"text": text, "audio_url": None, "error": str(e)}
+    
+    async def generate_audio(self, text: str, language: str = "en") -> str:
+        """Return the URL of the audio for text, synthesizing it only on a cache miss"""
+        key = self.audio_key(text)
+        
+        # Identical cues are synthesized once and served from the store afterwards
+        if await self.store.exists(key):
+            return self.store.url(key)
+        
+        # Identical cues requested at the same time share one synthesis
+        return await self._flights.do(key, lambda: self._generate_single_audio(key, text, language))
+    
+    def audio_key(self, text: str) -> str:
+        return audio_cache_key(text, self.voice_id, self.model_id, self.voice_settings)
+        
+    async def stream_audio(self, text: str) -> AsyncIterator[bytes]:
+        """Relay ElevenLabs' chunked audio as it arrives, storing it once complete"""
+        if not self.api_key:
+            raise Exception("ELEVEN_LABS_KEY not configured")
         
-        async with aiohttp.ClientSession() as session:
-            for instruction in instructions:
-                try:
-                    audio_url = await self._generate_single_audio(session, instruction)
-                    audio_urls.append(audio_url)
-                except Exception as e:
-                    print(f"Error generating audio for instruction '{instruction}': {e}")
-                    audio_urls.append("")  # Empty URL on error
-                    
-        return audio_urls
+        # Upstream is read as fast as it arrives, so a slow client does not hold a provider slot
+        chunks: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.create_task(self._read_stream(text, chunks))
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield chunk
+            # Raises a provider error, even one before the first chunk
+            await reader
+        finally:
+            # Only a stream that ran to the end is cached; a dropped client leaves nothing behind
+            reader.cancel()
     
-    async def _generate_single_audio(self, session: aiohttp.ClientSession, text: str) -> str:
+    async def _read_stream(self, text: str, chunks: asyncio.Queue):
+        data = []
+        try:
+            async with self._semaphore:
+                async with self._get_session().post(
+                    f"{self.base_url}/text-to-speech/{self.voice_id}/stream",
+                    headers={
+                        "Accept": "audio/mpeg",
+                        "Content-Type": "application/json",
+                        "xi-api-key": self.api_key
+                    },
+                    json={
+                        "text": text,
+                        "model_id": self.model_id,
+                        "voice_settings": self.voice_settings
+                    }
+                ) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        raise Exception(f"ElevenLabs API error: {response.status} - {error_text}")
+                    async for chunk in response.content.iter_any():
+                        data.append(chunk)
+                        chunks.put_nowait(chunk)
+            await self.store.write(self.audio_key(text), b"".join(data))
+        finally:
+            chunks.put_nowait(None)
+        
+    async def _generate_single_audio(self, key: str, text: str, language: str) -> str:
         """Generate a single audio file and return URL"""
+        audio_data = await self._compose_from_library(key, text, language) or await self._synthesize(text)
+        await self.store.write(key, audio_data)
+        return self.store.url(key)
+    
+    async def _compose_from_library(self, key: str, text: str, language: str) -> Optional[bytes]:
+        """Assemble text from library phrases and synthesized residue; None if no phrase applies"""
+        segments = self.phrases.split(text, language)
+        if not any(phrase for _, phrase in segments):
+            return None
+        if len(segments) == 1 and self.audio_key(segments[0][1]) == key:
+            # This is a library phrase whose audio is missing; synthesize it directly
+            return None
         
-        # Generate audio via ElevenLabs API
-        async with session.post(
-            f"{self.base_url}/text-to-speech/{self.voice_id}",
-            headers={
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": self.api_key
-            },
-            json={
-                "text": text,
-                "model_id": "eleven_monolingual_v1",
-                "voice_settings": {
-                    "stability": 0.75,
-                    "similarity_boost": 0.75,
-                    "style": 0.0,
-                    "use_speaker_boost": True
-                }
-            }
-        ) as response:
-            if response.status == 200:
-                audio_data = await response.read()
-                
-                # In a real implementation, you would upload to cloud storage
-                # For now, we'll return a placeholder URL
-                audio_id = str(uuid.uuid4())
-                return f"https://storage.chizen.app/audio/{audio_id}.mp3"
-            else:
-                error_text = await response.text()
+        # Phrases are read from the store and each residue is synthesized (and cached) on its own
+        parts = await asyncio.gather(*(
+            self._segment_audio(phrase or segment, language) for segment, phrase in segments
+        ))
+        try:
+            return concat_mp3(parts)
+        except ValueError as e:
+            print(f"❌ Could not join phrase audio for '{text}': {e}")
+            return None
+    
+    async def _segment_audio(self, text: str, language: str) -> bytes:
+        await self.generate_audio(text, language)
+        audio_data = await self.store.read(self.audio_key(text))
+        if audio_data is None:
+            raise Exception(f"Audio for '{text}' was evicted before it could be joined")
+        return audio_data
+    
+    async def _synthesize(self, text: str) -> bytes:
+        """Call ElevenLabs under the concurrency limit, backing off on rate limits"""
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                # Generate audio via ElevenLabs API
+                async with self._get_session().post(
+                    f"{self.base_url}/text-to-speech/{self.voice_id}",
+                    headers={
+                        "Accept": "audio/mpeg",
+                        "Content-Type": "application/json",
+                        "xi-api-key": self.api_key
+                    },
+                    json={
+                        "text": text,
+                        "model_id": self.model_id,
+                        "voice_settings": self.voice_settings
+                    }
+                ) as response:
+                    if response.status == 200:
+                        return await response.read()
+                    error_text = await response.text()
+                    retry_after = response.headers.get("Retry-After")
+            
+            if response.status not in RETRYABLE_STATUSES or attempt == self.max_retries:
                 raise Exception(f"ElevenLabs API error: {response.status} - {error_text}")
+            
+            # Sleep outside the semaphore so other requests can use the slot
+            if retry_after and retry_after.isdigit():
+                delay = min(float(retry_after), self.max_backoff)
+            else:
+                delay = random.uniform(0, min(0.5 * 2 ** attempt, self.max_backoff))
+            await asyncio.sleep(delay)
     
     async def generate_routine_audio(self, routine_data: Dict) -> Dict:
         """Generate all audio for a complete routine"""
@@ -89,14 +224,36 @@ class VoiceService:
         
         return routine_data
     
-    def get_preset_audio_library(self) -> Dict[str, str]:
-        """Get pre-generated audio files for common phrases"""
-        # In a real implementation, these would be pre-generated and stored
-        return {
-            "welcome": "https://storage.chizen.app/audio/preset/welcome.mp3",
-            "breathe_in": "https://storage.chizen.app/audio/preset/breathe_in.mp3",
-            "breathe_out": "https://storage.chizen.app/audio/preset/breathe_out.mp3",
-            "hold_position": "https://storage.chizen.app/audio/preset/hold_position.mp3",
-            "well_done": "https://storage.chizen.app/audio/preset/well_done.mp3",
-            "routine_complete": "https://storage.chizen.app/audio/preset/routine_complete.mp3"
-        }
\ No newline at end of file
+    async def load_phrase_library(self, db):
+        """Use the built phrase library for this voice when composing cues"""
+        self.phrases = await load_phrase_library(db, self.audio_key)
+    
+    def get_phrase_library(self, language: str = "en") -> Dict[str, str]:
+        """Audio URLs of the built library phrases for a language"""
+        return {phrase: self.store.url(self.audio_key(phrase)) for phrase in self.phrases.phrases(language)}
+
+_voice_service: Optional[VoiceService] = None
+
+async def start_voice_service():
+    """Create the worker's shared voice service"""
+    global _voice_service
+    _voice_service = VoiceService()
+    try:
+        await _voice_service.load_phrase_library(get_database())
+    except Exception as e:
+        print(f"❌ Failed to load phrase library: {e}")
+    print(f"✅ Voice service ready (concurrency {_voice_service.max_concurrency}, {len(_voice_service.phrases.phrases('en'))} phrases)")
+
+async def stop_voice_service():
+    """Close the shared voice service's connection pool"""
+    global _voice_service
+    if _voice_service:
+        await _voice_service.aclose()
+        _voice_service = None
+
+def get_voice_service() -> VoiceService:
+    """Return the shared voice service, creating it if startup skipped it"""
+    global _voice_service
+    if _voice_service is None:
+        _voice_service = VoiceService()
+    return _voice_service
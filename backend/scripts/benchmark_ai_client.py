@@ -0,0 +1,176 @@
+"""
+OpenAI client benchmark for ChiZen Fitness
+Starts a local stub of the chat completions endpoint with configurable
+latency, slow tail and error rate, then drives RoutineGenerator against it
+and reports p50/p99 latency, the share of real (non-fallback) routines and
+the TCP connections opened for:
+  - a fresh client per request with the SDK's own retries (the old path)
+  - the pooled generator without retries
+  - the pooled generator with jittered retries
+  - the pooled generator with retries and hedging
+
+Needs no OpenAI key or network. Run from backend/:
+    python -m scripts.benchmark_ai_client --requests 400 --concurrency 20 --error-rate 0.05 --tail-rate 0.03
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import time
+from typing import Callable, Dict, List, Set, Tuple
+
+import httpx
+from aiohttp import web
+from openai import AsyncOpenAI
+
+from app.services.ai_service import RoutineGenerator, SYSTEM_PROMPT
+from app.services.routine_composer import compose_routine
+
+USER_PROFILE = {
+    "fitness_level": "intermediate",
+    "duration": 20,
+    "focus_areas": ["strength", "flexibility", "mindfulness"],
+    "language": "en"
+}
+
+class StubOpenAI:
+    """Chat completions endpoint with a latency distribution and injected 500s"""
+
+    def __init__(self, args):
+        self.args = args
+        self.peers: Set[Tuple] = set()
+        self.requests = 0
+        self.content = json.dumps(compose_routine(USER_PROFILE, seed="benchmark"))
+
+    async def completions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.peers.add(request.transport.get_extra_info("peername"))
+        await request.read()
+
+        latency = random.gauss(self.args.latency, self.args.latency / 5)
+        if random.random() < self.args.tail_rate:
+            latency = self.args.tail
+        await asyncio.sleep(max(latency, 0) / 1000)
+
+        if random.random() < self.args.error_rate:
+            return web.json_response({"error": {"message": "stub overloaded", "type": "server_error"}}, status=500)
+        return web.json_response({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-4o",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.content},
+                "finish_reason": "stop"
+            }]
+        })
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+def pooled_generator(retries: int, hedge_percentile: float) -> RoutineGenerator:
+    """A generator configured through the same environment variables as the app"""
+    os.environ["OPENAI_MAX_RETRIES"] = str(retries)
+    os.environ["OPENAI_HEDGE_PERCENTILE"] = str(hedge_percentile)
+    return RoutineGenerator()
+
+async def per_request_client(_profile: Dict) -> Dict:
+    """The old path: a new client and connection for every routine"""
+    async with httpx.AsyncClient() as http_client:
+        client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"], http_client=http_client)
+        try:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "system", "content": SYSTEM_PROMPT}],
+                temperature=0.7,
+                response_format={"type": "json_object"}
+            )
+            return json.loads(response.choices[0].message.content)
+        except Exception:
+            return {"is_fallback": True}
+
+async def run(generate: Callable, args) -> Tuple[List[float], int]:
+    """Latencies in milliseconds and the number of non-fallback routines"""
+    latencies: List[float] = []
+    succeeded = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        nonlocal succeeded
+        async with semaphore:
+            started = time.monotonic()
+            routine = await generate(USER_PROFILE)
+            latencies.append((time.monotonic() - started) * 1000)
+            if not routine.get("is_fallback"):
+                succeeded += 1
+
+    # The generators log every retry and fallback; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+    return latencies, succeeded
+
+async def main(args) -> bool:
+    stub = StubOpenAI(args)
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stub.completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+
+    try:
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+        print(
+            f"✅ Stub at port {port}: {args.latency:.0f} ms ±20%, {args.tail_rate:.0%} at {args.tail:.0f} ms, "
+            f"{args.error_rate:.0%} errors; {args.requests} routines, {args.concurrency} concurrent\n"
+        )
+        print(f"   {'client':<30} {'p50 ms':>8} {'p99 ms':>8} {'success':>8} {'calls':>6} {'conns':>6}")
+
+        scenarios = [
+            ("per-request client", None),
+            ("pooled, no retries", (0, 0)),
+            ("pooled + retries", (2, 0)),
+            ("pooled + retries + hedging", (2, args.hedge_percentile)),
+        ]
+        for name, config in scenarios:
+            generator = pooled_generator(*config) if config else None
+            stub.peers.clear()
+            stub.requests = 0
+            try:
+                latencies, succeeded = await run(
+                    generator.generate_daily_routine if generator else per_request_client, args
+                )
+            finally:
+                if generator:
+                    await generator.aclose()
+            print(
+                f"   {name:<30} {percentile(latencies, 0.5):>8.0f} {percentile(latencies, 0.99):>8.0f} "
+                f"{succeeded / args.requests:>8.1%} {stub.requests:>6} {len(stub.peers):>6}"
+            )
+        return True
+    except Exception as e:
+        print(f"❌ AI client benchmark failed: {e}")
+        return False
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the pooled, retrying and hedging OpenAI client against a stub")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=200, help="Typical stub latency in milliseconds")
+    parser.add_argument("--tail", type=float, default=2000, help="Latency of the slow tail in milliseconds")
+    parser.add_argument("--tail-rate", type=float, default=0.03)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hedge-percentile", type=float, default=95)
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
@@ -0,0 +1,97 @@
+"""
+Login load benchmark for ChiZen Fitness
+Hammers POST /api/auth/login from many concurrent clients while probing a
+cheap endpoint, and reports login throughput, shed (503) logins and the
+probe's p50/p99 latency with and without the login load. With bcrypt off the
+event loop the probe's latency should stay flat under load.
+
+Run from backend/ against a running API (a throwaway user is registered):
+    python -m scripts.benchmark_login --url http://localhost:8000 --concurrency 50 --seconds 20
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List
+
+import aiohttp
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+async def probe(session: aiohttp.ClientSession, url: str, deadline: float, interval: float) -> List[float]:
+    """Latencies in milliseconds of sequential probe requests until the deadline"""
+    latencies = []
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        async with session.get(url) as response:
+            await response.read()
+        latencies.append((time.monotonic() - started) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+async def hammer_logins(session: aiohttp.ClientSession, url: str, credentials: Dict, deadline: float, statuses: Counter):
+    while time.monotonic() < deadline:
+        async with session.post(url, data=credentials) as response:
+            await response.read()
+            statuses[response.status] += 1
+
+def report(name: str, latencies: List[float]):
+    print(
+        f"   {name}: {len(latencies)} probes, "
+        f"p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms"
+    )
+
+async def main(args) -> bool:
+    base_url = args.url.rstrip("/")
+    probe_url = f"{base_url}{args.probe}"
+    login_url = f"{base_url}/api/auth/login"
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    password = uuid.uuid4().hex
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency + 1)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        try:
+            async with session.post(
+                f"{base_url}/api/auth/register",
+                json={"email": email, "username": "Login Benchmark", "password": password}
+            ) as response:
+                if response.status != 200:
+                    raise Exception(f"register returned {response.status}: {await response.text()}")
+
+            idle = await probe(session, probe_url, time.monotonic() + args.warmup, args.interval)
+
+            statuses: Counter = Counter()
+            deadline = time.monotonic() + args.seconds
+            started = time.monotonic()
+            loaded, *_ = await asyncio.gather(
+                probe(session, probe_url, deadline, args.interval),
+                *(
+                    hammer_logins(session, login_url, {"username": email, "password": password}, deadline, statuses)
+                    for _ in range(args.concurrency)
+                )
+            )
+            elapsed = time.monotonic() - started
+        except Exception as e:
+            print(f"❌ Login benchmark failed: {e}")
+            return False
+
+    print(f"✅ {args.concurrency} concurrent clients for {elapsed:.1f}s")
+    failed = sum(count for code, count in statuses.items() if code not in (200, 503))
+    print(f"   logins: {statuses[200] / elapsed:.1f}/s succeeded, {statuses[503]} shed with 503, {failed} failed")
+    report(f"{args.probe} idle", idle)
+    report(f"{args.probe} under login load", loaded)
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure login throughput and its effect on other endpoints")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--probe", default="/health", help="Cheap endpoint whose latency is tracked")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of idle probing first")
+    parser.add_argument("--interval", type=float, default=0.01, help="Pause between probes")
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
@@ -0,0 +1,102 @@
+"""
+Serialization microbenchmark for ChiZen Fitness
+Times the response paths of /history and the admin listings on routines built
+by the routine composer: the old path (one model per item, FastAPI's
+jsonable_encoder and the stdlib JSONResponse) against the cached TypeAdapter
+and ORJSONResponse path, plus single UserInDB and RoutineResponse round trips.
+
+Needs no database. Run from backend/:
+    python -m scripts.benchmark_serialization --items 50 --repeat 200
+"""
+import argparse
+import timeit
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.models.routine import RoutineResponse, routine_response_list
+from app.models.user import UserInDB, UserResponse, user_response_list
+from app.services.routine_composer import compose_routine
+
+USER_PROFILE = {
+    "fitness_level": "intermediate",
+    "duration": 20,
+    "focus_areas": ["strength", "flexibility", "mindfulness"],
+    "language": "en"
+}
+
+def routine_documents(count: int) -> List[Dict]:
+    """Mongo-shaped routines as /history reads them"""
+    documents = []
+    for index in range(count):
+        routine = compose_routine(USER_PROFILE, seed=f"benchmark:{index}")
+        documents.append({
+            **routine,
+            "_id": routine["routine_id"],
+            "user_id": "benchmark-user",
+            "created_at": datetime.utcnow(),
+            "completed_at": datetime.utcnow() if index % 2 else None,
+            "xp_earned": routine["completion_xp"] if index % 2 else 0
+        })
+    return documents
+
+def user_documents(count: int) -> List[Dict]:
+    return [
+        UserInDB(
+            id=str(uuid.uuid4()),
+            email=f"user{index}@example.com",
+            username=f"User {index}",
+            created_at=datetime.utcnow()
+        ).model_dump(by_alias=True)
+        for index in range(count)
+    ]
+
+def measure(name: str, func: Callable, repeat: int) -> float:
+    """Best of five runs, in microseconds per call"""
+    per_call = min(timeit.repeat(func, number=repeat, repeat=5)) / repeat * 1_000_000
+    print(f"   {name:<44} {per_call:>10.1f} µs")
+    return per_call
+
+def compare(title: str, before: Callable, after: Callable, repeat: int):
+    print(f"{title}")
+    before_time = measure("before: models + jsonable_encoder + json", before, repeat)
+    after_time = measure("after: TypeAdapter + orjson", after, repeat)
+    print(f"   {'speedup':<44} {before_time / after_time:>10.1f}x")
+
+def main(args):
+    routines = routine_documents(args.items)
+    users = user_documents(args.items)
+    print(f"{args.items} items per list, best of 5 x {args.repeat} calls\n")
+
+    compare(
+        f"/history and admin routine list ({args.items} routines)",
+        lambda: JSONResponse(jsonable_encoder({"routines": [RoutineResponse(**routine) for routine in routines]})),
+        lambda: ORJSONResponse({
+            "routines": routine_response_list.dump_python(routine_response_list.validate_python(routines), mode="json")
+        }),
+        args.repeat
+    )
+    compare(
+        f"admin user list ({args.items} users)",
+        lambda: JSONResponse(jsonable_encoder({"users": [UserResponse(**user) for user in users]})),
+        lambda: ORJSONResponse({
+            "users": user_response_list.dump_python(user_response_list.validate_python(users), mode="json")
+        }),
+        args.repeat
+    )
+
+    print("Single documents")
+    measure("UserInDB.model_validate", lambda: UserInDB.model_validate(users[0]), args.repeat)
+    measure("RoutineResponse.model_validate", lambda: RoutineResponse.model_validate(routines[0]), args.repeat)
+    response = RoutineResponse.model_validate(routines[0])
+    measure("RoutineResponse.model_dump_json", response.model_dump_json, args.repeat)
+    measure("compose_routine", lambda: compose_routine(USER_PROFILE, seed="benchmark"), args.repeat)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time model validation and response serialization")
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
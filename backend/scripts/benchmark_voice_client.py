@@ -0,0 +1,158 @@
+"""
+ElevenLabs client benchmark for ChiZen Fitness
+Starts a local stub of the text-to-speech endpoint with configurable latency,
+plan concurrency and 429 rate (with Retry-After), then synthesizes batches of routine cues and
+reports wall time, p50/p99 per batch, failed cues, the provider's peak
+concurrency and the TCP connections opened for:
+  - sequential synthesis with a new session per cue (the old path)
+  - VoiceService.generate_audio_results (shared pool, semaphore, retries)
+
+Audio is written to a temporary store that is removed afterwards. Run from backend/:
+    python -m scripts.benchmark_voice_client --batches 20 --cues 8 --latency 200 --plan-concurrency 4 --rate-limit 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+import uuid
+from typing import Callable, List, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from app.services.voice_service import VoiceService
+
+class StubElevenLabs:
+    """Text-to-speech endpoint with a latency distribution, a concurrency limit and injected 429s"""
+
+    def __init__(self, args):
+        self.args = args
+        self.peers: Set[Tuple] = set()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def speech(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await request.read()
+            # Like the real plan, requests beyond its concurrency are turned away
+            if self.in_flight > self.args.plan_concurrency or random.random() < self.args.rate_limit:
+                return web.Response(status=429, text="too many concurrent requests", headers={"Retry-After": self.args.retry_after})
+            await asyncio.sleep(max(random.gauss(self.args.latency, self.args.latency / 5), 0) / 1000)
+            return web.Response(body=os.urandom(self.args.audio_bytes), content_type="audio/mpeg")
+        finally:
+            self.in_flight -= 1
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+def sequential_per_cue(base_url: str) -> Callable:
+    """The old path: one cue after another, each over a new session"""
+    async def synthesize(texts: List[str]) -> List[Optional[str]]:
+        errors = []
+        for text in texts:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{base_url}/text-to-speech/benchmark", json={"text": text}) as response:
+                    await response.read()
+                    errors.append(None if response.status == 200 else f"status {response.status}")
+        return errors
+    return synthesize
+
+def pooled_service(base_url: str) -> Tuple[Callable, Callable]:
+    """VoiceService pointed at the stub, and its close function"""
+    service = VoiceService()
+    service.base_url = base_url
+
+    async def synthesize(texts: List[str]) -> List[Optional[str]]:
+        return [result["error"] for result in await service.generate_audio_results(texts)]
+    return synthesize, service.aclose
+
+async def run(synthesize: Callable, args) -> Tuple[float, List[float], int]:
+    """Wall time in seconds, batch latencies in milliseconds and failed cues"""
+    latencies: List[float] = []
+    failed = 0
+
+    async def batch():
+        nonlocal failed
+        # Unique texts, so the audio store never short-circuits a call
+        texts = [f"Breathe in slowly, cue {uuid.uuid4().hex}" for _ in range(args.cues)]
+        started = time.monotonic()
+        errors = await synthesize(texts)
+        latencies.append((time.monotonic() - started) * 1000)
+        failed += sum(1 for error in errors if error)
+
+    started = time.monotonic()
+    # The service logs every failed cue; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(batch() for _ in range(args.batches)))
+    return time.monotonic() - started, latencies, failed
+
+async def main(args) -> bool:
+    stub = StubElevenLabs(args)
+    app = web.Application()
+    app.router.add_post("/text-to-speech/{voice_id}", stub.speech)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        # VoiceService reads its configuration when it is created
+        os.environ["AUDIO_STORE_DIR"] = store_dir
+        os.environ.setdefault("ELEVEN_LABS_KEY", "benchmark")
+        try:
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            base_url = f"http://127.0.0.1:{port}"
+
+            print(
+                f"✅ Stub at port {port}: {args.latency:.0f} ms ±20%, {args.plan_concurrency} concurrent, {args.rate_limit:.0%} 429s "
+                f"(Retry-After {args.retry_after}); {args.batches} routines of {args.cues} cues at once\n"
+            )
+            print(f"   {'client':<26} {'wall s':>7} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7} {'calls':>6} {'peak':>5} {'conns':>6}")
+
+            synthesize, close = pooled_service(base_url)
+            scenarios = [
+                ("sequential, session/cue", sequential_per_cue(base_url), None),
+                ("pooled VoiceService", synthesize, close),
+            ]
+            for name, synthesize, close in scenarios:
+                stub.peers.clear()
+                stub.requests = 0
+                stub.peak = 0
+                try:
+                    elapsed, latencies, failed = await run(synthesize, args)
+                finally:
+                    if close:
+                        await close()
+                print(
+                    f"   {name:<26} {elapsed:>7.2f} {percentile(latencies, 0.5):>8.0f} {percentile(latencies, 0.99):>8.0f} "
+                    f"{failed:>7} {stub.requests:>6} {stub.peak:>5} {len(stub.peers):>6}"
+                )
+            return True
+        except Exception as e:
+            print(f"❌ Voice client benchmark failed: {e}")
+            return False
+        finally:
+            await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the pooled ElevenLabs client against a stub")
+    parser.add_argument("--batches", type=int, default=20, help="Routines synthesized at the same time")
+    parser.add_argument("--cues", type=int, default=8, help="Audio cues per routine")
+    parser.add_argument("--latency", type=float, default=200, help="Typical stub latency in milliseconds")
+    parser.add_argument("--plan-concurrency", type=int, default=4, help="Concurrent calls the stub accepts")
+    parser.add_argument("--rate-limit", type=float, default=0.05, help="Share of calls answered with 429")
+    parser.add_argument("--retry-after", default="1", help="Retry-After header sent with each 429")
+    parser.add_argument("--audio-bytes", type=int, default=16384)
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
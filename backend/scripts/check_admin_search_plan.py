@@ -0,0 +1,66 @@
+"""
+Query plan check for the admin user search
+Explains the page query GET /api/admin/users?search= runs and fails unless
+the winning plan scans the search_terms_1 index.
+
+Run from backend/ after python -m app.core.init_db has created the indexes:
+    python -m scripts.check_admin_search_plan --search "lee gmail"
+"""
+import argparse
+import asyncio
+import os
+from typing import Dict, List
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+
+from app.core.pagination import KEYSET_SORT
+from app.models.user import user_search_query
+
+load_dotenv()
+
+SEARCH_INDEX = "search_terms_1"
+
+def plan_stages(plan: Dict) -> List[str]:
+    """Every stage name in an explain plan tree, with the index an index scan uses"""
+    stages = []
+    if "stage" in plan:
+        stages.append(f"{plan['stage']}({plan['indexName']})" if "indexName" in plan else plan["stage"])
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return stages
+
+async def main(args) -> bool:
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    )
+    db = client.chizen_fitness
+
+    try:
+        if SEARCH_INDEX not in await db.users.index_information():
+            print(f"❌ {SEARCH_INDEX} is missing; run python -m app.core.init_db first")
+            return False
+
+        explain = await db.users.find(user_search_query(args.search)).sort(KEYSET_SORT).limit(args.limit + 1).explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        print(f"   Winning plan: {' <- '.join(stages)}")
+        if f"IXSCAN({SEARCH_INDEX})" not in stages:
+            print(f"❌ Admin search is not served by {SEARCH_INDEX}")
+            return False
+        print(f"✅ Admin search is served by {SEARCH_INDEX}")
+        return True
+    except Exception as e:
+        print(f"❌ Query plan check failed: {e}")
+        return False
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that admin user search scans the search_terms index")
+    parser.add_argument("--search", default="admin chizen")
+    parser.add_argument("--limit", type=int, default=20)
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
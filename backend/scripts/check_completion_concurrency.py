@@ -0,0 +1,103 @@
+"""
+Concurrency check for routine completion
+Fires many simultaneous /complete calls at a handful of routines in a scratch
+database and checks that every routine's XP reached the user exactly once.
+
+Run from backend/ against a disposable MongoDB (the scratch database is dropped):
+    python -m scripts.check_completion_concurrency --routines 5 --attempts 20
+"""
+import argparse
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+
+from app.core import database
+from app.models.routine import RoutineComplete
+from app.models.user import UserInDB
+from app.routes.routines import complete_routine
+
+load_dotenv()
+
+async def check(db, routines: int, attempts: int) -> bool:
+    user_id = f"concurrency-{uuid.uuid4().hex[:8]}"
+    await db.users.insert_one({
+        "_id": user_id,
+        "email": f"{user_id}@example.com",
+        "username": user_id,
+        "total_xp": 0,
+        "created_at": datetime.utcnow()
+    })
+    user = UserInDB.model_validate(await db.users.find_one({"_id": user_id}))
+
+    routine_ids = []
+    for index in range(routines):
+        routine_id = str(uuid.uuid4())
+        routine_ids.append(routine_id)
+        await db.routines.insert_one({
+            "_id": routine_id,
+            "routine_id": routine_id,
+            "user_id": user_id,
+            "blocks": [],
+            "total_duration": 15,
+            "focus_area": "mindfulness",
+            "difficulty_level": 1,
+            "completion_xp": 40 + index,
+            "created_at": datetime.utcnow(),
+            "completed_at": None
+        })
+
+    # Every attempt races every other; a comment starting with $ must be stored verbatim
+    await asyncio.gather(*(
+        complete_routine(
+            RoutineComplete(
+                routine_id=routine_id,
+                completed_blocks=3,
+                total_blocks=3,
+                feedback_comment="$user_id"
+            ),
+            current_user=user
+        )
+        for routine_id in routine_ids
+        for _ in range(attempts)
+    ))
+
+    stored = await db.routines.find({"user_id": user_id}).to_list(length=None)
+    user_doc = await db.users.find_one({"_id": user_id})
+    rollup = await db.activity_rollups.find_one({"_id": user_id})
+
+    expected_xp = sum(routine["xp_earned"] for routine in stored)
+    checks = {
+        "xp credited once per routine": user_doc["total_xp"] == expected_xp,
+        "one session per routine": rollup["total_sessions"] == routines,
+        "every routine marked applied": all(routine["_id"] in user_doc.get("applied_routines", []) for routine in stored),
+        "feedback stored verbatim": all(routine["feedback_comment"] == "$user_id" for routine in stored)
+    }
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    print(f"   {routines * attempts} completions, total_xp {user_doc['total_xp']} (expected {expected_xp})")
+    return all(checks.values())
+
+async def main(args) -> bool:
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    )
+    db = client[args.database]
+    database.database.database = db
+
+    try:
+        return await check(db, args.routines, args.attempts)
+    finally:
+        await client.drop_database(args.database)
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that concurrent routine completions credit XP once")
+    parser.add_argument("--routines", type=int, default=5)
+    parser.add_argument("--attempts", type=int, default=20)
+    parser.add_argument("--database", default="chizen_fitness_concurrency_check")
+    success = asyncio.run(main(parser.parse_args()))
+    exit(0 if success else 1)
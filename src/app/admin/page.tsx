@@ -69,7 +69,7 @@ export default function AdminPage() {
     try {
       const [analyticsRes, usersRes] = await Promise.all([
         apiClient.getAnalytics(),
-        apiClient.getUsers(1, 20)
+        apiClient.getUsers(undefined, 20)
       ])
 
       if (analyticsRes.success) {
@@ -59,6 +59,14 @@ export interface RoutineBlock {
   benefits: string[];
 }
 
+// Cursor pages: pass next_cursor back as `cursor` while has_more is true
+export interface CursorPagination {
+  limit: number;
+  next_cursor: string | null;
+  has_more: boolean;
+  total?: number | null;
+}
+
 class ApiClient {
   private baseURL: string;
 
@@ -219,13 +227,13 @@ class ApiClient {
     });
   }
 
-  async getRoutineHistory(page = 1, limit = 20): Promise<ApiResponse<{
+  async getRoutineHistory(cursor?: string, limit = 20): Promise<ApiResponse<{
     routines: Routine[];
-    total: number;
-    page: number;
-    pages: number;
+    pagination: CursorPagination;
   }>> {
-    return this.request(`/api/routine/history?page=${page}&limit=${limit}`);
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    return this.request(`/api/routine/history?${params}`);
   }
 
   // Progress endpoints
@@ -267,13 +275,14 @@ class ApiClient {
   }
 
   // Admin endpoints
-  async getUsers(page = 1, limit = 50): Promise<ApiResponse<{
+  async getUsers(cursor?: string, limit = 50, includeTotal = false): Promise<ApiResponse<{
     users: User[];
-    total: number;
-    page: number;
-    pages: number;
+    pagination: CursorPagination;
   }>> {
-    return this.request(`/api/admin/users?page=${page}&limit=${limit}`);
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    if (includeTotal) params.set('include_total', 'true');
+    return this.request(`/api/admin/users?${params}`);
   }
 
   async getUser(userId: string): Promise<ApiResponse<User>> {